@@ -6,12 +6,16 @@ import gc
 from datetime import datetime
 import hashlib
 import random
+import numpy as np
 
-from .database.utils import create_database_if_not_exists, create_tables_if_not_exists
+from .database.utils import create_database_if_not_exists, create_tables_if_not_exists, bump_data_version
+from .database.analysis_cache import analysis_cache
 from .database.raw_data_selector import RawDataSelector
 from .database.node_metrics_selector import NodeMetricsSelector
 from .database.entity_metrics_selector import EntityMetricsSelector
+from .database.country_metrics_selector import CountryMetricsSelector
 from .data_transform.entity_clusters import EntityClusters
+from .data_transform.node_countries import NodeCountries
 from .calculations.coefficients import Coefficients
 from .charts.chart_generator import BaseChartGenerator, LorenzCurveChartGenerator
 
@@ -80,6 +84,9 @@ def generateCoefficientCharts(
         coefficientTypes=["Gini", "HHI", "Theil", "Normalized Theil", "Shannon Entropy", "Normalized Shannon Entropy", "Nakamoto", 
                         "Top 10 Percent Control Percentage", "Top 10 Percent Control Sum"]
     ):
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     dateMask = '20XX-XX-01'
     
     # Chart variations
@@ -95,23 +102,22 @@ def generateCoefficientCharts(
     )
 
     for subjectOfAnalysis in subjectsOfAnalysis:
-        for metricType in metricTypes:
-
 
-            # Get Metrics Data Selector
-            metricsDataSelector = None
-            if(subjectOfAnalysis == "Nodes"):
-                metricsDataSelector = NodeMetricsSelector()
-            elif(subjectOfAnalysis == "Entities"):
-                metricsDataSelector = EntityMetricsSelector()
+        # Get Metrics Data Selector
+        metricsDataSelector = None
+        if(subjectOfAnalysis == "Nodes"):
+            metricsDataSelector = NodeMetricsSelector()
+        elif(subjectOfAnalysis == "Entities"):
+            metricsDataSelector = EntityMetricsSelector()
+        elif(subjectOfAnalysis == "Countries"):
+            metricsDataSelector = CountryMetricsSelector()
 
+        # Get Metrics Data (capacities and channel counts are read in one scan)
+        capacityData, channelCountData = metricsDataSelector.get_capacity_and_channel_count_metrics(firstBlocksOfMoths)
+        verticesAspectDataByMetricType = {"weighted degree": capacityData, "degree": channelCountData}
 
-            # Get Metrics Data
-            verticesAspectData = None
-            if(metricType == "weighted degree"):
-                verticesAspectData = metricsDataSelector.get_capacity_metrics(firstBlocksOfMoths)
-            elif(metricType == "degree"):
-                verticesAspectData = metricsDataSelector.get_channel_count_metrics(firstBlocksOfMoths)
+        for metricType in metricTypes:
+            verticesAspectData = verticesAspectDataByMetricType[metricType]
 
 
             # Save Metrics Data to File
@@ -120,10 +126,13 @@ def generateCoefficientCharts(
             print(f"[*] Saved: {filePath}")
 
 
+            # Calculate all coefficients with one sort per block height
+            coefficientsDataByType = Coefficients().calculate_all(verticesAspectData, [coefficientType.replace(" ", "") for coefficientType in coefficientTypes])
+
             for coefficientType in coefficientTypes:
 
-                # Calculate Coefficient
-                coefficientsData = Coefficients().calculate_on_vertices_data(verticesAspectData, coefficientType.replace(" ", ""))
+                # Save Coefficient
+                coefficientsData = coefficientsDataByType[coefficientType.replace(" ", "")]
                 filePath = f'/DATA/GENERATED/{subjectOfAnalysis}/{metricType.replace(" ", "_")}/{coefficientType.replace(" ", "_")}/{dateMask}.json'
                 coefficientsData.save_to_file(filePath)
                 print(f"[*] Saved: {filePath}")
@@ -182,6 +191,9 @@ def generateCoefficientCharts(
 
 
 def generateOverlappingCoefficientCharts():
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     dateMask = '20XX-XX-01'
     
     # Chart variations
@@ -204,6 +216,10 @@ def generateOverlappingCoefficientCharts():
         startSince='2018-02-01', endUntil=datetime.now().strftime('%Y-%m-%d'), dateMask=dateMask
     )
 
+    # Get Metrics Data (capacities and channel counts are read in one scan)
+    nodesCapacityData, nodesChannelCountData = NodeMetricsSelector().get_capacity_and_channel_count_metrics(firstBlocksOfMoths)
+    entitiesCapacityData, entitiesChannelCountData = EntityMetricsSelector().get_capacity_and_channel_count_metrics(firstBlocksOfMoths)
+
     for metricType in metricTypes:
 
 
@@ -211,18 +227,23 @@ def generateOverlappingCoefficientCharts():
         verticesAspectDataNodes = None
         verticesAspectDataEntities = None
         if(metricType == "weighted degree"):
-            verticesAspectDataNodes = NodeMetricsSelector().get_capacity_metrics(firstBlocksOfMoths)
-            verticesAspectDataEntities = EntityMetricsSelector().get_capacity_metrics(firstBlocksOfMoths)
+            verticesAspectDataNodes = nodesCapacityData
+            verticesAspectDataEntities = entitiesCapacityData
         elif(metricType == "degree"):
-            verticesAspectDataNodes = NodeMetricsSelector().get_channel_count_metrics(firstBlocksOfMoths)
-            verticesAspectDataEntities = EntityMetricsSelector().get_channel_count_metrics(firstBlocksOfMoths)
+            verticesAspectDataNodes = nodesChannelCountData
+            verticesAspectDataEntities = entitiesChannelCountData
+
 
+        # Calculate all coefficients with one sort per block height
+        coefficientNames = [coefficientType.replace(" ", "") for coefficientType in coefficientTypes]
+        coefficientsDataByTypeEntities = Coefficients().calculate_all(verticesAspectDataEntities, coefficientNames)
+        coefficientsDataByTypeNodes = Coefficients().calculate_all(verticesAspectDataNodes, coefficientNames)
 
         for coefficientType in coefficientTypes:
 
-            # Calculate Coefficient
-            coefficientsDataEntities = Coefficients().calculate_on_vertices_data(verticesAspectDataEntities, coefficientType.replace(" ", ""))
-            coefficientsDataNodes = Coefficients().calculate_on_vertices_data(verticesAspectDataNodes, coefficientType.replace(" ", ""))
+            # Get Coefficient
+            coefficientsDataEntities = coefficientsDataByTypeEntities[coefficientType.replace(" ", "")]
+            coefficientsDataNodes = coefficientsDataByTypeNodes[coefficientType.replace(" ", "")]
 
 
             # Chart Generation
@@ -287,6 +308,9 @@ def generateOverlappingCoefficientCharts():
 
 
 def generateCoefficientsOnSingleChart():
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     dateMask = '20XX-XX-01'
 
     # Chart variations
@@ -308,29 +332,30 @@ def generateCoefficientsOnSingleChart():
     )
 
     for subjectOfAnalysis in subjectsOfAnalysis:
-        for metricType in metricTypes:
 
-            # Get Metrics Data Selector
-            metricsDataSelector = None
-            if(subjectOfAnalysis == "Nodes"):
-                metricsDataSelector = NodeMetricsSelector()
-            elif(subjectOfAnalysis == "Entities"):
-                metricsDataSelector = EntityMetricsSelector()
+        # Get Metrics Data Selector
+        metricsDataSelector = None
+        if(subjectOfAnalysis == "Nodes"):
+            metricsDataSelector = NodeMetricsSelector()
+        elif(subjectOfAnalysis == "Entities"):
+            metricsDataSelector = EntityMetricsSelector()
+        elif(subjectOfAnalysis == "Countries"):
+            metricsDataSelector = CountryMetricsSelector()
 
+        # Get Metrics Data (capacities and channel counts are read in one scan)
+        capacityData, channelCountData = metricsDataSelector.get_capacity_and_channel_count_metrics(firstBlocksOfMoths)
+        verticesAspectDataByMetricType = {"weighted degree": capacityData, "degree": channelCountData}
 
-            # Get Metrics Data
-            verticesAspectData = None
-            if(metricType == "weighted degree"):
-                verticesAspectData = metricsDataSelector.get_capacity_metrics(firstBlocksOfMoths)
-            elif(metricType == "degree"):
-                verticesAspectData = metricsDataSelector.get_channel_count_metrics(firstBlocksOfMoths)
+        for metricType in metricTypes:
+            verticesAspectData = verticesAspectDataByMetricType[metricType]
 
 
             # Calculate Coefficients
-            giniCoefData = Coefficients().calculate_on_vertices_data(verticesAspectData, "Gini")
-            hhiCoefData = Coefficients().calculate_on_vertices_data(verticesAspectData, "HHI")
-            normalizedTheilCoefData = Coefficients().calculate_on_vertices_data(verticesAspectData, "NormalizedTheil")
-            normalizedShannonEntropyCoefData = Coefficients().calculate_on_vertices_data(verticesAspectData, "NormalizedShannonEntropy")
+            coefficientsDataByType = Coefficients().calculate_all(verticesAspectData, ["Gini", "HHI", "NormalizedTheil", "NormalizedShannonEntropy"])
+            giniCoefData = coefficientsDataByType["Gini"]
+            hhiCoefData = coefficientsDataByType["HHI"]
+            normalizedTheilCoefData = coefficientsDataByType["NormalizedTheil"]
+            normalizedShannonEntropyCoefData = coefficientsDataByType["NormalizedShannonEntropy"]
 
 
             # Chart Generation
@@ -446,6 +471,9 @@ def calculate_gini_from_lorenz(percentiles, cumulative_percentages):
 
 
 def generateLorenzCharts():
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     # dateMasks = ['20XX-03-01', '20XX-06-01', '20XX-09-01', '20XX-12-01']
     dateMasks = ['20XX-03-01']
 
@@ -468,22 +496,22 @@ def generateLorenzCharts():
 
 
         for subjectOfAnalysis in subjectsOfAnalysis:
-            for metricType in metricTypes:
 
-                # Get Metrics Data Selector
-                metricsDataSelector = None
-                if(subjectOfAnalysis == "Nodes"):
-                    metricsDataSelector = NodeMetricsSelector()
-                elif(subjectOfAnalysis == "Entities"):
-                    metricsDataSelector = EntityMetricsSelector()
+            # Get Metrics Data Selector
+            metricsDataSelector = None
+            if(subjectOfAnalysis == "Nodes"):
+                metricsDataSelector = NodeMetricsSelector()
+            elif(subjectOfAnalysis == "Entities"):
+                metricsDataSelector = EntityMetricsSelector()
+            elif(subjectOfAnalysis == "Countries"):
+                metricsDataSelector = CountryMetricsSelector()
 
+            # Get Metrics Data (capacities and channel counts are read in one scan)
+            capacityData, channelCountData = metricsDataSelector.get_capacity_and_channel_count_metrics(blockHeightsData)
+            verticesAspectDataByMetricType = {"weighted degree": capacityData, "degree": channelCountData}
 
-                # Get Metrics Data
-                verticesAspectData = None
-                if(metricType == "weighted degree"):
-                    verticesAspectData = metricsDataSelector.get_capacity_metrics(blockHeightsData)
-                elif(metricType == "degree"):
-                    verticesAspectData = metricsDataSelector.get_channel_count_metrics(blockHeightsData)
+            for metricType in metricTypes:
+                verticesAspectData = verticesAspectDataByMetricType[metricType]
 
 
 
@@ -507,25 +535,20 @@ def generateLorenzCharts():
                 # Prepare datasets for Lorenz curves
                 datasets = []
                 timestampID = 0
-                for blockHeight in verticesAspectData.data:
+                for blockHeight, date, _, values in verticesAspectData.iter_value_arrays():
                     timestampID += 1
-                    date = verticesAspectData.data[blockHeight].date
 
                     print(blockHeight)
-                    nodesmetricsData = verticesAspectData.data[blockHeight].vertices
 
-                    # Sort the data based on the 'value' field
-                    sorted_data = sorted(nodesmetricsData, key=lambda x: x.value)
-
-                    # Calculate cumulative sum of the 'value' field
-                    cumulative_sum = [sum(item.value for item in sorted_data[:i+1]) for i in range(len(sorted_data))]
+                    # Sort the values and calculate their cumulative sum
+                    cumulative_sum = np.cumsum(np.sort(values))
 
                     # Normalize cumulative sum to get cumulative percentage
                     total = cumulative_sum[-1]
-                    cumulative_percentages = [x / total * 100 for x in cumulative_sum]
+                    cumulative_percentages = (cumulative_sum / total * 100).tolist()
 
                     # Calculate percentiles
-                    percentiles = [(i + 1) / len(sorted_data) * 100 for i in range(len(sorted_data))]
+                    percentiles = (np.arange(1, len(values) + 1) / len(values) * 100).tolist()
 
                     giniCoefficient = round(coefficientsData.data[blockHeight].value, 3)
                     datasets.append({
@@ -628,6 +651,9 @@ def generateExampleLorenzCharts():
 
 
 def generateGeneralStatisticsCharts():
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     dateMask = '20XX-XX-01'
 
     # Chart variations
@@ -643,8 +669,7 @@ def generateGeneralStatisticsCharts():
 
 
     # Get Metrics Data (Weighted Degree)
-    vertices_capacity_data =        NodeMetricsSelector().get_capacity_metrics(firstBlocksOfMoths)
-    vertices_channel_count_data =   NodeMetricsSelector().get_channel_count_metrics(firstBlocksOfMoths)
+    vertices_capacity_data, vertices_channel_count_data = NodeMetricsSelector().get_capacity_and_channel_count_metrics(firstBlocksOfMoths)
 
     # Calculate General Stats
     from .calculations.general_stats import GeneralStats
@@ -797,6 +822,9 @@ def compare_data_sources():
 
 
 def generateCSV_EntityMetrics(dateMasks):
+    # Cached analysis results of this run belong to the data version read here
+    analysis_cache.begin_run()
+
     for dateMask in dateMasks:
 
         # Get Block Heights for the date mask
@@ -806,14 +834,16 @@ def generateCSV_EntityMetrics(dateMasks):
             endUntil=datetime.now().strftime('%Y-%m-%d')
         )
 
+        capacityData, channelCountData = EntityMetricsSelector().get_capacity_and_channel_count_metrics(blockHeightsStructure)
+
         # Calculate Entity capacity metrics and save to CSV
-        EntityMetricsSelector().get_capacity_metrics(blockHeightsStructure).save_to_csv(
+        capacityData.save_to_csv(
             filePath=f'/DATA/GENERATED/Entities/weighted_degree/DATA_CSV/EntityCapacityDate_{dateMask}.csv',
             divideValueBy=100000000.0
         )
 
         # Calculate Entity channel count metrics and save to CSV
-        EntityMetricsSelector().get_channel_count_metrics(blockHeightsStructure).save_to_csv(
+        channelCountData.save_to_csv(
             filePath=f'/DATA/GENERATED/Entities/degree/DATA_CSV/EntityChannelCountDate_{dateMask}.csv',
         )
 
@@ -853,27 +883,43 @@ def synchronizeBlockchain():
         electrum_port=int(os.getenv('BLNSTATS_ELECTRUM_PORT', 50001))
     ).sync_blocks()
 
+    # Cached analysis results were built from the previous blocks and transactions
+    bump_data_version()
+
 
 
 
 
 
-def importLNDDBReader(file_path):
+def importLNDDBReader(file_path=None, full_import=False):
     from .data_import.lnd_dbreader import LNDDBReader
     
-    # Import LND DBReader data
-    LNDDBReader(file_path)
+    # Import LND DBReader data from the given path(s) or from all configured LND-DBReader-Source-N settings
+    # (only the delta against the previous snapshot unless full_import is set)
+    lndDBReader = LNDDBReader(file_path, full_import=full_import)
 
-    # Import node aliases to main table
+    # Import node aliases to main table (only the announcements changed since the previous import)
     entityObj = EntityClusters()
     entityObj.import_node_aliases_to_main_table(
         from_table_name='_LND_DBReader_NodeAnnouncements',
         from_alias_column='Alias',
         from_node_id_column='NodeID',
-        from_timestamp_column='LastSeen'
+        from_timestamp_column='LastSeen',
+        full_import=full_import
     )
-    entityObj.import_new_entities_to_main_table()
-    entityObj.fix_entity_hex_names_if_possible()
+
+    # Cluster nodes into entities, refreshing only the nodes touched by the import (None means all nodes)
+    touchedNodeIDs = lndDBReader.touched_node_ids
+    if(touchedNodeIDs is not None and len(touchedNodeIDs) == 0):
+        print("[*] No alias, address or channel changes since the previous snapshot, skipping entity refresh")
+    else:
+        entityObj.cluster_entities(node_ids=touchedNodeIDs)
+
+    # Geolocate newly seen node addresses
+    NodeCountries().refresh()
+
+    # Cached analysis results were built from the previous channels, aliases and entities
+    bump_data_version()
 
 
 
@@ -892,15 +938,28 @@ def importLNResearchData():
         from_node_id_column='NodeID',
         from_timestamp_column='LastSeen'
     )
-    entityObj.import_new_entities_to_main_table()
-    entityObj.fix_entity_hex_names_if_possible()
+
+    # Cluster nodes into entities
+    entityObj.cluster_entities()
+
+    # Geolocate newly seen node addresses
+    NodeCountries().refresh()
+
+    # Cached analysis results were built from the previous channels, aliases and entities
+    bump_data_version()
 
 
 
 
-def transformNodeMetrics():
+def transformNodeMetrics(resolution=None, full=False):
     from .data_transform.node_metrics import NodeMetrics
     nodeMetrics = NodeMetrics()
     
-    # Transform all months first blocks
-    nodeMetrics.transformForFirstBlocksOfMonths()
+    # Transform the first blocks of all months, weeks or days (BLNSTATS_NODE_METRICS_RESOLUTION, monthly by default),
+    # only recomputing checkpoints affected by imports since the previous run unless full is set
+    nodeMetrics.transformForResolution(resolution, full=full)
+
+    # Aggregate the node metrics of every cached block height into entity metrics,
+    # only recomputing block heights whose node metrics or entity mapping changed
+    from .data_transform.entity_metrics import EntityMetrics
+    EntityMetrics().refresh()
@@ -30,6 +30,11 @@ class Coefficients:
     or channel counts and returns the corresponding coefficient value.
     """
 
+    COEFFICIENT_TYPES = [
+        "Gini", "HHI", "Theil", "NormalizedTheil", "ShannonEntropy", "NormalizedShannonEntropy",
+        "Nakamoto", "Top10PercentControlPercentage", "Top10PercentControlSum"
+    ]
+
 
 
     def calculate_gini(self, data: list) -> float:
@@ -67,7 +72,7 @@ class Coefficients:
         :param data: List[int] - Array of non-negative integer values representing nodes/entities capacities or channel counts
         :return: float - HHI value (0.0 - Decentralized, 10000.0 - Centralized)
         """
-        total = sum(data)
+        total = np.sum(data)
         if total == 0:
             return 0.0
 
@@ -89,7 +94,7 @@ class Coefficients:
         :return: float - Theil Index value (0.0 - Decentralized, Higher Value - More Centralized)
         """
         n = len(data)
-        total = sum(data)
+        total = np.sum(data)
         if n == 0 or total == 0:
             return 0.0
 
@@ -142,7 +147,7 @@ class Coefficients:
         :param data: List[int] - Array of non-negative integer values representing nodes/entities capacities or channel counts
         :return: float - Shannon Entropy value (0.0 - Centralized, Higher Value - More Decentralized)
         """
-        total = sum(data)
+        total = np.sum(data)
         if total == 0:
             return 0.0
 
@@ -248,6 +253,63 @@ class Coefficients:
 
 
 
+    def calculate_all_coefficients(self, data) -> dict:
+        """
+        Calculate all coefficients of COEFFICIENT_TYPES for the given data with a single sort.
+
+        The shares, the descending cumulative sum and the logarithms of the shares are computed once and
+        shared by all coefficients; the results equal those of the individual calculate_* methods.
+
+        :param data: List[int] - Array of non-negative integer values representing nodes/entities capacities or channel counts
+        :return: dict - {coefficient_type: coefficient value}
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if np.any(data < 0):
+            raise ValueError("All data values must be non-negative.")
+
+        n = len(data)
+        sorted_data = np.sort(data)
+        descending_data = sorted_data[::-1]
+        total = np.sum(sorted_data)
+        ten_percent_index = int(0.1 * n)
+        top_10_percent_sum = np.sum(descending_data[:ten_percent_index])
+
+        coefficients = {
+            "Gini": 0.0,
+            "HHI": 0.0,
+            "Theil": 0.0,
+            "NormalizedTheil": 0.0,
+            "ShannonEntropy": 0.0,
+            "NormalizedShannonEntropy": 0.0,
+            "Nakamoto": 0,
+            "Top10PercentControlPercentage": top_10_percent_sum / total if n > 0 and total > 0 else np.float64(np.nan),
+            "Top10PercentControlSum": top_10_percent_sum
+        }
+        if n == 0 or total == 0:
+            return coefficients
+
+        index = np.arange(1, n + 1)
+        coefficients["Gini"] = np.sum((2 * index - n - 1) * sorted_data) / (n * total)
+
+        shares = sorted_data / total
+        coefficients["HHI"] = np.sum(shares ** 2) * 10000
+
+        # Exclude zero shares to avoid log(0)
+        positive_shares = shares[shares > 0]
+        log_shares = np.log(positive_shares)
+        coefficients["Theil"] = np.sum(positive_shares * (log_shares + math.log(n)))
+        coefficients["ShannonEntropy"] = -np.sum(positive_shares * log_shares) / math.log(2)
+        if n > 1:
+            coefficients["NormalizedTheil"] = coefficients["Theil"] / self.calculate_max_theil_index(n)
+            coefficients["NormalizedShannonEntropy"] = coefficients["ShannonEntropy"] / self.calculate_max_shannon_entropy(n)
+
+        # Smallest number of nodes that cumulatively have more than 51% share
+        cumulative_share = np.cumsum(descending_data) / total
+        coefficients["Nakamoto"] = np.searchsorted(cumulative_share, 0.51) + 1
+        return coefficients
+
+
+
     def calculate_coefficient(self, values: list, coefficient_type: str) -> float:
         """
         Calculate the coefficient for the given values and coefficient type.
@@ -284,7 +346,7 @@ class Coefficients:
         """
         Calculate the Gini Coefficient for the given vertices aspect data and return it in coefficients structure.
 
-        :param vertices_data: VerticesAspectDataStructure - Data structure containing node capacities or channel counts
+        :param vertices_data: VerticesAspectDataStructure or CompactVerticesAspectDataStructure - Data structure containing node capacities or channel counts
         :param coefficient_type: str - Type of coefficient to calculate
         :return: CoefficientsDataStructure - Structure containing coefficient values for each block height
         """
@@ -292,26 +354,190 @@ class Coefficients:
 
         # Calculate the coefficient for each block height
         coefficient_data = {}
-        for block_height, vertice_entry in vertices_data.data.items():
-            date = vertice_entry.date
-            timestamp = vertice_entry.timestamp
-            values = [vertice.value for vertice in vertice_entry.vertices]
+        for block_height, date, timestamp, values in vertices_data.iter_value_arrays():
             coefficient_value = self.calculate_coefficient(values, coefficient_type)
             coefficient_data[block_height] = {
                 "value": coefficient_value,
                 "date": date,
-                "timestamp": timestamp
+                "timestamp": timestamp,
+                "input_array_length": len(values),
+                "input_array_sum": int(values.sum())
             }
 
+        return self.__to_coefficients_structure(vertices_data, coefficient_type, coefficient_data)
+
+
+
+
+    def calculate_all(self, vertices_data: VerticesAspectDataStructure, coefficient_types: list = None, segmented: bool = True) -> dict:
+        """
+        Calculate several coefficients for the given vertices aspect data at once.
+
+        By default the values of all block heights are concatenated and every coefficient of every block height is
+        computed with a few segmented NumPy operations (see calculate_all_coefficients_segmented). With segmented=False
+        the block heights are processed one by one, sorting each once (see calculate_all_coefficients).
+
+        :param vertices_data: VerticesAspectDataStructure or CompactVerticesAspectDataStructure - Data structure containing node capacities or channel counts
+        :param coefficient_types: List[str] - Types of coefficients to calculate (all of COEFFICIENT_TYPES if None)
+        :param segmented: bool - Whether to compute all block heights together
+        :return: dict - {coefficient_type: CoefficientsDataStructure}
+        """
+        if coefficient_types is None:
+            coefficient_types = self.COEFFICIENT_TYPES
+        for coefficient_type in coefficient_types:
+            if coefficient_type not in self.COEFFICIENT_TYPES:
+                raise ValueError(f"Invalid coefficient type: {coefficient_type}")
+
+        snapshots = list(vertices_data.iter_value_arrays())
+        lengths = np.array([len(values) for _, _, _, values in snapshots], dtype=np.int64)
+        if segmented:
+            all_values = np.concatenate([values for _, _, _, values in snapshots]) if len(snapshots) > 0 else np.zeros(0, dtype=np.int64)
+            coefficient_arrays = self.calculate_all_coefficients_segmented(all_values, lengths)
+            coefficient_values = [
+                {coefficient_type: coefficient_arrays[coefficient_type][i] for coefficient_type in coefficient_types}
+                for i in range(len(snapshots))
+            ]
+            input_array_sums = coefficient_arrays["InputArraySum"].tolist()
+        else:
+            coefficient_values = [self.calculate_all_coefficients(values) for _, _, _, values in snapshots]
+            input_array_sums = [int(values.sum()) for _, _, _, values in snapshots]
+
+        coefficient_data = {coefficient_type: {} for coefficient_type in coefficient_types}
+        for i, (block_height, date, timestamp, _) in enumerate(snapshots):
+            for coefficient_type in coefficient_types:
+                coefficient_data[coefficient_type][block_height] = {
+                    "value": coefficient_values[i][coefficient_type],
+                    "date": date,
+                    "timestamp": timestamp,
+                    "input_array_length": int(lengths[i]),
+                    "input_array_sum": input_array_sums[i]
+                }
+
+        return {
+            coefficient_type: self.__to_coefficients_structure(vertices_data, coefficient_type, coefficient_data[coefficient_type])
+            for coefficient_type in coefficient_types
+        }
+
+
+
+
+    @staticmethod
+    def __segment_sums(values, starts, lengths):
+        """
+        Sums of consecutive segments of values; empty segments sum to 0.
+
+        np.add.reduceat does not handle empty segments (it returns the element at the segment start),
+        so it is applied to the non-empty segments only.
+        """
+        sums = np.zeros(len(lengths), dtype=values.dtype)
+        non_empty = lengths > 0
+        if np.any(non_empty):
+            sums[non_empty] = np.add.reduceat(values, starts[non_empty])
+        return sums
+
 
 
+
+    def calculate_all_coefficients_segmented(self, data, lengths) -> dict:
+        """
+        Calculate all coefficients of COEFFICIENT_TYPES for many snapshots at once.
+
+        The snapshots are concatenated into one array and described by their lengths. Every snapshot is sorted in
+        place within the array, segment sums are taken with np.add.reduceat and cumulative sums within the
+        snapshots are one cumulative sum minus the sum before every snapshot. Sums and cumulative sums are taken
+        on the integer values, so they are exact. Empty snapshots and snapshots summing to 0 get the same values
+        as calculate_all_coefficients.
+
+        :param data: np.ndarray(int) - Non-negative integer values of all snapshots, concatenated
+        :param lengths: np.ndarray(int) - Number of values of every snapshot
+        :return: dict - {coefficient_type: np.ndarray with the value of every snapshot}, plus "InputArraySum"
+        """
+        sorted_data = np.array(data, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if np.any(sorted_data < 0):
+            raise ValueError("All data values must be non-negative.")
+        if np.sum(lengths) != len(sorted_data):
+            raise ValueError("Snapshot lengths must add up to the number of data values.")
+
+        snapshot_count = len(lengths)
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+
+        # Segmented sort: every snapshot is sorted in place (ascending)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            sorted_data[start:end].sort()
+
+        totals = self.__segment_sums(sorted_data, starts, lengths)
+        valid = (lengths > 0) & (totals > 0)
+        safe_totals = np.where(valid, totals, 1).astype(np.float64)
+        safe_lengths = np.maximum(lengths, 1)
+
+        # Gini from the ascending ranks: sum((2 * rank - n - 1) * x) / (n * total) = (2 * sum(rank * x) / total - n - 1) / n
+        ranks = np.arange(1, len(sorted_data) + 1, dtype=np.int64) - np.repeat(starts, lengths)
+        ranked_sums = self.__segment_sums(ranks * sorted_data.astype(np.float64), starts, lengths)
+        gini = (2 * ranked_sums / safe_totals - lengths - 1) / safe_lengths
+
+        # Shares and their logarithms (zero shares contribute nothing)
+        shares = sorted_data / np.repeat(safe_totals, lengths)
+        share_sums = self.__segment_sums(shares, starts, lengths)
+        hhi = self.__segment_sums(shares ** 2, starts, lengths) * 10000
+        share_log_sums = self.__segment_sums(shares * np.log(np.where(shares > 0, shares, 1.0)), starts, lengths)
+        log_lengths = np.log(safe_lengths)
+        theil = share_log_sums + log_lengths * share_sums
+        shannon_entropy = -share_log_sums / math.log(2)
+        normalized_theil = np.where(lengths > 1, theil / np.where(lengths > 1, log_lengths, 1.0), 0.0)
+        normalized_shannon_entropy = np.where(lengths > 1, shannon_entropy / np.where(lengths > 1, log_lengths / math.log(2), 1.0), 0.0)
+
+        # Segmented cumulative sum: the sum of the values from every position to the end of its snapshot is the
+        # cumulative sum of the descending values up to that value
+        cumulative = np.cumsum(sorted_data)
+        descending_cumulative = np.repeat(cumulative[ends - 1] if len(sorted_data) > 0 else np.zeros(snapshot_count, dtype=np.int64), lengths)
+        descending_cumulative -= cumulative
+        descending_cumulative += sorted_data
+
+        # Nakamoto: values whose descending cumulative share is below 51%, plus one (np.searchsorted(cumulative_share, 0.51) + 1 of every snapshot)
+        below_majority = (descending_cumulative / np.repeat(safe_totals, lengths)) < 0.51
+        nakamoto = self.__segment_sums(below_majority.astype(np.int64), starts, lengths) + 1
+
+        # Top 10%: descending cumulative sum of the first int(0.1 * n) values
+        ten_percent_counts = (0.1 * lengths).astype(np.int64)
+        has_top = ten_percent_counts > 0
+        top_10_percent_sums = np.zeros(snapshot_count, dtype=np.int64)
+        top_10_percent_sums[has_top] = descending_cumulative[ends[has_top] - ten_percent_counts[has_top]]
+
+        return {
+            "Gini": np.where(valid, gini, 0.0),
+            "HHI": np.where(valid, hhi, 0.0),
+            "Theil": np.where(valid, theil, 0.0),
+            "NormalizedTheil": np.where(valid, normalized_theil, 0.0),
+            "ShannonEntropy": np.where(valid, shannon_entropy, 0.0),
+            "NormalizedShannonEntropy": np.where(valid, normalized_shannon_entropy, 0.0),
+            "Nakamoto": np.where(valid, nakamoto, 0),
+            "Top10PercentControlPercentage": np.where(valid, top_10_percent_sums / safe_totals, np.nan),
+            "Top10PercentControlSum": top_10_percent_sums.astype(np.float64),
+            "InputArraySum": totals
+        }
+
+
+
+
+    def __to_coefficients_structure(self, vertices_data, coefficient_type: str, coefficient_data: dict) -> CoefficientsDataStructure:
+        """
+        Wraps the coefficient values of every block height into a coefficients structure with metadata describing the input.
+
+        :param vertices_data: VerticesAspectDataStructure or CompactVerticesAspectDataStructure - Input of the calculation
+        :param coefficient_type: str - Type of the calculated coefficient
+        :param coefficient_data: dict - {block_height: {"value", "date", "timestamp", "input_array_length", "input_array_sum"}}
+        :return: CoefficientsDataStructure
+        """
         # Formulate the description of the data for the meta section
         input_y_axis = vertices_data.meta.yAxis.split("(")[1].split(")")[0]
         input_subject, input_metric = input_y_axis.split(",")
 
         SUBJECT_MAPPING = {
             "NodeID": "nodes",
-            "EntityName": "entities"
+            "EntityName": "entities",
+            "CountryCode": "countries"
         }
         METRIC_MAPPING = {
             "Capacity": "capacities",
@@ -343,8 +569,8 @@ class Coefficients:
                 value=coefficient_data[block_height]["value"],
                 date=coefficient_data[block_height]["date"],
                 timestamp=coefficient_data[block_height]["timestamp"],
-                input_array_length=len(vertices_data.data[block_height].vertices),
-                input_array_sum=sum([vertice.value for vertice in vertices_data.data[block_height].vertices])
+                input_array_length=coefficient_data[block_height]["input_array_length"],
+                input_array_sum=coefficient_data[block_height]["input_array_sum"]
             ) for block_height in coefficient_data.keys()}
         )
 
@@ -15,37 +15,39 @@ class GeneralStats:
             raise ValueError("VerticesCapacityDataStructure must have a yAxis of 'List(NodeID,Capacity)'")
         if(vertices_channel_count_data.meta.yAxis != "List(NodeID,ChannelCount)"):
             raise ValueError("VerticesChannelCountDataStructure must have a yAxis of 'List(NodeID,ChannelCount)'")
-        if(len(vertices_capacity_data.data.values()) != len(vertices_channel_count_data.data.values())):
+
+        # Work on the value arrays (a CompactVerticesAspectDataStructure is not converted to its pydantic form)
+        capacity_arrays = list(vertices_capacity_data.iter_value_arrays())
+        channel_count_arrays = list(vertices_channel_count_data.iter_value_arrays())
+
+        if(len(capacity_arrays) != len(channel_count_arrays)):
             raise ValueError("VerticesCapacityDataStructure and VerticesChannelCountDataStructure must have the same length")
-        if(list(vertices_capacity_data.data.keys())[0] != list(vertices_channel_count_data.data.keys())[0]):
+        if(capacity_arrays[0][0] != channel_count_arrays[0][0]):
             raise ValueError("VerticesCapacityDataStructure and VerticesChannelCountDataStructure must start with the same block height")
-        if(list(vertices_capacity_data.data.keys())[-1] != list(vertices_channel_count_data.data.keys())[-1]):
+        if(capacity_arrays[-1][0] != channel_count_arrays[-1][0]):
             raise ValueError("VerticesCapacityDataStructure and VerticesChannelCountDataStructure must end with the same block height")
 
-
         # Get block height data
-        block_height_data = [block_height for block_height, vertices in vertices_capacity_data.data.items()]
+        block_height_data = [block_height for block_height, _, _, _ in capacity_arrays]
 
         # Get date for each block height
-        date_data = [item.date for item in vertices_capacity_data.data.values()]
+        date_data = [date for _, date, _, _ in capacity_arrays]
 
         # Get timestamp for each block height
-        timestamp_data = [item.timestamp for item in vertices_capacity_data.data.values()]
+        timestamp_data = [timestamp for _, _, timestamp, _ in capacity_arrays]
 
         # Get the node count for each block height
-        node_count_data = [len(item.vertices) for item in vertices_capacity_data.data.values()]
+        node_count_data = [len(values) for _, _, _, values in capacity_arrays]
 
         # Get the node capacity sum for each block height:
         #   - For a general sum of capacities we need to divide by 2 because each 
         #     channel is counted twice (one for each node)
-        node_capacity_sum_data = [sum(vertice.value / (2 * 100000000) for vertice in vertices_entry.vertices)
-                for vertices_entry in vertices_capacity_data.data.values()]
+        node_capacity_sum_data = [int(values.sum()) / (2 * 100000000) for _, _, _, values in capacity_arrays]
 
         # Get the channel count sum for each block height:
         #   - For a general count of channels we need to divide by 2 because 
         #     each channel is counted twice (one for each node)
-        channel_count_sum_data = [sum(vertice.value / 2 for vertice in vertices_entry.vertices) 
-                for vertices_entry in vertices_channel_count_data.data.values()]
+        channel_count_sum_data = [int(values.sum()) / 2 for _, _, _, values in channel_count_arrays]
         
 
         general_stats_data = GeneralStatsDataStructure(
@@ -4,7 +4,7 @@ import json
 import hashlib
 import time
 from multiprocessing.dummy import Pool as ThreadPool
-from ..database.utils import get_db_connection
+from ..database.utils import get_db_connection, hex_to_binary
 from datetime import datetime
 from dataclasses import dataclass
 from typing import List, Dict
@@ -124,7 +124,7 @@ def retrieve_and_write_blockchain_block(args):
                         Date = VALUES(Date)
                 ''', (
                     height,
-                    block_hash,
+                    hex_to_binary(block_hash),
                     timestamp,
                     human_readable_time,
                     human_readable_date
@@ -171,7 +171,7 @@ class BlockchainBlocks:
                 db_cursor.execute('''
                     CREATE TABLE IF NOT EXISTS `Blockchain_Blocks` (
                         `BlockHeight` INT UNSIGNED NOT NULL UNIQUE,
-                        `BlockHash` CHAR(64) NOT NULL,
+                        `BlockHash` BINARY(32) NOT NULL,
                         `Timestamp` INT UNSIGNED NOT NULL,
                         `Time` DATETIME NOT NULL,
                         `Date` DATE NOT NULL,
@@ -5,7 +5,7 @@ import time
 import logging
 from decimal import Decimal
 from multiprocessing.dummy import Pool as ThreadPool
-from ..database.utils import get_db_connection
+from ..database.utils import get_db_connection, mark_dirty_block_height, hex_to_binary, sync_channel_intervals
 from dataclasses import dataclass
 from typing import List, Dict, Tuple
 
@@ -71,11 +71,11 @@ class BlockchainTransactions:
                 `FundingBlockIndex` INT UNSIGNED NOT NULL,
                 `FundingTxIndex` INT UNSIGNED NOT NULL,
                 `FundingOutputIndex` SMALLINT UNSIGNED NOT NULL,
-                `FundingTxID` CHAR(64) NOT NULL,
-                `FundingScriptHash` CHAR(64) NOT NULL,
+                `FundingTxID` BINARY(32) NOT NULL,
+                `FundingScriptHash` BINARY(32) NOT NULL,
                 `Value` BIGINT UNSIGNED NOT NULL,
                 `SpendingBlockIndex` INT UNSIGNED NOT NULL,
-                `SpendingTxID` CHAR(64) NOT NULL,
+                `SpendingTxID` VARBINARY(32) NOT NULL,
                 `UpdatedDate` DATE NOT NULL,
                 PRIMARY KEY (`ShortChannelID`),
                 INDEX `idx_Funding_SpendingBlockIndex` (`FundingBlockIndex`, `SpendingBlockIndex`),
@@ -450,6 +450,21 @@ class BlockchainTransactions:
                     if spending_block_height and spending_tx_id:
                         logger.info(f"Transaction {blockIndex}:{txIndex}:{outputIndex} ({shortChannelID}) -> SPENT in block {spending_block_height}, tx {spending_tx_id}")
 
+                    # Node metrics are stale from the earliest block whose active channel set this write changes
+                    new_spending_block = int(spending_block_height or 999999999)
+                    db_cursor.execute('''
+                        SELECT FundingBlockIndex, Value, SpendingBlockIndex
+                        FROM Blockchain_Transactions
+                        WHERE ShortChannelID = %s
+                    ''', [shortChannelID])
+                    previous = db_cursor.fetchone()
+                    if previous is None:
+                        mark_dirty_block_height(blockIndex, db_cursor)
+                    elif (int(previous[0]), int(previous[1])) != (int(blockIndex), tx_output_value_satoshis):
+                        mark_dirty_block_height(min(int(previous[0]), int(blockIndex)), db_cursor)
+                    elif int(previous[2]) != new_spending_block:
+                        mark_dirty_block_height(min(int(previous[2]), new_spending_block), db_cursor)
+
                     db_cursor.execute('''
                         INSERT INTO Blockchain_Transactions (
                             ShortChannelID, FundingBlockIndex, FundingTxIndex, FundingOutputIndex,
@@ -470,12 +485,13 @@ class BlockchainTransactions:
                         blockIndex,
                         txIndex,
                         outputIndex,
-                        tx_id,
-                        funding_script_hash,
+                        hex_to_binary(tx_id),
+                        hex_to_binary(funding_script_hash),
                         tx_output_value_satoshis,
-                        spending_block_height or '999999999',
-                        spending_tx_id or ''
+                        new_spending_block,
+                        hex_to_binary(spending_tx_id or '')
                     ])
+                    sync_channel_intervals(db_cursor, shortChannelID)
                     db_conn.commit()
 
             logger.info(f"Transaction {blockIndex}:{txIndex}:{outputIndex} processed successfully")
@@ -1,58 +1,280 @@
 import os
+import hashlib
 import ipaddress
+import numpy as np
+from ..database.utils import get_db_connection
 
 
 
 class IPGeolocation:
-    # https://www.iwik.org/ipcountry/LT.cidr
-    allNetworks = {'IPv4': {}, 'IPv6': {}}
+    '''
+    Country lookup of IP addresses based on per-country CIDR lists (https://www.iwik.org/ipcountry/LT.cidr).
+
+    The CIDR lists (<CC>.cidr for IPv4, <CC>.ipv6 for IPv6) are compiled once into sorted, disjoint start/end
+    integer arrays per address family (nested ranges are split, the most specific one wins) and cached on disk,
+    so every lookup is a binary search.
+    IPv6 ranges are kept at /64 granularity (upper 64 bits of the address), which covers country
+    allocations as they are never longer than /64.
+    '''
+    cidrFolder = os.getenv('BLNSTATS_IPGEO_FOLDER', os.path.join(os.path.dirname(__file__), '..', '..', 'IPGeo'))
+    cacheFileName = '.compiled-ranges.npz'
+
+    # Compiled lookup tables (loaded lazily on first use) and signature of the CIDR files they were compiled from
+    countryCodes = None
+    allRanges = None
+    signature = None
+
+
 
     @staticmethod
-    def loadGeoNetworks():
-        cidrFolder = "./IPGeo/"
-        
-        filenames = next(os.walk(cidrFolder), (None, None, []))[2]
+    def loadGeoNetworks(cidrFolder=None):
+        '''
+        Loads the compiled CIDR ranges, compiling (and caching) them if the source files changed.
+
+        :param cidrFolder: str - Folder with the <CC>.cidr and <CC>.ipv6 files (defaults to BLNSTATS_IPGEO_FOLDER).
+        '''
+        if(cidrFolder is not None):
+            IPGeolocation.cidrFolder = cidrFolder
+
+        filenames = sorted(
+            filename for filename in next(os.walk(IPGeolocation.cidrFolder), (None, None, []))[2]
+            if filename.endswith(".cidr") or filename.endswith(".ipv6")
+        )
+
+        # Signature of the source files, used to invalidate the on-disk cache
+        signature = hashlib.sha256()
         for filename in filenames:
-            
-            if(filename in [".DS_Store"]):
-                continue
+            stat = os.stat(os.path.join(IPGeolocation.cidrFolder, filename))
+            signature.update(f"{filename}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        signature = signature.hexdigest()
+        IPGeolocation.signature = signature
 
-            countryCode = filename.split('.')[0]
+        cachePath = os.path.join(IPGeolocation.cidrFolder, IPGeolocation.cacheFileName)
+        if(os.path.exists(cachePath)):
+            with np.load(cachePath) as cache:
+                if(str(cache['signature']) == signature):
+                    IPGeolocation.countryCodes = cache['countryCodes']
+                    IPGeolocation.allRanges = {
+                        'IPv4': (cache['ipv4Starts'], cache['ipv4Ends'], cache['ipv4Countries']),
+                        'IPv6': (cache['ipv6Starts'], cache['ipv6Ends'], cache['ipv6Countries'])
+                    }
+                    return
+
+        IPGeolocation.__compileNetworks(filenames)
+
+        try:
+            with open(f"{cachePath}_tmp", 'wb') as file:
+                np.savez(
+                    file,
+                    signature=np.array(signature),
+                    countryCodes=IPGeolocation.countryCodes,
+                    ipv4Starts=IPGeolocation.allRanges['IPv4'][0],
+                    ipv4Ends=IPGeolocation.allRanges['IPv4'][1],
+                    ipv4Countries=IPGeolocation.allRanges['IPv4'][2],
+                    ipv6Starts=IPGeolocation.allRanges['IPv6'][0],
+                    ipv6Ends=IPGeolocation.allRanges['IPv6'][1],
+                    ipv6Countries=IPGeolocation.allRanges['IPv6'][2]
+                )
+            os.rename(f"{cachePath}_tmp", cachePath)
+        except OSError:
+            # Read-only folder: keep the compiled ranges in memory only
+            pass
+
+
+
+    @staticmethod
+    def __compileNetworks(filenames):
+        countryCodes = sorted(set(filename.split('.')[0] for filename in filenames))
+        countryIndex = {countryCode: i for i, countryCode in enumerate(countryCodes)}
 
-            addressType = ''
-            if(filename.endswith(".cidr")):
-                addressType = 'IPv4'
-                IPGeolocation.allNetworks['IPv4'][countryCode] = []
-            elif(filename.endswith(".ipv6")):
-                addressType = 'IPv6'
-                IPGeolocation.allNetworks['IPv6'][countryCode] = []
+        collected = {'IPv4': ([], [], []), 'IPv6': ([], [], [])}
+        for filename in filenames:
+            countryCode = filename.split('.')[0]
+            addressType = 'IPv4' if filename.endswith(".cidr") else 'IPv6'
+            starts, ends, countries = collected[addressType]
 
-            with open(f"{cidrFolder}/{filename}", "r") as f:
-                for line in f.readlines():
+            with open(os.path.join(IPGeolocation.cidrFolder, filename), "r") as f:
+                for line in f:
                     line = line.strip()
-                    if(not line.startswith("#")):
-                        if(line != ""):
-                            IPGeolocation.allNetworks[addressType][countryCode].append(line)
+                    if(line == "" or line.startswith("#")):
+                        continue
+
+                    network = ipaddress.ip_network(line, False)
+                    first, last = int(network.network_address), int(network.broadcast_address)
+                    if(addressType == 'IPv6'):
+                        first, last = first >> 64, last >> 64
+                    starts.append(first)
+                    ends.append(last)
+                    countries.append(countryIndex[countryCode])
+
+        IPGeolocation.countryCodes = np.array(countryCodes, dtype=str)
+        IPGeolocation.allRanges = {}
+        for addressType, (starts, ends, countries) in collected.items():
+            starts, ends, countries = IPGeolocation.__flattenRanges(starts, ends, countries)
+            IPGeolocation.allRanges[addressType] = (
+                np.array(starts, dtype=np.uint64),
+                np.array(ends, dtype=np.uint64),
+                np.array(countries, dtype=np.int32)
+            )
+
+
+
+    @staticmethod
+    def __flattenRanges(starts, ends, countries):
+        '''
+        Splits nested and overlapping ranges into disjoint ranges sorted by start, so that a lookup only has to
+        check the last range starting at or before an address. Where ranges overlap, the innermost (most specific)
+        range wins, e.g. a /24 assigned to another country inside a /16.
+
+        :param starts: list - First address of every range
+        :param ends: list - Last address of every range
+        :param countries: list - Country index of every range
+        :return: tuple - (starts, ends, countries) of the disjoint ranges
+        '''
+        flatStarts, flatEnds, flatCountries = [], [], []
+
+        def emit(first, last, country):
+            if(first > last):
+                return
+            # Merge with the previous range if it is adjacent and of the same country
+            if(len(flatEnds) > 0 and flatEnds[-1] + 1 == first and flatCountries[-1] == country):
+                flatEnds[-1] = last
+            else:
+                flatStarts.append(first)
+                flatEnds.append(last)
+                flatCountries.append(country)
+
+        # Outer ranges come before the ranges nested in them; open ranges are kept on a stack, innermost on top
+        stack = []
+        position = 0
+        for i in sorted(range(len(starts)), key=lambda i: (starts[i], -ends[i])):
+            start, end, country = starts[i], ends[i], countries[i]
+            while(len(stack) > 0 and stack[-1][0] < start):
+                openEnd, openCountry = stack.pop()
+                emit(position, openEnd, openCountry)
+                position = max(position, openEnd + 1)
+            if(len(stack) > 0):
+                emit(position, start - 1, stack[-1][1])
+            stack.append((end, country))
+            position = max(position, start)
+
+        while(len(stack) > 0):
+            openEnd, openCountry = stack.pop()
+            emit(position, openEnd, openCountry)
+            position = max(position, openEnd + 1)
+
+        return flatStarts, flatEnds, flatCountries
+
+
+
+    @staticmethod
+    def __ensureLoaded():
+        if(IPGeolocation.allRanges is None):
+            IPGeolocation.loadGeoNetworks()
+
+
+
+    @staticmethod
+    def isAvailable():
+        '''
+        Checks whether any CIDR ranges are available for lookups.
+
+        :return: bool - True if at least one country range is loaded
+        '''
+        IPGeolocation.__ensureLoaded()
+        return len(IPGeolocation.countryCodes) > 0
+
+
+
+    @staticmethod
+    def __lookup(addressType, keys):
+        '''
+        Binary search of address keys in the compiled ranges of one address family.
+
+        :param addressType: str - 'IPv4' or 'IPv6'
+        :param keys: np.ndarray(uint64) - Addresses (IPv6: upper 64 bits)
+        :return: np.ndarray(int32) - Country index per key, -1 if not found
+        '''
+        starts, ends, countries = IPGeolocation.allRanges[addressType]
+        if(len(starts) == 0 or len(keys) == 0):
+            return np.full(len(keys), -1, dtype=np.int32)
+
+        positions = np.searchsorted(starts, keys, side='right') - 1
+        positionsClipped = np.maximum(positions, 0)
+        found = (positions >= 0) & (keys <= ends[positionsClipped])
+        return np.where(found, countries[positionsClipped], -1)
+
+
+
+    @staticmethod
+    def getIPCountries(ipAddresses):
+        '''
+        Resolves the countries of many IP addresses at once.
+
+        :param ipAddresses: list - IP address strings (Tor and invalid addresses resolve to '')
+        :return: list - Country codes ('' if unknown)
+        '''
+        IPGeolocation.__ensureLoaded()
+
+        keys = {'IPv4': [], 'IPv6': []}
+        positions = {'IPv4': [], 'IPv6': []}
+        for i, ipAddress in enumerate(ipAddresses):
+            try:
+                address = ipaddress.ip_address(ipAddress)
+            except ValueError:
+                continue
+            if(address.version == 4):
+                keys['IPv4'].append(int(address))
+                positions['IPv4'].append(i)
+            else:
+                keys['IPv6'].append(int(address) >> 64)
+                positions['IPv6'].append(i)
+
+        result = [''] * len(ipAddresses)
+        for addressType in ['IPv4', 'IPv6']:
+            countryIndexes = IPGeolocation.__lookup(addressType, np.array(keys[addressType], dtype=np.uint64))
+            for position, countryIdx in zip(positions[addressType], countryIndexes.tolist()):
+                if(countryIdx >= 0):
+                    result[position] = str(IPGeolocation.countryCodes[countryIdx])
+        return result
+
+
 
     @staticmethod
     def getIPCountry(ipAddress):
-        addressType = ''
-        if('.' in ipAddress):
-            addressType = 'IPv4'
-        elif(':' in ipAddress):
-            addressType = 'IPv6'
+        '''
+        Resolves the country of a single IP address.
 
-        for countryCode in IPGeolocation.allNetworks[addressType]:
-            countrySubnets = IPGeolocation.allNetworks[addressType][countryCode]
+        :param ipAddress: str - IP address
+        :return: str - Country code ('' if unknown)
+        '''
+        return IPGeolocation.getIPCountries([ipAddress])[0]
 
-            for ipSubnet in countrySubnets:
-                if(ipaddress.ip_address(ipAddress) in ipaddress.ip_network(ipSubnet, False)):
-                    return countryCode
 
-        return ''
 
-# Initialize the IP Geolocation data
-IPGeolocation.loadGeoNetworks()
+    @staticmethod
+    def getNodeAddressesCountries(tableName, changedSince=0):
+        '''
+        Geolocates every row of a node address table (_LNResearch_NodeAddresses or _LND_DBReader_NodeAddresses) at once.
+
+        :param tableName: str - Node address table name
+        :param changedSince: float - Only rows inserted or changed after this unix timestamp (ChangedAt column) are returned
+        :return: list of dicts - ID, NodeID, Address, Port, FirstSeen, LastSeen, ChangedAt and CountryCode of every row, ordered by ChangedAt
+        '''
+        if(tableName not in ['_LNResearch_NodeAddresses', '_LND_DBReader_NodeAddresses']):
+            raise ValueError(f"Unsupported node address table: {tableName}")
+
+        with get_db_connection() as db_conn:
+            with db_conn.cursor(dictionary=True) as db_cursor:
+                db_cursor.execute(f'''
+                    SELECT ID, NodeID, Address, Port, FirstSeen, LastSeen, UNIX_TIMESTAMP(ChangedAt) AS ChangedAt
+                    FROM {tableName}
+                    WHERE ChangedAt > FROM_UNIXTIME(%s)
+                    ORDER BY ChangedAt
+                ''', (changedSince,))
+                rows = db_cursor.fetchall()
 
-# Example usage:
-# print(json.dumps(IPGeolocation.allNetworks, indent=4))
\ No newline at end of file
+        countryCodes = IPGeolocation.getIPCountries([row['Address'] for row in rows])
+        for row, countryCode in zip(rows, countryCodes):
+            row['CountryCode'] = countryCode
+        return rows
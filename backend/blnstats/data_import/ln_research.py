@@ -1,7 +1,7 @@
 import bz2
 from pyln.proto.primitives import varint_decode
 import base64
-from ..database.utils import get_db_connection
+from ..database.utils import get_db_connection, add_change_tracking_column, mark_dirty_block_height, sync_node_indexes, sync_channel_intervals
 import requests
 import os
 
@@ -280,6 +280,10 @@ class LNResearchData:
                     );
                 ''')
 
+                # Rows are read incrementally by the alias import and the address geolocation
+                add_change_tracking_column(cursor, '_LNResearch_NodeAnnouncements')
+                add_change_tracking_column(cursor, '_LNResearch_NodeAddresses')
+
                 # # Channel updates are not used for now
                 # cursor.execute(f'''
                 #     CREATE TABLE IF NOT EXISTS `_LNResearch_ChannelUpdates` (
@@ -304,6 +308,15 @@ class LNResearchData:
     def insert_or_ignore_into_main(self):
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
+                # Node metrics are stale from the earliest block of the channels about to be added
+                cursor.execute('''
+                    SELECT MIN(ca.BlockIndex)
+                    FROM _LNResearch_ChannelAnnouncements ca
+                    LEFT JOIN Lightning_Channels LC ON LC.ShortChannelID = ca.ShortChannelID
+                    WHERE LC.ShortChannelID IS NULL
+                ''')
+                mark_dirty_block_height(cursor.fetchone()[0], cursor)
+
                 cursor.execute('''
                     INSERT IGNORE INTO Lightning_Channels 
                         (ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2)
@@ -312,10 +325,12 @@ class LNResearchData:
                         ca.BlockIndex,
                         ca.TxIndex,
                         ca.OutputIndex,
-                        ca.NodeID1,
-                        ca.NodeID2
+                        UNHEX(ca.NodeID1),
+                        UNHEX(ca.NodeID2)
                     FROM _LNResearch_ChannelAnnouncements ca
                 ''')
+                sync_node_indexes(cursor)
+                sync_channel_intervals(cursor)
                 conn.commit()
 
 
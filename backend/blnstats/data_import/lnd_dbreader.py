@@ -2,12 +2,22 @@ import json
 from datetime import datetime
 import gzip
 import requests
-from ..database.utils import get_db_connection
+import numpy as np
+from ..database.utils import get_db_connection, add_change_tracking_column, bulk_insert, get_system_settings_by_prefix, mark_dirty_block_height, sync_node_indexes, sync_channel_intervals
 import hashlib
 import os
 import shutil
+from multiprocessing.dummy import Pool as ThreadPool
 
 
+# Fingerprint of the last imported snapshot of a source (or set of sources), used to import only the delta of the next one
+SNAPSHOT_FINGERPRINT_PATH = "/DATA/INPUT/lnd-dbreader--fingerprint-{source_hash}.npz"
+
+# LastSeen is tracked at this resolution (seconds), so nodes which were merely seen again are rewritten once per period
+LAST_SEEN_RESOLUTION = 7 * 24 * 3600
+
+# System_Settings key prefix of the configured LND DBReader sources (LND-DBReader-Source-1, -2, ...)
+SOURCE_SETTINGS_PREFIX = "LND-DBReader-Source-"
 
 
 class LNDDBReader:
@@ -20,36 +30,287 @@ class LNDDBReader:
     """
 
 
-    def __init__(self, file_path):
+    def __init__(self, file_paths=None, full_import=False):
         """
-        Initializes the LNDDBReader class with the path to the LND DBReader data.
+        Initializes the LNDDBReader class with the path(s) to the LND DBReader data.
+
+        All sources are downloaded and parsed concurrently and merged in memory (union of channels,
+        earliest FirstSeen and latest LastSeen of every announcement and address), so the database
+        is written only once no matter how many sources are imported.
+
+        Unless full_import is requested, only records which were added or changed since the
+        previously imported snapshot of the same source(s) are written to the database. The NodeIDs affected by the
+        import are exposed as self.touched_node_ids (None means every node may be affected).
 
-        :param file_path: str - Path to the LND DBReader data (local file or URL).
+        :param file_paths: str or list - Path(s) to the LND DBReader data (local files or URLs).
+                                         Defaults to all LND-DBReader-Source-N system settings.
+        :param full_import: bool - Ignore the previous snapshot fingerprint and import everything.
         """
-        self.file_path = file_path
+        if(file_paths is None):
+            file_paths = self.get_configured_sources()
+        elif(isinstance(file_paths, str)):
+            file_paths = [file_paths]
+        if(len(file_paths) == 0):
+            raise ValueError(f"No LND DBReader sources given or configured ({SOURCE_SETTINGS_PREFIX}N system settings)")
 
-        if(file_path.startswith('http')):
-            print(f"[*] Downloading LND DBReader data from '{file_path}'")
-            self.file_path = self.__download_data(file_path)
+        self.file_paths = file_paths
+        self.fingerprint_path = self.get_fingerprint_path(file_paths)
+        self.touched_node_ids = None
+
+        print(f"[*] Loading {len(file_paths)} LND DBReader source(s)")
+        with ThreadPool(min(len(file_paths), 8)) as pool:
+            snapshots = pool.map(self.__load_source, file_paths)
 
-        print(f"[*] Reading LND DBReader data from '{self.file_path}'")
-        self.data = self.__read_file()
+        self.data = self.merge_snapshots(snapshots) if len(snapshots) > 1 else snapshots[0]
 
         print("[*] Creating tables if not exists")
         self.create_tables_if_not_exists()
 
+        fingerprint = self.compute_fingerprint(self.data)
+        previous_fingerprint = None if full_import else self.__load_previous_fingerprint()
+        if(previous_fingerprint is not None):
+            print("[*] Computing delta against the previously imported snapshot")
+            self.data, self.touched_node_ids = self.compute_delta(self.data, fingerprint, previous_fingerprint)
+            print(f"[*] Delta: {len(self.data['channel_announcements'])} channel announcements, "
+                  f"{len(self.data['node_announcements'])} node announcements, "
+                  f"{len(self.data['node_addresses'])} node addresses ({len(self.touched_node_ids)} touched nodes)")
+
         print("[*] Writing data to database")
         self.import_data()
 
         print("[*] Inserting data into main system table (DB Table: Lightning_Channels)")
         self.insert_or_ignore_into_main()
 
+        self.__save_fingerprint(fingerprint)
+
         print("[*] Done importing LND DBReader data")
 
 
 
 
+    @staticmethod
+    def compute_fingerprint(data):
+        """
+        Builds a compact fingerprint of a snapshot: the sorted ShortChannelIDs of all channel
+        announcements, one 64-bit hash per NodeID over the aliases, addresses and FirstSeen of all of
+        its announcements and addresses, a 64-bit hash of the latest (alias, FirstSeen) of every NodeID,
+        and the latest LastSeen of every NodeID in LAST_SEEN_RESOLUTION periods. LastSeen is left out of
+        the hashes, as it changes for almost every node between snapshots.
+
+        :param data: dict - Parsed LND DBReader snapshot.
+        :return: dict - {'channel_ids': uint64 array, 'node_ids': sorted str array, 'node_hashes': uint64 array,
+                         'node_alias_hashes': uint64 array, 'node_last_seen': int64 array}
+        """
+        channel_ids = np.unique(np.array([item['ShortChannelID'] for item in data['channel_announcements']], dtype=np.uint64))
+
+        node_records = {}
+        node_last_seen = {}
+        node_latest_alias = {}
+        for item in data['node_announcements']:
+            record = f"A|{item['Alias']}|{item['FirstSeen']}"
+            node_records.setdefault(item['NodeID'], []).append(record)
+            node_last_seen[item['NodeID']] = max(node_last_seen.get(item['NodeID'], 0), item['LastSeen'])
+
+            # The alias in use: a node switching back to an earlier alias keeps the same records, but not the same latest alias
+            latest = node_latest_alias.get(item['NodeID'])
+            if(latest is None or (item['LastSeen'], record) > latest):
+                node_latest_alias[item['NodeID']] = (item['LastSeen'], record)
+        for item in data['node_addresses']:
+            node_records.setdefault(item['NodeID'], []).append(f"N|{item['Address']}|{item['Port']}|{item['FirstSeen']}")
+            node_last_seen[item['NodeID']] = max(node_last_seen.get(item['NodeID'], 0), item['LastSeen'])
+
+        def hash64(text):
+            return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big')
+
+        node_ids = sorted(node_records.keys())
+        node_hashes = np.array([hash64('\n'.join(sorted(node_records[node_id]))) for node_id in node_ids], dtype=np.uint64)
+        node_alias_hashes = np.array([
+            hash64(node_latest_alias[node_id][1]) if node_id in node_latest_alias else 0
+            for node_id in node_ids
+        ], dtype=np.uint64)
+
+        return {
+            'channel_ids': channel_ids,
+            'node_ids': np.array(node_ids, dtype=str),
+            'node_hashes': node_hashes,
+            'node_alias_hashes': node_alias_hashes,
+            'node_last_seen': np.array([node_last_seen[node_id] // LAST_SEEN_RESOLUTION for node_id in node_ids], dtype=np.int64)
+        }
+
+
+
+    @staticmethod
+    def compute_delta(data, fingerprint, previous_fingerprint):
+        """
+        Reduces a snapshot to the records which are not already covered by the previous snapshot.
+
+        Channels are kept if their ShortChannelID is new. Node announcements and addresses are kept
+        for every node whose hash or latest alias is new or differs from the previous snapshot, and for every node
+        whose LastSeen moved into a later LAST_SEEN_RESOLUTION period. Only the former are touched:
+        a later LastSeen does not change the aliases, addresses or channels of a node.
+
+        :param data: dict - Parsed LND DBReader snapshot.
+        :param fingerprint: dict - Fingerprint of the snapshot (see compute_fingerprint).
+        :param previous_fingerprint: dict - Fingerprint of the previously imported snapshot.
+        :return: tuple(dict, set) - Reduced snapshot and the set of NodeIDs whose aliases, addresses or channels changed.
+        """
+        new_channel_ids = set(np.setdiff1d(fingerprint['channel_ids'], previous_fingerprint['channel_ids'], assume_unique=True).tolist())
+
+        # A node is unchanged only if it existed before with exactly the same hash and the same latest alias
+        previous_node_ids = previous_fingerprint['node_ids']
+        positions = np.searchsorted(previous_node_ids, fingerprint['node_ids'])
+        positions_clipped = np.minimum(positions, max(len(previous_node_ids) - 1, 0))
+        if(len(previous_node_ids) > 0):
+            existed = previous_node_ids[positions_clipped] == fingerprint['node_ids']
+            unchanged = (
+                existed
+                & (previous_fingerprint['node_hashes'][positions_clipped] == fingerprint['node_hashes'])
+                & (previous_fingerprint['node_alias_hashes'][positions_clipped] == fingerprint['node_alias_hashes'])
+            )
+            seen_again = unchanged & (previous_fingerprint['node_last_seen'][positions_clipped] < fingerprint['node_last_seen'])
+        else:
+            unchanged = np.zeros(len(fingerprint['node_ids']), dtype=bool)
+            seen_again = unchanged
+        changed_node_ids = set(fingerprint['node_ids'][~unchanged].tolist())
+        written_node_ids = changed_node_ids | set(fingerprint['node_ids'][seen_again].tolist())
+
+        delta = {
+            'channel_announcements': [item for item in data['channel_announcements'] if item['ShortChannelID'] in new_channel_ids],
+            'node_announcements': [item for item in data['node_announcements'] if item['NodeID'] in written_node_ids],
+            'node_addresses': [item for item in data['node_addresses'] if item['NodeID'] in written_node_ids]
+        }
+
+        touched_node_ids = set(changed_node_ids)
+        for item in delta['channel_announcements']:
+            touched_node_ids.add(item['NodeID1'])
+            touched_node_ids.add(item['NodeID2'])
+
+        return delta, touched_node_ids
+
+
+
+    @staticmethod
+    def get_fingerprint_path(file_paths):
+        """
+        Returns the path of the snapshot fingerprint of the given sources. Every source (or set of sources
+        imported together) has its own fingerprint, so a snapshot is only ever compared with the previous
+        snapshot of the same sources.
+
+        :param file_paths: list - Paths or URLs of the sources.
+        :return: str - Path of the fingerprint file.
+        """
+        normalized = sorted(
+            file_path.strip() if file_path.startswith('http') else os.path.normpath(os.path.abspath(file_path))
+            for file_path in file_paths
+        )
+        source_hash = hashlib.sha256('\n'.join(normalized).encode()).hexdigest()[:16]
+        return SNAPSHOT_FINGERPRINT_PATH.format(source_hash=source_hash)
+
+
+
+    def __load_previous_fingerprint(self):
+        if(not os.path.exists(self.fingerprint_path)):
+            return None
+
+        # A fingerprint is only meaningful if the data it describes is still in the database
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM _LND_DBReader_ChannelAnnouncements LIMIT 1')
+                if(cursor.fetchone() is None):
+                    return None
+
+        # Fingerprints of older versions hashed LastSeen or lack the latest aliases and cannot be compared
+        keys = ['channel_ids', 'node_ids', 'node_hashes', 'node_alias_hashes', 'node_last_seen']
+        with np.load(self.fingerprint_path) as fingerprint:
+            if(any(key not in fingerprint.files for key in keys)):
+                return None
+            return {key: fingerprint[key] for key in keys}
+
+
+
+    def __save_fingerprint(self, fingerprint):
+        os.makedirs(os.path.dirname(self.fingerprint_path), exist_ok=True)
+        with open(f"{self.fingerprint_path}_tmp", 'wb') as file:
+            np.savez_compressed(file, **fingerprint)
+        os.rename(f"{self.fingerprint_path}_tmp", self.fingerprint_path)
+
+
+
+
+    @staticmethod
+    def get_configured_sources():
+        """
+        Returns the LND DBReader sources configured as LND-DBReader-Source-N system settings, ordered by N.
+
+        :return: list - Source paths or URLs.
+        """
+        settings = get_system_settings_by_prefix(SOURCE_SETTINGS_PREFIX)
+        sources = [
+            (int(key[len(SOURCE_SETTINGS_PREFIX):]), value)
+            for key, value in settings.items()
+            if key[len(SOURCE_SETTINGS_PREFIX):].isdigit() and value
+        ]
+        return [value for _, value in sorted(sources)]
+
+
+
+    def __load_source(self, file_path):
+        if(file_path.startswith('http')):
+            print(f"[*] Downloading LND DBReader data from '{file_path}'")
+            file_path = self.__download_data(file_path)
+
+        print(f"[*] Reading LND DBReader data from '{file_path}'")
+        return self.__read_file(file_path)
+
+
+
+    @staticmethod
+    def merge_snapshots(snapshots):
+        """
+        Merges several parsed snapshots into one: the union of all channels, and for every node
+        announcement and address the earliest FirstSeen and the latest LastSeen across sources.
+
+        :param snapshots: list - Parsed LND DBReader snapshots.
+        :return: dict - Merged snapshot.
+        """
+        channel_announcements = {}
+        node_announcements = {}
+        node_addresses = {}
+
+        for snapshot in snapshots:
+            for item in snapshot['channel_announcements']:
+                channel_announcements.setdefault(item['ShortChannelID'], item)
+
+            for item in snapshot['node_announcements']:
+                key = (item['NodeID'], item['Alias'])
+                merged = node_announcements.get(key)
+                if(merged is None):
+                    node_announcements[key] = dict(item)
+                else:
+                    merged['FirstSeen'] = min(merged['FirstSeen'], item['FirstSeen'])
+                    merged['LastSeen'] = max(merged['LastSeen'], item['LastSeen'])
+
+            for item in snapshot['node_addresses']:
+                key = (item['NodeID'], item['Address'], item['Port'])
+                merged = node_addresses.get(key)
+                if(merged is None):
+                    node_addresses[key] = dict(item)
+                else:
+                    merged['FirstSeen'] = min(merged['FirstSeen'], item['FirstSeen'])
+                    merged['LastSeen'] = max(merged['LastSeen'], item['LastSeen'])
+
+        return {
+            'channel_announcements': list(channel_announcements.values()),
+            'node_announcements': list(node_announcements.values()),
+            'node_addresses': list(node_addresses.values())
+        }
+
+
+
     def __download_data(self, url):
+        if(not url.endswith('.gz')):
+            raise ValueError(f"Unsupported file type: {url}")
+
         response = requests.get(url, timeout=30)
         response.raise_for_status()
 
@@ -57,23 +318,20 @@ class LNDDBReader:
         timeNow = datetime.now().strftime('%Y%m%d-%H%M%S')
         file_path = f"/DATA/INPUT/lnd-dbreader-{addressHashID}--{timeNow}"
         file_path_latest = f"/DATA/INPUT/lnd-dbreader-{addressHashID}--latest.json.gz"
-        if(self.file_path.endswith('.gz')):
-            with open(f"{file_path}.json.gz_tmp", 'wb') as file:
-                file.write(response.content)
-            os.rename(f"{file_path}.json.gz_tmp", f"{file_path}.json.gz")
-            shutil.copy(f"{file_path}.json.gz", file_path_latest)
-            return f"{file_path}.json.gz"
-        else:
-            raise ValueError(f"Unsupported file type: {self.file_path}")
+        with open(f"{file_path}.json.gz_tmp", 'wb') as file:
+            file.write(response.content)
+        os.rename(f"{file_path}.json.gz_tmp", f"{file_path}.json.gz")
+        shutil.copy(f"{file_path}.json.gz", file_path_latest)
+        return f"{file_path}.json.gz"
 
 
 
-    def __read_file(self):
-        if(self.file_path.endswith('.gz')):
-            with gzip.open(self.file_path, 'rt') as file:
+    def __read_file(self, file_path):
+        if(file_path.endswith('.gz')):
+            with gzip.open(file_path, 'rt') as file:
                 return json.load(file)['data']
         else:
-            with open(self.file_path, 'r') as file:
+            with open(file_path, 'r') as file:
                 return json.load(file)['data']  
 
 
@@ -116,70 +374,139 @@ class LNDDBReader:
                         CONSTRAINT `unique_nodeid_address_port` UNIQUE (`NodeID`, `Address`, `Port`)
                     );
                 ''')
+
+                # Rows are read incrementally by the alias import and the address geolocation
+                add_change_tracking_column(cursor, '_LND_DBReader_NodeAnnouncements')
+                add_change_tracking_column(cursor, '_LND_DBReader_NodeAddresses')
                 conn.commit()
 
 
 
     def import_data(self):
+        """
+        Writes the parsed snapshot into the _LND_DBReader_* tables.
+
+        Every list is first loaded into a temporary staging table with large multi-row inserts
+        and then merged into its target table with a single set-based INSERT ... SELECT, so
+        the whole snapshot is written in a handful of statements instead of one per record.
+        """
+        channel_announcements = []
+        for item in self.data['channel_announcements']:
+            short_channel_id = item['ShortChannelID']
+            block_height = (short_channel_id >> 40) & 0xFFFFFF
+            tx_index = (short_channel_id >> 16) & 0xFFFFFF
+            output_index = short_channel_id & 0xFFFF
+            channel_announcements.append((short_channel_id, block_height, tx_index, output_index, item['NodeID1'], item['NodeID2']))
+
+        node_announcements = [
+            (item['NodeID'], item['Alias'], item['FirstSeen'], item['LastSeen'])
+            for item in self.data['node_announcements']
+        ]
+
+        node_addresses = [
+            (item['NodeID'], item['Address'], item['Port'], item['FirstSeen'], item['LastSeen'])
+            for item in self.data['node_addresses']
+        ]
+
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                print("[*] Inserting channel announcements into _LND_DBReader_ChannelAnnouncements table (INSERT OR IGNORE)")
-                for item in self.data['channel_announcements']:
 
-                    short_channel_id = item['ShortChannelID']
-                    block_height = (short_channel_id >> 40) & 0xFFFFFF
-                    tx_index = (short_channel_id >> 16) & 0xFFFFFF
-                    output_index = short_channel_id & 0xFFFF
+                # Staging tables live only for this connection
+                cursor.execute('''
+                    CREATE TEMPORARY TABLE `_Staging_ChannelAnnouncements` (
+                        `ShortChannelID` BIGINT NOT NULL,
+                        `BlockIndex` INT NOT NULL,
+                        `TxIndex` INT NOT NULL,
+                        `OutputIndex` INT NOT NULL,
+                        `NodeID1` CHAR(66) NOT NULL,
+                        `NodeID2` CHAR(66) NOT NULL
+                    ) ENGINE=InnoDB
+                ''')
+                cursor.execute('''
+                    CREATE TEMPORARY TABLE `_Staging_NodeAnnouncements` (
+                        `NodeID` CHAR(66) NOT NULL,
+                        `Alias` VARCHAR(32) NOT NULL,
+                        `FirstSeen` INT NOT NULL,
+                        `LastSeen` INT NOT NULL
+                    ) ENGINE=InnoDB
+                ''')
+                cursor.execute('''
+                    CREATE TEMPORARY TABLE `_Staging_NodeAddresses` (
+                        `NodeID` CHAR(66) NOT NULL,
+                        `Address` VARCHAR(255) NOT NULL,
+                        `Port` INT NOT NULL,
+                        `FirstSeen` INT NOT NULL,
+                        `LastSeen` INT NOT NULL
+                    ) ENGINE=InnoDB
+                ''')
 
-                    node_id_1 = item['NodeID1']
-                    node_id_2 = item['NodeID2']
 
-                    cursor.execute('''
-                        INSERT IGNORE INTO _LND_DBReader_ChannelAnnouncements 
-                            (ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2) VALUES (%s, %s, %s, %s, %s, %s)
-                    ''', (short_channel_id, block_height, tx_index, output_index, node_id_1, node_id_2))
-                conn.commit()
+                print(f"[*] Staging {len(channel_announcements)} channel announcements, {len(node_announcements)} node announcements and {len(node_addresses)} node addresses")
+                bulk_insert(cursor, '''
+                    INSERT INTO _Staging_ChannelAnnouncements
+                        (ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2) VALUES (%s, %s, %s, %s, %s, %s)
+                ''', channel_announcements)
+                bulk_insert(cursor, '''
+                    INSERT INTO _Staging_NodeAnnouncements
+                        (NodeID, Alias, FirstSeen, LastSeen) VALUES (%s, %s, %s, %s)
+                ''', node_announcements)
+                bulk_insert(cursor, '''
+                    INSERT INTO _Staging_NodeAddresses
+                        (NodeID, Address, Port, FirstSeen, LastSeen) VALUES (%s, %s, %s, %s, %s)
+                ''', node_addresses)
 
 
-                print("[*] Inserting node announcements into _LND_DBReader_NodeAnnouncements table (INSERT OR UPDATE)")
-                for item in self.data['node_announcements']:
-                    node_id = item['NodeID']
-                    alias = item['Alias']
-                    first_seen = item['FirstSeen']
-                    last_seen = item['LastSeen']
-
-                    cursor.execute('''
-                        INSERT INTO _LND_DBReader_NodeAnnouncements
-                            (NodeID, Alias, FirstSeen, LastSeen) VALUES (%s, %s, %s, %s)
-                        ON DUPLICATE KEY UPDATE
-                            FirstSeen = LEAST(FirstSeen, VALUES(FirstSeen)),
-                            LastSeen = GREATEST(LastSeen, VALUES(LastSeen))
-                    ''', (node_id, alias, first_seen, last_seen))
-                conn.commit()
+                print("[*] Merging channel announcements into _LND_DBReader_ChannelAnnouncements table (INSERT OR IGNORE)")
+                cursor.execute('''
+                    INSERT IGNORE INTO _LND_DBReader_ChannelAnnouncements
+                        (ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2)
+                    SELECT ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2
+                    FROM _Staging_ChannelAnnouncements
+                ''')
+
+
+                print("[*] Merging node announcements into _LND_DBReader_NodeAnnouncements table (INSERT OR UPDATE)")
+                cursor.execute('''
+                    INSERT INTO _LND_DBReader_NodeAnnouncements
+                        (NodeID, Alias, FirstSeen, LastSeen)
+                    SELECT NodeID, Alias, MIN(FirstSeen), MAX(LastSeen)
+                    FROM _Staging_NodeAnnouncements
+                    GROUP BY NodeID, Alias
+                    ON DUPLICATE KEY UPDATE
+                        FirstSeen = LEAST(_LND_DBReader_NodeAnnouncements.FirstSeen, VALUES(FirstSeen)),
+                        LastSeen = GREATEST(_LND_DBReader_NodeAnnouncements.LastSeen, VALUES(LastSeen))
+                ''')
 
 
-                print("[*] Inserting node addresses into _LND_DBReader_NodeAddresses table (INSERT OR UPDATE)")
-                for item in self.data['node_addresses']:
-                    node_id = item['NodeID']
-                    address = item['Address']
-                    port = item['Port']
-                    first_seen = item['FirstSeen']
-                    last_seen = item['LastSeen']
-
-                    cursor.execute('''
-                        INSERT INTO _LND_DBReader_NodeAddresses
-                            (NodeID, Address, Port, FirstSeen, LastSeen) VALUES (%s, %s, %s, %s, %s)
-                        ON DUPLICATE KEY UPDATE
-                            FirstSeen = LEAST(FirstSeen, VALUES(FirstSeen)),
-                            LastSeen = GREATEST(LastSeen, VALUES(LastSeen))
-                    ''', (node_id, address, port, first_seen, last_seen))
+                print("[*] Merging node addresses into _LND_DBReader_NodeAddresses table (INSERT OR UPDATE)")
+                cursor.execute('''
+                    INSERT INTO _LND_DBReader_NodeAddresses
+                        (NodeID, Address, Port, FirstSeen, LastSeen)
+                    SELECT NodeID, Address, Port, MIN(FirstSeen), MAX(LastSeen)
+                    FROM _Staging_NodeAddresses
+                    GROUP BY NodeID, Address, Port
+                    ON DUPLICATE KEY UPDATE
+                        FirstSeen = LEAST(_LND_DBReader_NodeAddresses.FirstSeen, VALUES(FirstSeen)),
+                        LastSeen = GREATEST(_LND_DBReader_NodeAddresses.LastSeen, VALUES(LastSeen))
+                ''')
                 conn.commit()
 
+                cursor.execute('DROP TEMPORARY TABLE _Staging_ChannelAnnouncements, _Staging_NodeAnnouncements, _Staging_NodeAddresses')
+
 
 
     def insert_or_ignore_into_main(self):
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
+                # Node metrics are stale from the earliest block of the channels about to be added
+                cursor.execute('''
+                    SELECT MIN(ca.BlockIndex)
+                    FROM _LND_DBReader_ChannelAnnouncements ca
+                    LEFT JOIN Lightning_Channels LC ON LC.ShortChannelID = ca.ShortChannelID
+                    WHERE LC.ShortChannelID IS NULL
+                ''')
+                mark_dirty_block_height(cursor.fetchone()[0], cursor)
+
                 cursor.execute('''
                     INSERT IGNORE INTO Lightning_Channels 
                         (ShortChannelID, BlockIndex, TxIndex, OutputIndex, NodeID1, NodeID2)
@@ -188,9 +515,11 @@ class LNDDBReader:
                         ca.BlockIndex,
                         ca.TxIndex,
                         ca.OutputIndex,
-                        ca.NodeID1,
-                        ca.NodeID2
+                        UNHEX(ca.NodeID1),
+                        UNHEX(ca.NodeID2)
                     FROM _LND_DBReader_ChannelAnnouncements ca
                 ''')
+                sync_node_indexes(cursor)
+                sync_channel_intervals(cursor)
                 conn.commit()
 
@@ -0,0 +1,180 @@
+# data_transform/channel_sweep.py
+
+import logging
+import numpy as np
+from ..database.utils import get_db_connection, BULK_INSERT_CHUNK_SIZE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+class ChannelSweepEngine:
+    """
+    Sweep-line computation of node capacities and channel counts at many block heights.
+
+    All channels are held as compact arrays (node indexes, value, funding block, spending block). Channel
+    opens and closes are sorted once and applied in block order while sweeping through the requested
+    checkpoints, so all checkpoints together cost O(channels + checkpoints x nodes).
+
+    A channel is active at a block height if it was funded on or before the block and is spent after it,
+    as in RawDataSelector.get_ln_nodes_capacities / get_ln_nodes_channel_counts.
+    """
+
+
+    def __init__(self, nodeIDs, node1Indexes, node2Indexes, values, fundingBlocks, spendingBlocks):
+        """
+        :param nodeIDs: np.ndarray - Node identifier (Lightning_Nodes.NodeIndex) of every node index
+        :param node1Indexes: np.ndarray(int) - Node index of the first channel party
+        :param node2Indexes: np.ndarray(int) - Node index of the second channel party
+        :param values: np.ndarray(int) - Channel capacities
+        :param fundingBlocks: np.ndarray(int) - Funding block heights
+        :param spendingBlocks: np.ndarray(int) - Spending block heights
+        """
+        self.nodeIDs = np.asarray(nodeIDs)
+        node1Indexes = np.asarray(node1Indexes, dtype=np.int64)
+        node2Indexes = np.asarray(node2Indexes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        fundingBlocks = np.asarray(fundingBlocks, dtype=np.int64)
+        spendingBlocks = np.asarray(spendingBlocks, dtype=np.int64)
+
+        # Channels spent before (or at) their funding block are never active
+        valid = spendingBlocks > fundingBlocks
+        node1Indexes, node2Indexes = node1Indexes[valid], node2Indexes[valid]
+        values, fundingBlocks, spendingBlocks = values[valid], fundingBlocks[valid], spendingBlocks[valid]
+
+        # Every channel counts for both of its parties, so events are kept per (channel, party)
+        eventNodes = np.concatenate([node1Indexes, node2Indexes])
+        eventValues = np.concatenate([values, values])
+
+        openOrder = np.argsort(np.concatenate([fundingBlocks, fundingBlocks]), kind='stable')
+        self.openBlocks = np.concatenate([fundingBlocks, fundingBlocks])[openOrder]
+        self.openNodes = eventNodes[openOrder]
+        self.openValues = eventValues[openOrder]
+
+        closeOrder = np.argsort(np.concatenate([spendingBlocks, spendingBlocks]), kind='stable')
+        self.closeBlocks = np.concatenate([spendingBlocks, spendingBlocks])[closeOrder]
+        self.closeNodes = eventNodes[closeOrder]
+        self.closeValues = eventValues[closeOrder]
+
+
+
+
+    @staticmethod
+    def load():
+        """
+        Loads all channels with known funding transactions from the database.
+
+        :return: ChannelSweepEngine
+        """
+        nodes1, nodes2, values, fundingBlocks, spendingBlocks = [], [], [], [], []
+        with get_db_connection() as db_conn:
+            with db_conn.cursor(buffered=False) as db_cursor:
+                db_cursor.execute('''
+                    SELECT LC.NodeIndex1, LC.NodeIndex2, BT.Value, BT.FundingBlockIndex, BT.SpendingBlockIndex
+                    FROM Lightning_Channels LC
+                    JOIN Blockchain_Transactions BT
+                      ON LC.ShortChannelID = BT.ShortChannelID
+                    WHERE LC.NodeIndex1 IS NOT NULL AND LC.NodeIndex2 IS NOT NULL
+                ''')
+                while True:
+                    rows = db_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE)
+                    if(len(rows) == 0):
+                        break
+                    for nodeIndex1, nodeIndex2, value, fundingBlock, spendingBlock in rows:
+                        nodes1.append(nodeIndex1)
+                        nodes2.append(nodeIndex2)
+                        values.append(value)
+                        fundingBlocks.append(fundingBlock)
+                        spendingBlocks.append(spendingBlock)
+
+        nodeIDs, nodeIndexes = np.unique(np.array(nodes1 + nodes2, dtype=np.int64), return_inverse=True)
+        logger.info(f"Loaded {len(values)} channels of {len(nodeIDs)} nodes")
+        return ChannelSweepEngine(
+            nodeIDs,
+            nodeIndexes[:len(nodes1)],
+            nodeIndexes[len(nodes1):],
+            np.array(values, dtype=np.int64),
+            np.array(fundingBlocks, dtype=np.int64),
+            np.array(spendingBlocks, dtype=np.int64)
+        )
+
+
+
+
+    def new_state(self):
+        """
+        :return: SweepState - State before the first channel event (no channel active).
+        """
+        return SweepState(np.zeros(len(self.nodeIDs), dtype=np.int64), np.zeros(len(self.nodeIDs), dtype=np.int64))
+
+
+
+
+    def advance(self, state, blockHeight):
+        """
+        Applies all channel opens and closes up to (and including) the given block height to the state.
+
+        :param state: SweepState - State to move forward (modified in place).
+        :param blockHeight: int - Block height to move to; must not be below the block height of the state.
+        :return: SweepState - The given state.
+        """
+        if(state.blockHeight is not None and blockHeight < state.blockHeight):
+            raise ValueError(f"Sweep state at block height {state.blockHeight} cannot move back to {blockHeight}")
+
+        # Channels funded on or before the block height
+        openEnd = np.searchsorted(self.openBlocks, blockHeight, side='right')
+        np.add.at(state.capacities, self.openNodes[state.openPosition:openEnd], self.openValues[state.openPosition:openEnd])
+        np.add.at(state.channelCounts, self.openNodes[state.openPosition:openEnd], 1)
+        state.openPosition = openEnd
+
+        # Channels spent on or before the block height
+        closeEnd = np.searchsorted(self.closeBlocks, blockHeight, side='right')
+        np.subtract.at(state.capacities, self.closeNodes[state.closePosition:closeEnd], self.closeValues[state.closePosition:closeEnd])
+        np.subtract.at(state.channelCounts, self.closeNodes[state.closePosition:closeEnd], 1)
+        state.closePosition = closeEnd
+
+        state.blockHeight = blockHeight
+        return state
+
+
+
+
+    def sweep(self, blockHeights, state=None):
+        """
+        Sweeps through the given block heights in ascending order.
+
+        :param blockHeights: iterable - Block heights (checkpoints)
+        :param state: SweepState - State to continue from, moved forward in place (a new state if None). Passing the
+                                   state of the previous call continues the sweep without replaying earlier events.
+        :return: generator - (blockHeight, nodeIndexes, capacities, channelCounts) for every checkpoint, with
+                             only the nodes which have at least one active channel
+        """
+        if(state is None):
+            state = self.new_state()
+
+        for blockHeight in sorted(set(int(blockHeight) for blockHeight in blockHeights)):
+            self.advance(state, blockHeight)
+            activeNodes = np.flatnonzero(state.channelCounts)
+            yield blockHeight, activeNodes, state.capacities[activeNodes], state.channelCounts[activeNodes]
+
+
+
+
+class SweepState:
+    """
+    Per-node capacities and channel counts after all channel events up to a block height, with the positions
+    in the sorted open and close events the sweep continues from.
+    """
+
+
+    def __init__(self, capacities, channelCounts, openPosition=0, closePosition=0, blockHeight=None):
+        self.capacities = capacities
+        self.channelCounts = channelCounts
+        self.openPosition = openPosition
+        self.closePosition = closePosition
+        self.blockHeight = blockHeight
+
+
+    def copy(self):
+        return SweepState(self.capacities.copy(), self.channelCounts.copy(), self.openPosition, self.closePosition, self.blockHeight)
@@ -0,0 +1,192 @@
+import re
+import json
+import ipaddress
+import unicodedata
+from collections import defaultdict
+
+
+
+# Normalized alias stems that are shared by unrelated operators (node software defaults etc.)
+GENERIC_ALIAS_STEMS = {
+    'node', 'nodes', 'lightning', 'lightningnode', 'lnnode', 'lnd', 'lndnode', 'cln', 'clightning',
+    'eclair', 'umbrel', 'mynode', 'raspiblitz', 'citadel', 'start', 'embassy', 'startos', 'nodl',
+    'btcpay', 'btcpayserver', 'voltage', 'bitcoin', 'bitcoinnode', 'btc', 'satoshi', 'sats',
+    'test', 'testnode', 'home', 'homenode', 'my', 'mylnd', 'alias', 'noalias', 'unknown'
+}
+
+# Shortest normalized stem used for linking
+MIN_ALIAS_STEM_LENGTH = 4
+
+# Alias stem and address groups with more nodes than this are treated as generic and not linked
+MAX_LINK_GROUP_SIZE = 100
+
+HEX_ALIAS_REGEX = re.compile(r'^[0-9a-fA-F]*$')
+
+# Node counter at the end of an alias, with the punctuation around it ("Hub-12]", "node #3")
+TRAILING_NUMBER_REGEX = re.compile(r'[\W_]*[0-9]+[\W_]*$')
+
+
+
+class UnionFind:
+    '''
+    Disjoint-set forest over the integers 0..size-1 with path compression and union by size.
+    '''
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+
+    def find(self, x):
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+
+    def union(self, x, y):
+        root_x, root_y = self.find(x), self.find(y)
+        if(root_x == root_y):
+            return
+        if(self.size[root_x] < self.size[root_y]):
+            root_x, root_y = root_y, root_x
+        self.parent[root_y] = root_x
+        self.size[root_x] += self.size[root_y]
+
+
+    def union_all(self, members):
+        members = list(members)
+        for member in members[1:]:
+            self.union(members[0], member)
+
+
+
+def normalize_alias_stem(alias):
+    '''
+    Reduces an alias to the stem shared by numbered aliases of one operator,
+    e.g. "LNBIG [Hub-3]" and "lnbig [hub-12]" both become "lnbighub".
+
+    Only the trailing number is dropped, digits elsewhere are part of the stem ("21bitcoins" and
+    "42bitcoins" stay apart). Letters, digits and symbols of any script are kept (NFKC-normalized and
+    case-folded), so CJK and emoji aliases link as well; punctuation and whitespace are removed.
+
+    :param alias: str - Node alias
+    :return: str - Normalized stem, or None if the alias is not usable for linking
+    '''
+    if(alias is None or HEX_ALIAS_REGEX.match(alias)):
+        return None
+
+    stem = unicodedata.normalize('NFKC', alias).casefold()
+    stem = TRAILING_NUMBER_REGEX.sub('', stem)
+    stem = ''.join(character for character in stem if unicodedata.category(character)[0] in ('L', 'N') or unicodedata.category(character) == 'So')
+
+    if(len(stem) < MIN_ALIAS_STEM_LENGTH or stem in GENERIC_ALIAS_STEMS):
+        return None
+    return stem
+
+
+
+def is_linkable_address(address):
+    '''
+    Checks whether a node address identifies a host (private, loopback and similar addresses do not).
+
+    :param address: str - IP address or Tor/DNS host name
+    :return: bool
+    '''
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        # Tor and DNS addresses
+        return address is not None and address != ''
+    return not (ip.is_private or ip.is_loopback or ip.is_unspecified or ip.is_link_local or ip.is_multicast or ip.is_reserved)
+
+
+
+def load_override_rules(file_path):
+    '''
+    Loads manual clustering rules from a JSON file of the form
+    {"groups": [{"name": "Entity name", "nodes": ["NodeID", ...]}, ...], "exclude": ["NodeID", ...]}.
+    Nodes of a group are always clustered together under the given name; excluded nodes are never linked automatically.
+
+    :param file_path: str - Path to the JSON file
+    :return: dict - Override rules
+    '''
+    with open(file_path, 'r') as file:
+        rules = json.load(file)
+    return {
+        'groups': rules.get('groups', []),
+        'exclude': rules.get('exclude', [])
+    }
+
+
+
+def cluster_nodes(node_aliases, node_addresses=(), overrides=None):
+    '''
+    Clusters nodes into entities. Nodes are linked by equal normalized alias stems, by shared
+    (Address, Port) pairs and by manual override groups; linking runs in near-linear time with a union-find.
+
+    :param node_aliases: dict - {NodeID: (alias, lastSeen)} with the alias used to name every node and its unix timestamp (0 if unknown)
+    :param node_addresses: iterable - (NodeID, Address, Port) tuples
+    :param overrides: dict - Manual rules as returned by load_override_rules
+    :return: dict - {NodeID: EntityName}
+    '''
+    overrides = overrides or {'groups': [], 'exclude': []}
+    node_ids = sorted(node_aliases.keys())
+    node_index = {node_id: i for i, node_id in enumerate(node_ids)}
+    excluded = set(node_index[node_id] for node_id in overrides['exclude'] if node_id in node_index)
+    union_find = UnionFind(len(node_ids))
+
+
+    # Link by alias stems and shared addresses
+    link_groups = defaultdict(set)
+    for node_id, (alias, _) in node_aliases.items():
+        stem = normalize_alias_stem(alias)
+        if(stem is not None):
+            link_groups[('stem', stem)].add(node_index[node_id])
+    for node_id, address, port in node_addresses:
+        if(node_id in node_index and is_linkable_address(address)):
+            link_groups[('address', address, port)].add(node_index[node_id])
+
+    for members in link_groups.values():
+        members = members - excluded
+        if(1 < len(members) <= MAX_LINK_GROUP_SIZE):
+            union_find.union_all(members)
+
+
+    # Manual groups
+    group_names = {}
+    for group in overrides['groups']:
+        members = [node_index[node_id] for node_id in group['nodes'] if node_id in node_index]
+        if(len(members) == 0):
+            continue
+        union_find.union_all(members)
+        group_names[members[0]] = group['name']
+
+
+    # Name every cluster after the most recently seen alias of its members (or its manual group name)
+    cluster_members = defaultdict(list)
+    for i in range(len(node_ids)):
+        cluster_members[union_find.find(i)].append(i)
+
+    cluster_names = {}
+    for root, members in cluster_members.items():
+        latest = max(members, key=lambda i: (node_aliases[node_ids[i]][1], node_ids[i]))
+        cluster_names[root] = node_aliases[node_ids[latest]][0]
+    for member, name in group_names.items():
+        cluster_names[union_find.find(member)] = name
+
+
+    # Entities are grouped by name, so unrelated clusters sharing a name are told apart by their first NodeID
+    roots_by_name = defaultdict(list)
+    for root, name in cluster_names.items():
+        roots_by_name[name].append(root)
+    for name, roots in roots_by_name.items():
+        if(len(roots) > 1):
+            for root in roots:
+                first_node_id = node_ids[min(cluster_members[root])]
+                cluster_names[root] = f'{name} [{first_node_id[0:8]}]'
+
+    return {node_id: cluster_names[union_find.find(i)] for i, node_id in enumerate(node_ids)}
@@ -1,8 +1,12 @@
+import os
 import logging
 import time
 from datetime import datetime
-from ..database.utils import get_db_connection
+import numpy as np
+from ..database.utils import get_db_connection, bulk_insert, get_system_setting, set_system_setting, add_change_tracking_column, BULK_INSERT_CHUNK_SIZE, CHANGE_TRACKING_OVERLAP
 from ..database.raw_data_selector import RawDataSelector
+from ..database.entity_mapping_versions import save_entity_mapping_version, set_current_entity_mapping_version, get_current_entity_mapping_version, load_entity_mapping_version
+from .entity_clustering import cluster_nodes, load_override_rules
 
 
 
@@ -11,6 +15,11 @@ logger = logging.getLogger(__name__)
 
 
 
+# Aliases and addresses of all nodes used by the previous clustering, so a refresh only has to fetch the changed nodes
+CLUSTER_INPUTS_PATH = "/DATA/INPUT/entity-clusters--inputs.npz"
+
+
+
 class EntityClusters:
     '''
     This class contains functions for creating and managing entity clusters in the Lightning_Entities table.
@@ -46,164 +55,293 @@ class EntityClusters:
 
 
 
+    def __create_node_filter_table(self, db_cursor, node_ids):
+        '''
+        Creates a temporary `_Filter_NodeIDs` table holding the given NodeIDs, so that the
+        refresh queries can be restricted to them with a single join.
+
+        :param db_cursor: Cursor of the connection which will use the table
+        :param node_ids: Iterable of NodeIDs
+        '''
+        db_cursor.execute('DROP TEMPORARY TABLE IF EXISTS `_Filter_NodeIDs`')
+        db_cursor.execute('''
+            CREATE TEMPORARY TABLE `_Filter_NodeIDs` (
+                `NodeID` CHAR(66) NOT NULL,
+                PRIMARY KEY (`NodeID`)
+            ) ENGINE=InnoDB
+        ''')
+        bulk_insert(db_cursor, 'INSERT IGNORE INTO _Filter_NodeIDs (NodeID) VALUES (%s)', [(node_id,) for node_id in node_ids])
+
+
+
+
 
-    def import_node_aliases_to_main_table(self, from_table_name, from_alias_column, from_node_id_column, from_timestamp_column):
+    def import_node_aliases_to_main_table(self, from_table_name, from_alias_column, from_node_id_column, from_timestamp_column, full_import=False):
         '''
         This function imports node aliases into the Lightning_NodeAliases table from a source table.
 
+        Only source rows inserted or changed since the previous import are processed: the source tables carry an
+        indexed `ChangedAt` column (see add_change_tracking_column), whose highest processed value is kept as a
+        watermark in System_Settings, and newer rows are streamed and upserted in chunks.
+
         :param from_table_name: The name of the source table
         :param from_alias_column: The name of the alias column in the source table
         :param from_node_id_column: The name of the node ID column in the source table
         :param from_timestamp_column: The name of the timestamp column in the source table
+        :param full_import: Ignore the watermark and process the whole source table
         '''
-        with get_db_connection() as db_conn:
-            with db_conn.cursor() as db_cursor:
+        changed_at_key = f'EntityClusters-AliasChangedAt-{from_table_name}'
+        last_changed_at = 0.0
+        if(not full_import):
+            last_changed_at = float(get_system_setting(changed_at_key, 0))
+
+        # Timestamps outside the Lightning Network lifetime are skipped
+        min_timestamp = datetime.fromisoformat('2017-12-01').timestamp()
+        max_timestamp = time.time()
+
+        insert_query = '''
+            INSERT INTO Lightning_NodeAliases (NodeID, Alias, firstSeen, lastSeen)
+            VALUES (%s, %s, FROM_UNIXTIME(%s), FROM_UNIXTIME(%s))
+            ON DUPLICATE KEY UPDATE
+                firstSeen = LEAST(firstSeen, VALUES(firstSeen)),
+                lastSeen = GREATEST(lastSeen, VALUES(lastSeen))
+        '''
+
+        # Rows are streamed from one connection and upserted through another, as an unbuffered
+        # cursor blocks its connection until the whole result has been read
+        with get_db_connection() as read_conn, get_db_connection() as write_conn:
+            with read_conn.cursor() as db_cursor:
+                add_change_tracking_column(db_cursor, from_table_name)
+
+            with read_conn.cursor(buffered=False) as read_cursor, write_conn.cursor() as write_cursor:
+
+                ##### Stream rows changed since the previous import
+                from_changed_at = max(last_changed_at - CHANGE_TRACKING_OVERLAP, 0)
+                logger.info(f'Fetching data from {from_table_name} (ChangedAt > {from_changed_at})')
+                read_cursor.execute(f'''
+                    SELECT {from_node_id_column}, {from_alias_column}, {from_timestamp_column}, UNIX_TIMESTAMP(ChangedAt)
+                    FROM {from_table_name}
+                    WHERE ChangedAt > FROM_UNIXTIME(%s)
+                ''', (from_changed_at,))
+
+                new_last_changed_at = last_changed_at
+                imported_count = 0
+                while True:
+                    rows = read_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE)
+                    if(len(rows) == 0):
+                        break
+
+                    changed_ats = np.fromiter((row[3] for row in rows), dtype=np.float64, count=len(rows))
+                    timestamps = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+                    valid = (timestamps >= min_timestamp) & (timestamps <= max_timestamp)
+                    new_last_changed_at = max(new_last_changed_at, float(changed_ats.max()))
 
-                ##### Fetch all data from the source table
-                logger.info(f'Fetching data from {from_table_name}')
-                fetch_query = f'''
-                    SELECT {from_node_id_column}, {from_alias_column}, {from_timestamp_column} FROM {from_table_name}
-                '''
-                db_cursor.execute(fetch_query)
-                rows = db_cursor.fetchall()
+                    # If the alias is empty, use the first 20 characters of the node_id
+                    processed_data_list = [
+                        (rows[i][0], rows[i][1] if rows[i][1] != "" else rows[i][0][0:20], rows[i][2], rows[i][2])
+                        for i in np.flatnonzero(valid).tolist()
+                    ]
+                    bulk_insert(write_cursor, insert_query, processed_data_list)
+                    write_conn.commit()
+                    imported_count += len(processed_data_list)
 
+                logger.info(f'Upserted {imported_count} aliases from {from_table_name}')
 
-                ##### Preprocess the data
-                logger.info(f'Preprocessing data')
-                processed_data = {}
-                for row in rows:
-                    node_id, alias, timestamp = row
+        set_system_setting(changed_at_key, new_last_changed_at)
 
-                    # If the alias is empty, use the first 20 characters of the node_id
-                    if(alias == ""):
-                        alias = node_id[0:20]
-                    
-
-                    # If the timestamp is before the Lightning Network started, skip it
-                    if(timestamp < datetime.fromisoformat('2017-12-01').timestamp()):
-                        continue
-                    # If the timestamp is in the future, skip it
-                    elif(timestamp > time.time()):
-                        continue
-                    
-
-                    timestamp_dt = datetime.fromtimestamp(timestamp)
-                    
-                    # Use a tuple of (node_id, alias) as the key
-                    key = (node_id, alias)
-                    
-                    if key in processed_data:
-                        # Update the first and last seen timestamps
-                        first_seen, last_seen = processed_data[key]
-                        processed_data[key] = (
-                            min(first_seen, timestamp_dt),
-                            max(last_seen, timestamp_dt)
-                        )
-                    else:
-                        # Initialize the first and last seen timestamps
-                        processed_data[key] = (timestamp_dt, timestamp_dt)
-
-                # Convert the dictionary to a list of tuples for insertion
-                processed_data_list = [
-                    (node_id, alias, first_seen, last_seen)
-                    for (node_id, alias), (first_seen, last_seen) in processed_data.items()
-                ]
-
-
-                ##### Insert processed data into the main table
-                logger.info(f'Inserting processed data into the main table')
-                insert_query = '''
-                    INSERT INTO Lightning_NodeAliases (NodeID, Alias, firstSeen, lastSeen)
-                    VALUES (%s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        firstSeen = LEAST(firstSeen, VALUES(firstSeen)),
-                        lastSeen = GREATEST(lastSeen, VALUES(lastSeen))
-                '''
-                db_cursor.executemany(insert_query, processed_data_list)
-                db_conn.commit()
-
-
-
-
-    def import_new_entities_to_main_table(self):
+
+
+
+
+    def __fetch_cluster_inputs(self, db_cursor, node_ids=None):
         '''
-        This function imports new entities into the Lightning_Entities table by selecting the latest alias for each NodeID from the Lightning_NodeAliases table.
+        Fetches the alias (latest non-hex alias if there is one) and the addresses of every node, or only of the given nodes.
+
+        :param db_cursor: Cursor to execute the queries with
+        :param node_ids: Optional iterable of NodeIDs to restrict the fetch to (None fetches all nodes)
+        :return: tuple - ({NodeID: (alias, lastSeen)}, set of (NodeID, Address, Port))
         '''
-        with get_db_connection() as db_conn:
-            with db_conn.cursor() as db_cursor:
-                
-                # Insert the latest alias for each NodeID into Lightning_Entities if it doesn't exist
-                logger.info('Inserting new entities into Lightning_Entities')
-                db_cursor.execute('''
-                    INSERT IGNORE INTO Lightning_Entities (NodeID, EntityName)
-                    SELECT NodeID, Alias
-                    FROM Lightning_NodeAliases
-                    WHERE (NodeID, lastSeen) IN (
-                        SELECT NodeID, MAX(lastSeen)
-                        FROM Lightning_NodeAliases
-                        GROUP BY NodeID
-                    )
-                ''')
-                db_conn.commit()
+        node_filter_join = ''
+        if(node_ids is not None):
+            self.__create_node_filter_table(db_cursor, node_ids)
+            node_filter_join = 'JOIN _Filter_NodeIDs F ON F.NodeID = {}'
+
+        ##### Fetch node aliases
+        logger.info('Fetching node aliases')
+        db_cursor.execute(f'''
+            SELECT NodeID, Alias, UNIX_TIMESTAMP(lastSeen)
+            FROM (
+                SELECT
+                    A.NodeID,
+                    A.Alias,
+                    A.lastSeen,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY A.NodeID
+                        ORDER BY (A.Alias REGEXP '^[0-9a-fA-F]+$' OR A.Alias = "") ASC, A.lastSeen DESC
+                    ) AS AliasRank
+                FROM Lightning_NodeAliases A
+                {node_filter_join.format('A.NodeID')}
+            ) RankedAliases
+            WHERE AliasRank = 1
+        ''')
+        node_aliases = {node_id: (alias, int(last_seen or 0)) for node_id, alias, last_seen in db_cursor.fetchall()}
+
+        # Nodes without an announcement are named after their NodeID
+        if(node_ids is None):
+            db_cursor.execute('''
+                SELECT LOWER(HEX(NodeID1)) FROM Lightning_Channels
+                UNION
+                SELECT LOWER(HEX(NodeID2)) FROM Lightning_Channels
+            ''')
+            node_ids = [node_id for (node_id,) in db_cursor.fetchall()]
+        for node_id in node_ids:
+            if(node_id not in node_aliases):
+                node_aliases[node_id] = (node_id[0:20], 0)
+
+        ##### Fetch node addresses
+        logger.info('Fetching node addresses')
+        node_addresses = set()
+        for table_name in ['_LNResearch_NodeAddresses', '_LND_DBReader_NodeAddresses']:
+            db_cursor.execute('SHOW TABLES LIKE %s', (table_name,))
+            if(db_cursor.fetchone() is None):
+                continue
+            db_cursor.execute(f'''
+                SELECT DISTINCT A.NodeID, A.Address, A.Port
+                FROM {table_name} A
+                {node_filter_join.format('A.NodeID')}
+            ''')
+            node_addresses.update(db_cursor.fetchall())
+
+        return node_aliases, node_addresses
+
+
+
+
+
+    @staticmethod
+    def __load_cluster_inputs():
+        '''
+        :return: tuple - (node aliases, node addresses) saved by the previous clustering, or None if there are none
+        '''
+        if(not os.path.exists(CLUSTER_INPUTS_PATH)):
+            return None
+        with np.load(CLUSTER_INPUTS_PATH) as inputs:
+            node_aliases = dict(zip(inputs['node_ids'].tolist(), zip(inputs['aliases'].tolist(), inputs['last_seen'].tolist())))
+            node_addresses = set(zip(inputs['address_node_ids'].tolist(), inputs['addresses'].tolist(), inputs['ports'].tolist()))
+        return node_aliases, node_addresses
+
+
+
+    @staticmethod
+    def __save_cluster_inputs(node_aliases, node_addresses):
+        node_ids = sorted(node_aliases.keys())
+        node_addresses = sorted(node_addresses)
+        os.makedirs(os.path.dirname(CLUSTER_INPUTS_PATH), exist_ok=True)
+        with open(f"{CLUSTER_INPUTS_PATH}_tmp", 'wb') as file:
+            np.savez_compressed(
+                file,
+                node_ids=np.array(node_ids, dtype=str),
+                aliases=np.array([node_aliases[node_id][0] for node_id in node_ids], dtype=str),
+                last_seen=np.array([node_aliases[node_id][1] for node_id in node_ids], dtype=np.int64),
+                address_node_ids=np.array([item[0] for item in node_addresses], dtype=str),
+                addresses=np.array([item[1] for item in node_addresses], dtype=str),
+                ports=np.array([item[2] for item in node_addresses], dtype=np.int64)
+            )
+        os.rename(f"{CLUSTER_INPUTS_PATH}_tmp", CLUSTER_INPUTS_PATH)
 
-                db_cursor.execute('''
-                    INSERT IGNORE INTO Lightning_Entities (NodeID, EntityName)
-                    SELECT NodeID1, SUBSTRING(NodeID1, 1, 20)
-                    FROM Lightning_Channels
-                ''')
-                db_cursor.execute('''
-                    INSERT IGNORE INTO Lightning_Entities (NodeID, EntityName)
-                    SELECT NodeID2, SUBSTRING(NodeID2, 1, 20)
-                    FROM Lightning_Channels
-                ''')
-                db_conn.commit()
-    
 
 
 
 
-    def fix_entity_hex_names_if_possible(self):
+    def cluster_entities(self, overrides_file_path=None, node_ids=None):
         '''
-        This function fixes the EntityName for entities with hex string names by finding another alias to set as the EntityName for the node.
+        This function updates the Lightning_Entities table by clustering all nodes with the union-find engine
+        (see entity_clustering.cluster_nodes): nodes are linked by normalized alias stems, shared addresses and
+        optional manual override rules.
+
+        The clustering inputs of all nodes are saved after every run. If node_ids are given, only the aliases and
+        addresses of these nodes are fetched from the database and merged into the saved inputs before clustering.
+        Only the rows of Lightning_Entities whose entity changed are written; the table is replaced with a
+        bulk-loaded copy only if it does not hold the previous mapping version. The new mapping version becomes
+        the current one only once Lightning_Entities holds it.
+
+        :param overrides_file_path: Path to a JSON file with manual clustering rules (defaults to BLNSTATS_ENTITY_OVERRIDES)
+        :param node_ids: Optional iterable of NodeIDs whose aliases or addresses changed (None fetches all nodes)
         '''
-        with get_db_connection() as db_conn:
-            with db_conn.cursor() as db_cursor:
-
-                # Fetch entities with hex string names
-                logger.info('Fetching entities with hex string names')
-                fetch_query = '''
-                    SELECT NodeID, EntityName
-                    FROM Lightning_Entities
-                    WHERE 
-                        EntityName REGEXP '^[0-9a-fA-F]+$' OR EntityName = ""
-                '''
-                db_cursor.execute(fetch_query)
-                hex_entities = db_cursor.fetchall()
-
-
-                for node_id, entity_name in hex_entities:
-                    # Find another alias for the node
-                    alias_query = '''
-                        SELECT Alias
-                        FROM Lightning_NodeAliases
-                        WHERE NodeID = %s AND Alias != %s AND Alias NOT REGEXP '^[0-9a-fA-F]+$' AND Alias != ""
-                        ORDER BY lastSeen DESC
-                        LIMIT 1
-                    '''
-                    db_cursor.execute(alias_query, (node_id, entity_name))
-                    alias_result = db_cursor.fetchone()
-
-                    if alias_result:
-                        new_alias = alias_result[0]
-                        # Update the EntityName with the new alias
-                        logger.info(f'Updating EntityName for NodeID: {node_id} from {entity_name} to {new_alias}')
-                        update_query = '''
-                            UPDATE Lightning_Entities
-                            SET EntityName = %s
-                            WHERE NodeID = %s
-                        '''
-                        db_cursor.execute(update_query, (new_alias, node_id))
-
-                db_conn.commit()
+        overrides_file_path = overrides_file_path or os.getenv('BLNSTATS_ENTITY_OVERRIDES')
+        overrides = None
+        if(overrides_file_path and os.path.exists(overrides_file_path)):
+            logger.info(f'Loading entity override rules from {overrides_file_path}')
+            overrides = load_override_rules(overrides_file_path)
 
+        previous_version_id = get_current_entity_mapping_version()
+        previous_entities = load_entity_mapping_version(previous_version_id) if previous_version_id > 0 else None
 
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('SELECT COUNT(*) FROM Lightning_Entities')
+                entity_count = db_cursor.fetchone()[0]
+                table_is_current = previous_entities is not None and entity_count == len(previous_entities)
+
+                ##### Fetch the clustering inputs (only of the given nodes if the saved inputs are usable)
+                saved_inputs = self.__load_cluster_inputs() if node_ids is not None and table_is_current else None
+                if(saved_inputs is not None):
+                    node_aliases, node_addresses = saved_inputs
+                    node_ids = set(node_ids)
+                    logger.info(f'Refreshing clustering inputs of {len(node_ids)} nodes')
+                    changed_aliases, changed_addresses = self.__fetch_cluster_inputs(db_cursor, node_ids)
+                    node_aliases.update(changed_aliases)
+                    node_addresses = set(item for item in node_addresses if item[0] not in node_ids) | changed_addresses
+                else:
+                    node_aliases, node_addresses = self.__fetch_cluster_inputs(db_cursor)
+
+
+                ##### Cluster nodes into entities
+                logger.info(f'Clustering {len(node_aliases)} nodes')
+                entities = cluster_nodes(node_aliases, node_addresses, overrides)
+                logger.info(f'Clustered {len(entities)} nodes into {len(set(entities.values()))} entities')
+
+                # Record the mapping as a version, so cached entity aggregates can tell whether they are stale
+                version_id, changed = save_entity_mapping_version(entities)
+                if(not changed and table_is_current):
+                    logger.info(f'Entity mapping unchanged (version {version_id})')
+
+
+                ##### Write the entities whose name changed
+                elif(table_is_current):
+                    changed_rows = [(node_id, name) for node_id, name in entities.items() if previous_entities.get(node_id) != name]
+                    removed_rows = [(node_id,) for node_id in previous_entities.keys() if node_id not in entities]
+                    logger.info(f'Updating {len(changed_rows)} and deleting {len(removed_rows)} rows of Lightning_Entities')
+                    bulk_insert(db_cursor, '''
+                        INSERT INTO Lightning_Entities (NodeID, EntityName) VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE EntityName = VALUES(EntityName)
+                    ''', changed_rows)
+                    if(len(removed_rows) > 0):
+                        db_cursor.executemany('DELETE FROM Lightning_Entities WHERE NodeID = %s', removed_rows)
+                    set_current_entity_mapping_version(version_id, db_cursor)
+                    db_conn.commit()
+
+
+                ##### Replace Lightning_Entities with the new clusters
+                else:
+                    # RENAME TABLE commits implicitly, so the current version is unknown until the swap is done
+                    set_current_entity_mapping_version(0, db_cursor)
+                    db_conn.commit()
+
+                    db_cursor.execute('DROP TABLE IF EXISTS Lightning_Entities_New')
+                    db_cursor.execute('CREATE TABLE Lightning_Entities_New LIKE Lightning_Entities')
+                    bulk_insert(db_cursor, '''
+                        INSERT INTO Lightning_Entities_New (NodeID, EntityName) VALUES (%s, %s)
+                    ''', list(entities.items()))
+                    db_conn.commit()
+
+                    db_cursor.execute('''
+                        RENAME TABLE
+                            Lightning_Entities TO Lightning_Entities_Old,
+                            Lightning_Entities_New TO Lightning_Entities
+                    ''')
+                    db_cursor.execute('DROP TABLE Lightning_Entities_Old')
+                    set_current_entity_mapping_version(version_id, db_cursor)
+                    db_conn.commit()
+
+        self.__save_cluster_inputs(node_aliases, node_addresses)
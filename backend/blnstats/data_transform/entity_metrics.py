@@ -0,0 +1,192 @@
+# data_transform/entity_metrics.py
+
+import logging
+import numpy as np
+from ..database.utils import get_db_connection, bulk_insert, column_exists, get_entity_indexes, binary_to_hex
+from ..database.entity_timeline import EntityTimeline
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+class EntityMetrics:
+    """
+    Class to handle the transformation of entity metrics.
+
+    Entity capacities and channel counts are aggregated from `_CACHED1_NodeMetrics` into `_CACHED2_EntityMetrics`,
+    keyed on the entity surrogate keys of Lightning_EntityNames.
+    For every block height the state it was built from is recorded: the hash of the entity mapping at the block
+    time and a checksum of the node metrics. Heights are only recomputed when one of them changed.
+    The cache is refreshed by the transform step after the node metrics (see transformNodeMetrics), the
+    selectors only read it.
+    """
+
+
+    def __init__(self, entityTimeline: EntityTimeline = None):
+        """
+        Initializes the EntityMetrics class and creates the necessary tables if they don't exist.
+
+        :param entityTimeline: EntityTimeline - Entity resolution to use (loaded from the database if not given).
+        """
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                # The cache used to be keyed on EntityName; it is rebuilt on EntityIndex on the next refresh
+                if(column_exists(db_cursor, '_CACHED2_EntityMetrics', 'EntityName')):
+                    logger.info("Dropping _CACHED2_EntityMetrics keyed on EntityName, it is rebuilt keyed on EntityIndex")
+                    db_cursor.execute('DROP TABLE `_CACHED2_EntityMetrics`')
+                    db_cursor.execute('DROP TABLE IF EXISTS `_CACHED2_EntityMetricsState`')
+
+                db_cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS `_CACHED2_EntityMetrics` (
+                        `BlockHeight` INTEGER NOT NULL,
+                        `EntityIndex` INT UNSIGNED NOT NULL,
+                        `ChannelCount` INTEGER NOT NULL,
+                        `Capacity` BIGINT NOT NULL,
+                        PRIMARY KEY (`BlockHeight`, `EntityIndex`)
+                    );
+                ''')
+                db_cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS `_CACHED2_EntityMetricsState` (
+                        `BlockHeight` INTEGER NOT NULL,
+                        `MappingHash` CHAR(64) NOT NULL,
+                        `NodeMetricsChecksum` VARCHAR(255) NOT NULL,
+                        PRIMARY KEY (`BlockHeight`)
+                    );
+                ''')
+
+                # The mapping version was recorded but never compared, the mapping hash covers it
+                if(column_exists(db_cursor, '_CACHED2_EntityMetricsState', 'MappingVersion')):
+                    db_cursor.execute('ALTER TABLE `_CACHED2_EntityMetricsState` DROP COLUMN `MappingVersion`')
+        self.entityTimeline = entityTimeline
+
+
+
+
+    def __get_node_metrics_checksums(self, db_cursor, blockHeights):
+        """
+        Computes a checksum of the `_CACHED1_NodeMetrics` rows of every given block height on the database server.
+
+        :return: dict - {BlockHeight: checksum}
+        """
+        placeholders = ', '.join(['%s'] * len(blockHeights))
+        db_cursor.execute(f'''
+            SELECT
+                BlockHeight,
+                CONCAT_WS(':', COUNT(*), SUM(Capacity), SUM(ChannelCount), BIT_XOR(CRC32(CONCAT_WS(':', NodeIndex, Capacity, ChannelCount))))
+            FROM _CACHED1_NodeMetrics
+            WHERE BlockHeight IN ({placeholders})
+            GROUP BY BlockHeight
+        ''', blockHeights)
+        return {int(blockHeight): checksum for blockHeight, checksum in db_cursor.fetchall()}
+
+
+
+
+    def __get_node_metrics_block_times(self):
+        """
+        :return: dict - {BlockHeight: block timestamp} of every block height cached in `_CACHED1_NodeMetrics`
+        """
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('''
+                    SELECT B.BlockHeight, B.Timestamp
+                    FROM Blockchain_Blocks B
+                    WHERE B.BlockHeight IN (SELECT DISTINCT BlockHeight FROM _CACHED1_NodeMetrics)
+                ''')
+                return {int(blockHeight): int(timestamp) for blockHeight, timestamp in db_cursor.fetchall()}
+
+
+
+
+    def refresh(self, blockHeightsStructure=None):
+        """
+        Brings `_CACHED2_EntityMetrics` up to date for the given block heights, recomputing only stale heights.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights
+                                      (defaults to every block height cached in `_CACHED1_NodeMetrics`).
+        :return: list - Block heights which were recomputed
+        """
+        if(blockHeightsStructure is None):
+            blockTimes = self.__get_node_metrics_block_times()
+        else:
+            blockTimes = {int(blockHeight): block.timestamp for blockHeight, block in blockHeightsStructure.data.items()}
+        blockHeights = sorted(blockTimes.keys())
+        if(len(blockHeights) == 0):
+            return []
+
+        if(self.entityTimeline is None):
+            self.entityTimeline = EntityTimeline.load()
+
+        recomputed = []
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+
+                # States the cached aggregates were built from
+                placeholders = ', '.join(['%s'] * len(blockHeights))
+                db_cursor.execute(f'''
+                    SELECT BlockHeight, MappingHash, NodeMetricsChecksum
+                    FROM _CACHED2_EntityMetricsState
+                    WHERE BlockHeight IN ({placeholders})
+                ''', blockHeights)
+                cachedStates = {int(blockHeight): (mappingHash, checksum) for blockHeight, mappingHash, checksum in db_cursor.fetchall()}
+                nodeMetricsChecksums = self.__get_node_metrics_checksums(db_cursor, blockHeights)
+
+                for blockHeight in blockHeights:
+                    timestamp = blockTimes[blockHeight]
+                    state = (self.entityTimeline.mapping_hash(timestamp), nodeMetricsChecksums.get(blockHeight, ''))
+                    if(cachedStates.get(blockHeight) == state):
+                        continue
+
+                    self.__transformForBlockHeight(db_cursor, blockHeight, timestamp)
+                    db_cursor.execute('''
+                        REPLACE INTO _CACHED2_EntityMetricsState (BlockHeight, MappingHash, NodeMetricsChecksum)
+                        VALUES (%s, %s, %s)
+                    ''', (blockHeight, state[0], state[1]))
+                    db_conn.commit()
+                    recomputed.append(blockHeight)
+
+        logger.info(f"Entity metrics recomputed for {len(recomputed)} of {len(blockHeights)} block heights")
+        return recomputed
+
+
+
+
+    def __transformForBlockHeight(self, db_cursor, blockHeight, timestamp):
+        """
+        Aggregates the node metrics of one block height into entity metrics, resolving the entity of every node as of the block time.
+        """
+        db_cursor.execute('''
+            SELECT N.NodeID, M.Capacity, M.ChannelCount
+            FROM _CACHED1_NodeMetrics M
+            JOIN Lightning_Nodes N ON N.NodeIndex = M.NodeIndex
+            WHERE M.BlockHeight = %s
+        ''', (blockHeight,))
+        rows = db_cursor.fetchall()
+
+        nodeIDs = np.array([binary_to_hex(row[0]) for row in rows], dtype=str)
+        capacities = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        channelCounts = np.fromiter((row[2] for row in rows), dtype=np.int64, count=len(rows))
+
+        # Nodes are grouped by the timeline entity they resolve to (entity names are unique per cluster);
+        # nodes unknown to the timeline are their own entities, named like nodes without an alias
+        entities = self.entityTimeline.resolve(nodeIDs, timestamp)
+        unknown = entities < 0
+        unknownNames, unknownInverse = np.unique(nodeIDs[unknown].astype('<U20'), return_inverse=True)
+        entities[unknown] = len(self.entityTimeline.entity_names) + unknownInverse
+        allNames = np.concatenate([self.entityTimeline.entity_names, unknownNames])
+
+        entityKeys, inverse = np.unique(entities, return_inverse=True)
+        names = allNames[entityKeys]
+        capacitySums = np.bincount(inverse, weights=capacities, minlength=len(names))
+        channelCountSums = np.bincount(inverse, weights=channelCounts, minlength=len(names))
+        entityIndexes = get_entity_indexes(db_cursor, names.tolist())
+
+        db_cursor.execute('DELETE FROM _CACHED2_EntityMetrics WHERE BlockHeight = %s', (blockHeight,))
+        bulk_insert(db_cursor, '''
+            INSERT INTO _CACHED2_EntityMetrics (BlockHeight, EntityIndex, ChannelCount, Capacity)
+            VALUES (%s, %s, %s, %s)
+        ''', [
+            (blockHeight, entityIndexes[name], int(channelCount), int(capacity))
+            for name, channelCount, capacity in zip(names.tolist(), channelCountSums.tolist(), capacitySums.tolist())
+        ])
@@ -0,0 +1,93 @@
+import logging
+from ..database.utils import get_db_connection, bulk_insert, get_system_setting, set_system_setting, add_change_tracking_column, CHANGE_TRACKING_OVERLAP
+from ..data_import.ip_geolocation import IPGeolocation
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+# Node address tables the country mapping is built from
+NODE_ADDRESS_TABLES = ['_LNResearch_NodeAddresses', '_LND_DBReader_NodeAddresses']
+
+
+
+class NodeCountries:
+    '''
+    This class maintains the materialized Lightning_NodeCountries table, which maps every node
+    with a clearnet address to the country of its most recently seen address.
+    '''
+
+
+    def __init__(self):
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS `Lightning_NodeCountries` (
+                        `NodeID` CHAR(66) NOT NULL,
+                        `CountryCode` CHAR(2) NOT NULL,
+                        `LastSeen` INT NOT NULL,
+                        PRIMARY KEY (`NodeID`),
+                        INDEX `idx_CountryCode` (`CountryCode`)
+                    );
+                ''')
+
+
+
+
+    def refresh(self):
+        '''
+        Geolocates only the node addresses added or seen again since the previous run (tracked per source
+        table with a System_Settings watermark on the ChangedAt column, see add_change_tracking_column)
+        and merges them into Lightning_NodeCountries. A change of the CIDR lists resets the watermarks.
+        '''
+        if(not IPGeolocation.isAvailable()):
+            logger.warning(f'No IP geolocation data found in {IPGeolocation.cidrFolder}, skipping node countries refresh')
+            return
+
+        # Re-geolocate everything if the CIDR lists changed since the previous run
+        if(get_system_setting('NodeCountries-IPGeoSignature') != IPGeolocation.signature):
+            logger.info('IP geolocation data changed, re-geolocating all node addresses')
+            for table_name in NODE_ADDRESS_TABLES:
+                set_system_setting(f'NodeCountries-AddressChangedAt-{table_name}', 0)
+            set_system_setting('NodeCountries-IPGeoSignature', IPGeolocation.signature)
+
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                for table_name in NODE_ADDRESS_TABLES:
+
+                    db_cursor.execute('SHOW TABLES LIKE %s', (table_name,))
+                    if(db_cursor.fetchone() is None):
+                        continue
+
+                    add_change_tracking_column(db_cursor, table_name)
+                    watermark_key = f'NodeCountries-AddressChangedAt-{table_name}'
+                    last_changed_at = float(get_system_setting(watermark_key, 0))
+
+                    rows = IPGeolocation.getNodeAddressesCountries(table_name, changedSince=max(last_changed_at - CHANGE_TRACKING_OVERLAP, 0))
+                    if(len(rows) == 0):
+                        continue
+                    logger.info(f'Geolocated {len(rows)} new or updated addresses from {table_name}')
+
+                    # Keep the most recently seen geolocated address of every node
+                    latest_by_node = {}
+                    for row in rows:
+                        if(row['CountryCode'] == ''):
+                            continue
+                        latest = latest_by_node.get(row['NodeID'])
+                        if(latest is None or row['LastSeen'] >= latest[2]):
+                            latest_by_node[row['NodeID']] = (row['NodeID'], row['CountryCode'], row['LastSeen'])
+
+                    # CountryCode must be assigned before LastSeen, as assignments are evaluated left to right
+                    bulk_insert(db_cursor, '''
+                        INSERT INTO Lightning_NodeCountries (NodeID, CountryCode, LastSeen)
+                        VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE
+                            CountryCode = IF(VALUES(LastSeen) >= LastSeen, VALUES(CountryCode), CountryCode),
+                            LastSeen = GREATEST(LastSeen, VALUES(LastSeen))
+                    ''', list(latest_by_node.values()))
+                    db_conn.commit()
+
+                    set_system_setting(watermark_key, max(last_changed_at, float(rows[-1]['ChangedAt'])))
@@ -1,12 +1,126 @@
 # data_transform/node_metrics.py
 
+import os
 import logging
-from ..database.utils import get_db_connection
+import multiprocessing
+import collections
+from ..database.utils import get_db_connection, get_pooled_db_connection, bulk_insert, get_dirty_block_height, clear_dirty_block_height, bump_data_version, column_exists, sync_node_indexes, BULK_INSERT_CHUNK_SIZE
 from ..database.raw_data_selector import RawDataSelector
+from .channel_sweep import ChannelSweepEngine
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Checkpoint grids node metrics can be materialized for (each grid also contains the first blocks of months)
+NODE_METRICS_RESOLUTIONS = ['monthly', 'weekly', 'daily']
+DEFAULT_NODE_METRICS_RESOLUTION = os.getenv('BLNSTATS_NODE_METRICS_RESOLUTION', 'monthly')
+
+
+
+# Worker processes used by NodeMetrics.transformForBlockHeights (1 = serial)
+DEFAULT_NODE_METRICS_WORKERS = int(os.getenv('BLNSTATS_NODE_METRICS_WORKERS', 1))
+
+# `_CACHED1_NodeMetrics` is range-partitioned by BlockHeight: all heights below the first boundary share one
+# partition, then one partition per NODE_METRICS_PARTITION_SIZE blocks and a catch-all `pmax`
+NODE_METRICS_PARTITION_SIZE = 10000
+NODE_METRICS_FIRST_PARTITION_BOUNDARY = 500000
+# Partitions are kept defined up to this many blocks past the chain tip
+NODE_METRICS_PARTITION_HEADROOM = 100000
+
+# Sweep engine of a worker process
+_worker_sweep_engine = None
+
+
+
+def _partition_name(blockHeight, lastBoundary):
+    """
+    Name of the `_CACHED1_NodeMetrics` partition holding a block height. Partitions are named after their upper bound.
+    """
+    if(blockHeight >= lastBoundary):
+        return 'pmax'
+    boundary = max(NODE_METRICS_FIRST_PARTITION_BOUNDARY, (blockHeight // NODE_METRICS_PARTITION_SIZE + 1) * NODE_METRICS_PARTITION_SIZE)
+    return f'p{boundary}'
+
+
+
+def _partition_definitions(fromBoundary, toBoundary, withMaxValue=True):
+    boundaries = range(fromBoundary, toBoundary + 1, NODE_METRICS_PARTITION_SIZE)
+    definitions = [f'PARTITION p{boundary} VALUES LESS THAN ({boundary})' for boundary in boundaries]
+    if(withMaxValue):
+        definitions.append('PARTITION pmax VALUES LESS THAN MAXVALUE')
+    return ',\n'.join(definitions)
+
+
+
+def _init_sweep_worker(sweepEngine):
+    global _worker_sweep_engine
+    _worker_sweep_engine = sweepEngine
+
+
+
+def _transform_partition(task):
+    partitionName, blockHeights, sweepState = task
+    with get_pooled_db_connection() as db_conn:
+        return _write_partition(_worker_sweep_engine, partitionName, blockHeights, db_conn, sweepState)
+
+
+
+def _write_partition(sweepEngine, partitionName, blockHeights, db_conn, sweepState):
+    """
+    Sweeps checkpoints of one `_CACHED1_NodeMetrics` partition and swaps them in atomically.
+
+    The sweep continues from the given state, so consecutive partitions only apply the channel events between them.
+
+    The partition is rebuilt in a non-partitioned staging table: the cached rows of all other block heights of the
+    partition are copied over and the swept rows are added with multi-row INSERTs of at most BULK_INSERT_CHUNK_SIZE
+    rows. The staging table is then exchanged with the partition, so readers never see partially written checkpoints
+    and no rows have to be deleted.
+
+    :param sweepEngine: ChannelSweepEngine - Channel data to sweep.
+    :param partitionName: str - Partition all block heights belong to.
+    :param blockHeights: list - Sorted block heights.
+    :param db_conn: Database connection to write with.
+    :param sweepState: SweepState - Sweep state at or below the first block height, moved forward to the last one.
+    :return: int - Number of processed block heights.
+    """
+    stagingTable = f'_STAGING_NodeMetrics_{partitionName}'
+    insert_query = f'''
+        INSERT INTO `{stagingTable}` (`BlockHeight`, `NodeIndex`, `ChannelCount`, `Capacity`)
+        VALUES (%s, %s, %s, %s)
+    '''
+    with db_conn.cursor() as db_cursor:
+        db_cursor.execute(f'DROP TABLE IF EXISTS `{stagingTable}`')
+        db_cursor.execute(f'CREATE TABLE `{stagingTable}` LIKE `_CACHED1_NodeMetrics`')
+        db_cursor.execute(f'ALTER TABLE `{stagingTable}` REMOVE PARTITIONING')
+
+        placeholders = ', '.join(['%s'] * len(blockHeights))
+        db_cursor.execute(f'''
+            INSERT INTO `{stagingTable}` (`BlockHeight`, `NodeIndex`, `ChannelCount`, `Capacity`)
+            SELECT `BlockHeight`, `NodeIndex`, `ChannelCount`, `Capacity`
+            FROM `_CACHED1_NodeMetrics` PARTITION (`{partitionName}`)
+            WHERE `BlockHeight` NOT IN ({placeholders})
+        ''', blockHeights)
+
+        data_to_insert = []
+        for blockHeight, nodeIndexes, capacities, channelCounts in sweepEngine.sweep(blockHeights, sweepState):
+            data_to_insert.extend(zip(
+                [blockHeight] * len(nodeIndexes),
+                sweepEngine.nodeIDs[nodeIndexes].tolist(),
+                channelCounts.tolist(),
+                capacities.tolist()
+            ))
+            if(len(data_to_insert) >= BULK_INSERT_CHUNK_SIZE):
+                bulk_insert(db_cursor, insert_query, data_to_insert)
+                data_to_insert = []
+        bulk_insert(db_cursor, insert_query, data_to_insert)
+        db_conn.commit()
+
+        db_cursor.execute(f'ALTER TABLE `_CACHED1_NodeMetrics` EXCHANGE PARTITION `{partitionName}` WITH TABLE `{stagingTable}`')
+        db_cursor.execute(f'DROP TABLE `{stagingTable}`')
+
+    return len(blockHeights)
+
+
 
 
 class NodeMetrics:
@@ -15,6 +129,7 @@ class NodeMetrics:
 
     This class is responsible for processing and storing node metrics data, including
     capacities and channel counts, for specific block heights or the first blocks of each month.
+    The metrics are computed by sweeping once through all channel open/close events.
     """
 
 
@@ -25,85 +140,164 @@ class NodeMetrics:
         with get_db_connection() as db_conn:
             with db_conn.cursor() as db_cursor:
                 db_cursor.execute('''
+                    SELECT MAX(`BlockHeight`) FROM `Blockchain_Blocks`
+                ''')
+                maxBlockHeight = db_cursor.fetchone()[0] or 0
+                lastBoundary = self.__required_last_boundary(maxBlockHeight)
+
+                # The cache used to be keyed on NodeID; it is rebuilt on NodeIndex by the next transform
+                if(column_exists(db_cursor, '_CACHED1_NodeMetrics', 'NodeID')):
+                    logger.info("Dropping _CACHED1_NodeMetrics keyed on NodeID, it is rebuilt keyed on NodeIndex")
+                    db_cursor.execute('DROP TABLE `_CACHED1_NodeMetrics`')
+
+                db_cursor.execute(f'''
                     CREATE TABLE IF NOT EXISTS `_CACHED1_NodeMetrics` (
                         `BlockHeight` INTEGER NOT NULL,
-                        `NodeID` VARCHAR(66) NOT NULL,
+                        `NodeIndex` INT UNSIGNED NOT NULL,
                         `ChannelCount` INTEGER NOT NULL,
                         `Capacity` BIGINT NOT NULL,
-                        PRIMARY KEY (`BlockHeight`, `NodeID`),
+                        PRIMARY KEY (`BlockHeight`, `NodeIndex`),
                         INDEX idx_blockheight (`BlockHeight`),
-                        INDEX idx_nodeid (`NodeID`)
+                        INDEX idx_nodeindex (`NodeIndex`)
+                    )
+                    PARTITION BY RANGE (`BlockHeight`) (
+                        {_partition_definitions(NODE_METRICS_FIRST_PARTITION_BOUNDARY, lastBoundary)}
                     );
                 ''')
+                self.last_partition_boundary = self.__ensure_partitions(db_cursor, lastBoundary)
+
+                # Channels inserted by code paths that did not assign node surrogate keys
+                sync_node_indexes(db_cursor)
+                db_conn.commit()
         self.raw_data_selector = RawDataSelector()
+        self.sweep_engine = None
         logger.info("NodeMetrics table initialized.")
 
 
 
 
+    @staticmethod
+    def __required_last_boundary(maxBlockHeight):
+        requiredHeight = max(maxBlockHeight, NODE_METRICS_FIRST_PARTITION_BOUNDARY) + NODE_METRICS_PARTITION_HEADROOM
+        return (requiredHeight // NODE_METRICS_PARTITION_SIZE + 1) * NODE_METRICS_PARTITION_SIZE
+
+
+
+
+    def __ensure_partitions(self, db_cursor, lastBoundary):
+        """
+        Partitions a `_CACHED1_NodeMetrics` table created before partitioning was introduced, and splits new
+        partitions off `pmax` once the chain gets close to the last partition boundary.
+
+        :return: int - Upper bound of the last partition before `pmax`.
+        """
+        db_cursor.execute('''
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '_CACHED1_NodeMetrics' AND PARTITION_NAME IS NOT NULL
+        ''')
+        boundaries = [int(description) for name, description in db_cursor.fetchall() if name != 'pmax']
+
+        if(len(boundaries) == 0):
+            logger.info("Partitioning existing _CACHED1_NodeMetrics table by BlockHeight...")
+            db_cursor.execute(f'''
+                ALTER TABLE `_CACHED1_NodeMetrics`
+                PARTITION BY RANGE (`BlockHeight`) (
+                    {_partition_definitions(NODE_METRICS_FIRST_PARTITION_BOUNDARY, lastBoundary)}
+                )
+            ''')
+            return lastBoundary
+
+        currentLastBoundary = max(boundaries)
+        if(currentLastBoundary < lastBoundary):
+            logger.info(f"Adding _CACHED1_NodeMetrics partitions up to BlockHeight {lastBoundary}")
+            db_cursor.execute(f'''
+                ALTER TABLE `_CACHED1_NodeMetrics`
+                REORGANIZE PARTITION pmax INTO (
+                    {_partition_definitions(currentLastBoundary + NODE_METRICS_PARTITION_SIZE, lastBoundary)}
+                )
+            ''')
+            return lastBoundary
+        return currentLastBoundary
+
+
+
+
     def transformForBlockHeight(self, blockHeight):
         """
         Transforms and stores the node metrics for a specific block height.
 
         :param blockHeight: int - The block height to process.
         """
-        blockHeight = int(blockHeight)
-        logger.info(f"Processing BlockHeight: {blockHeight}")
+        self.transformForBlockHeights([blockHeight])
 
-        # Get capacities
-        capacities = self.raw_data_selector.get_ln_nodes_capacities(blockHeight)
 
-        # Get channel counts
-        channel_counts = self.raw_data_selector.get_ln_nodes_channel_counts(blockHeight)
 
-        # Merge data
-        node_metrics = {}
 
-        for cap in capacities:
-            NodeID = cap['NodeID']
-            NodeValue = int(cap['NodeValue'])
-            node_metrics[NodeID] = {'Capacity': NodeValue}
+    def transformForBlockHeights(self, blockHeights, workers=None):
+        """
+        Transforms and stores the node metrics for many block heights by sweeping over all channels
+        (see ChannelSweepEngine). The block heights are grouped by table partition; every partition is swept,
+        rebuilt and swapped in as one unit of work, either serially or by a pool of worker processes.
 
-        for cnt in channel_counts:
-            NodeID = cnt['NodeID']
-            ChannelCount = int(cnt['ChannelCount'])
-            if NodeID in node_metrics:
-                node_metrics[NodeID]['ChannelCount'] = ChannelCount
-            else:
-                node_metrics[NodeID] = {'ChannelCount': ChannelCount, 'Capacity': 0}
+        Serially, one sweep state moves forward through the partitions. With workers, every partition task starts
+        from the sweep state just before its first block height (computed in one forward pass), so a worker only
+        applies the channel events within its partition: the work of a task is bounded by the events and
+        checkpoints of one partition, and the total work does not grow with the number of workers.
 
-        # Ensure all nodes have both Capacity and ChannelCount
-        for NodeID, metrics in node_metrics.items():
-            metrics.setdefault('ChannelCount', 0)
-            metrics.setdefault('Capacity', 0)
+        :param blockHeights: list - The block heights to process.
+        :param workers: int - Number of worker processes (defaults to BLNSTATS_NODE_METRICS_WORKERS, 1 = serial).
+        """
+        workers = workers or DEFAULT_NODE_METRICS_WORKERS
+        if(self.sweep_engine is None):
+            self.sweep_engine = ChannelSweepEngine.load()
 
-        # Insert data into `_CACHED1_NodeMetrics` table
-        with get_db_connection() as db_conn:
-            with db_conn.cursor() as db_cursor:
+        blockHeights = sorted(set(int(blockHeight) for blockHeight in blockHeights))
+        partitionTasks = {}
+        for blockHeight in blockHeights:
+            partitionTasks.setdefault(_partition_name(blockHeight, self.last_partition_boundary), []).append(blockHeight)
+        partitionTasks = list(partitionTasks.items())
+
+        processed = 0
+        if(workers <= 1 or len(partitionTasks) <= 1):
+            # One sweep state moves forward through the partitions in block order
+            sweepState = self.sweep_engine.new_state()
+            with get_db_connection() as db_conn:
+                for partitionName, partitionBlockHeights in partitionTasks:
+                    processed += _write_partition(self.sweep_engine, partitionName, partitionBlockHeights, db_conn, sweepState)
+                    logger.info(f"Processed {processed}/{len(blockHeights)} block heights (up to BlockHeight {partitionBlockHeights[-1]})")
+        else:
+            # Workers receive the channel arrays once and write whole partitions through their own pooled connections.
+            # At most two tasks per worker are in flight, so only that many sweep states are held at a time.
+            with multiprocessing.Pool(workers, initializer=_init_sweep_worker, initargs=(self.sweep_engine,)) as pool:
+                pending = collections.deque()
+                for task in self.__tasks_with_sweep_states(partitionTasks):
+                    pending.append(pool.apply_async(_transform_partition, (task,)))
+                    while(len(pending) >= 2 * workers or (len(pending) > 0 and pending[0].ready())):
+                        processed += pending.popleft().get()
+                        logger.info(f"Processed {processed}/{len(blockHeights)} block heights ({workers} workers)")
+                while(len(pending) > 0):
+                    processed += pending.popleft().get()
+                    logger.info(f"Processed {processed}/{len(blockHeights)} block heights ({workers} workers)")
+
+        # Cached analysis results were built from the previous node metrics
+        bump_data_version()
 
-                # Delete data for this block height
-                db_cursor.execute('''
-                    DELETE FROM `_CACHED1_NodeMetrics` WHERE `BlockHeight` = %s
-                ''', (blockHeight,))
-                db_conn.commit()
 
-                data_to_insert = []
-                for NodeID, metrics in node_metrics.items():
-                    ChannelCount = metrics['ChannelCount']
-                    Capacity = metrics['Capacity']
-                    data_to_insert.append((blockHeight, NodeID, ChannelCount, Capacity))
 
-                # Insert data in batches if necessary
-                batch_size = 10000
-                for i in range(0, len(data_to_insert), batch_size):
-                    batch = data_to_insert[i:i + batch_size]
-                    db_cursor.executemany('''
-                        INSERT INTO `_CACHED1_NodeMetrics` (`BlockHeight`, `NodeID`, `ChannelCount`, `Capacity`)
-                        VALUES (%s, %s, %s, %s)
-                    ''', batch)
-                    db_conn.commit()
 
-        logger.info(f"Successfully processed BlockHeight: {blockHeight}")
+    def __tasks_with_sweep_states(self, partitionTasks):
+        """
+        Hands every partition task the sweep state just before its first block height. The states are computed
+        in one forward pass over the channel events, so no worker replays the events below its partition.
+
+        :param partitionTasks: list - (partitionName, blockHeights) in ascending block order.
+        :return: generator - (partitionName, blockHeights, SweepState) tasks
+        """
+        sweepState = self.sweep_engine.new_state()
+        for partitionName, partitionBlockHeights in partitionTasks:
+            self.sweep_engine.advance(sweepState, partitionBlockHeights[0] - 1)
+            yield partitionName, partitionBlockHeights, sweepState.copy()
 
 
 
@@ -117,7 +311,70 @@ class NodeMetrics:
             logger.warning("No first blocks found. Ensure the Blockchain_Blocks table is populated.")
             return
 
-        for blockHeight in first_blocks:
-            self.transformForBlockHeight(blockHeight)
+        self.transformForBlockHeights(first_blocks)
+
+
+
+
+    def getCheckpoints(self, resolution):
+        """
+        Returns the block heights of a checkpoint grid.
+
+        :param resolution: str - 'monthly' (first blocks of months), 'weekly' (also first blocks of Mondays)
+                                 or 'daily' (first blocks of every day).
+        :return: list - Sorted block heights.
+        """
+        if(resolution not in NODE_METRICS_RESOLUTIONS):
+            raise ValueError(f"Unknown node metrics resolution: {resolution} (expected one of {NODE_METRICS_RESOLUTIONS})")
+
+        if(resolution == 'daily'):
+            checkpoints = set(self.raw_data_selector.get_first_blocks_of_days(withMeta=False).keys())
+        else:
+            checkpoints = set(self.raw_data_selector.get_first_blocks_of_months(withMeta=False).keys())
+            if(resolution == 'weekly'):
+                checkpoints |= set(self.raw_data_selector.get_first_blocks_of_days(withMeta=False, weekday=0).keys())
+
+        return sorted(int(blockHeight) for blockHeight in checkpoints)
+
+
+
+
+    def transformForResolution(self, resolution=None, full=False):
+        """
+        Transforms and stores the node metrics for the checkpoints of a grid in a single sweep.
+
+        Only checkpoints which are not cached yet, and cached block heights at or after the dirty block height
+        recorded by the imports and the blockchain sync, are recomputed (unless full is set).
+
+        :param resolution: str - 'monthly', 'weekly' or 'daily' (defaults to BLNSTATS_NODE_METRICS_RESOLUTION).
+        :param full: bool - Recompute all checkpoints.
+        """
+        resolution = resolution or DEFAULT_NODE_METRICS_RESOLUTION
+        checkpoints = self.getCheckpoints(resolution)
+        if not checkpoints:
+            logger.warning("No checkpoints found. Ensure the Blockchain_Blocks table is populated.")
+            return
+
+        # The channels are (re)loaded after reading the dirty mark, so every change recorded up to the mark is swept;
+        # changes recorded later bump the dirty generation and keep the mark for the next run
+        dirtyBlockHeight, dirtyGeneration = get_dirty_block_height()
+        self.sweep_engine = None
+        if(not full):
+            with get_db_connection() as db_conn:
+                with db_conn.cursor() as db_cursor:
+                    db_cursor.execute('SELECT DISTINCT `BlockHeight` FROM `_CACHED1_NodeMetrics`')
+                    cachedBlockHeights = set(row[0] for row in db_cursor.fetchall())
+
+            # Missing checkpoints of this grid, and every cached block height (of any grid) at or after the dirty one
+            staleFrom = dirtyBlockHeight if dirtyBlockHeight is not None else float('inf')
+            checkpoints = sorted(
+                set(blockHeight for blockHeight in checkpoints if blockHeight not in cachedBlockHeights) |
+                set(blockHeight for blockHeight in cachedBlockHeights if blockHeight >= staleFrom)
+            )
 
+        logger.info(f"Transforming node metrics for {len(checkpoints)} {resolution} checkpoints (dirty from block height {dirtyBlockHeight})")
+        if checkpoints:
+            self.transformForBlockHeights(checkpoints)
 
+        if(dirtyBlockHeight is not None and not clear_dirty_block_height(dirtyGeneration)):
+            logger.info("Channel data changed during the transform, the dirty block height is kept for the next run")
@@ -1,5 +1,6 @@
 from typing import Dict, List
 from pydantic import BaseModel
+import numpy as np
 import os
 import json
 import logging
@@ -153,6 +154,18 @@ class VerticesAspectDataStructure(BaseBLNDataStructure):
 
 
 
+    def iter_value_arrays(self):
+        """
+        Iterates over the block heights with the vertex values as an array.
+
+        :return: generator - (blockHeight, date, timestamp, np.ndarray(int64) values) for every block height
+        """
+        for blockHeight, verticeEntry in self.data.items():
+            values = np.fromiter((vertice.value for vertice in verticeEntry.vertices), dtype=np.int64, count=len(verticeEntry.vertices))
+            yield blockHeight, verticeEntry.date, verticeEntry.timestamp, values
+
+
+
     def save_to_csv(self, filePath: str, divideValueBy: float = 1.0):
         """
         Saves the data to a CSV file.
@@ -200,6 +213,142 @@ class VerticesAspectDataStructure(BaseBLNDataStructure):
 
 
 
+class CompactVerticesAspectDataStructure:
+    '''
+    Array-backed form of VerticesAspectDataStructure used on the analytics hot path.
+
+    Every block height holds a NumPy int64 array of vertex values and an int32 array of indexes into a name
+    table shared by all block heights, instead of a pydantic VerticeData object per vertex. The pydantic
+    structure is built on the fly for `data` and the file/JSON output and not kept, so the compact object
+    does not grow once it has been written out.
+    '''
+    class Entry:
+        __slots__ = ('date', 'timestamp', 'name_indexes', 'values')
+
+        def __init__(self, date: str, timestamp: int, name_indexes: np.ndarray, values: np.ndarray):
+            self.date = date
+            self.timestamp = timestamp
+            self.name_indexes = name_indexes
+            self.values = values
+
+
+    def __init__(self, meta, names: list = None, entries: dict = None):
+        """
+        :param meta: MetaDataStructure or dict - Metadata of the structure
+        :param names: list - Shared name table (NodeIDs, EntityNames or CountryCodes)
+        :param entries: dict - {blockHeight (str): CompactVerticesAspectDataStructure.Entry}
+        """
+        self.meta = meta if isinstance(meta, MetaDataStructure) else MetaDataStructure(**meta)
+        self.names = names if names is not None else []
+        self.entries = entries if entries is not None else {}
+
+
+
+    @staticmethod
+    def fill_from_rows(structures: list, blockHeightsStructure: BlockchainBlockHeightsStructure, rowChunks, nameConverter=None):
+        """
+        Fills the structures from (BlockHeight, name, value of structure 1, value of structure 2, ...) rows sorted by
+        block height. All structures share one name table; block heights without rows get empty arrays.
+
+        :param structures: list - CompactVerticesAspectDataStructure to fill, in the order of the value columns
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - Block heights to create entries for
+        :param rowChunks: iterable - Chunks (lists) of rows, e.g. from cursor.fetchmany()
+        :param nameConverter: callable - Optional conversion of the raw name column (e.g. binary_to_hex)
+        """
+        names, nameIndexByName = [], {}
+        nameIndexesByBlockHeight = {str(blockHeight): [] for blockHeight in blockHeightsStructure.data.keys()}
+        valuesByBlockHeight = [{blockHeight: [] for blockHeight in nameIndexesByBlockHeight} for _ in structures]
+
+        currentBlockHeight, nameIndexes, valueLists = None, None, None
+        for rows in rowChunks:
+            for row in rows:
+                if(row[0] != currentBlockHeight):
+                    currentBlockHeight = row[0]
+                    nameIndexes = nameIndexesByBlockHeight[str(currentBlockHeight)]
+                    valueLists = [values[str(currentBlockHeight)] for values in valuesByBlockHeight]
+
+                name = row[1] if nameConverter is None else nameConverter(row[1])
+                nameIndex = nameIndexByName.get(name)
+                if(nameIndex is None):
+                    nameIndex = nameIndexByName[name] = len(names)
+                    names.append(name)
+                nameIndexes.append(nameIndex)
+                for values, value in zip(valueLists, row[2:]):
+                    values.append(value)
+
+        for structure, values in zip(structures, valuesByBlockHeight):
+            structure.names = names
+            for blockHeight, blockData in blockHeightsStructure.data.items():
+                structure.entries[str(blockHeight)] = CompactVerticesAspectDataStructure.Entry(
+                    date=blockData.date,
+                    timestamp=blockData.timestamp,
+                    name_indexes=np.array(nameIndexesByBlockHeight[str(blockHeight)], dtype=np.int32),
+                    values=np.array(values[str(blockHeight)], dtype=np.int64)
+                )
+
+
+
+    def iter_value_arrays(self):
+        """
+        Iterates over the block heights with the vertex values as an array.
+
+        :return: generator - (blockHeight, date, timestamp, np.ndarray(int64) values) for every block height
+        """
+        for blockHeight, entry in self.entries.items():
+            yield blockHeight, entry.date, entry.timestamp, entry.values
+
+
+
+    def to_structure(self) -> VerticesAspectDataStructure:
+        """
+        Converts to the pydantic VerticesAspectDataStructure. A new object is built on every call.
+        """
+        return VerticesAspectDataStructure(
+            meta=self.meta,
+            data={
+                blockHeight: VerticesAspectDataStructure.VerticeEntry(
+                    date=entry.date,
+                    timestamp=entry.timestamp,
+                    vertices=[
+                        VerticesAspectDataStructure.VerticeData(name=self.names[nameIndex], value=value)
+                        for nameIndex, value in zip(entry.name_indexes.tolist(), entry.values.tolist())
+                    ]
+                ) for blockHeight, entry in self.entries.items()
+            }
+        )
+
+
+    @property
+    def data(self):
+        return self.to_structure().data
+
+
+    def save_to_file(self, filePath: str):
+        self.to_structure().save_to_file(filePath)
+
+
+    def save_to_csv(self, filePath: str, divideValueBy: float = 1.0):
+        self.to_structure().save_to_csv(filePath, divideValueBy)
+
+
+    def to_json_obj(self):
+        """
+        Returns structure as JSON object.
+        """
+        return self.to_structure().to_json_obj()
+
+    def to_json_str(self):
+        """
+        Returns structure as JSON string.
+        """
+        return self.to_structure().to_json_str()
+
+
+
+
+
+
+
 # Data structure for CoefficientsAcrossTheTime
 class CoefficientsDataStructure(BaseBLNDataStructure):
     '''
@@ -0,0 +1,159 @@
+import os
+import sys
+import logging
+from collections import OrderedDict
+import numpy as np
+from ..database.utils import get_data_version
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+# Approximate memory budget of the cached checkpoint lists and metric structures per process
+DEFAULT_ANALYSIS_CACHE_BYTES = int(os.getenv('BLNSTATS_ANALYSIS_CACHE_MB', 512)) * 1024 * 1024
+
+
+
+def estimate_nbytes(value, seen=None):
+    '''
+    Approximate memory footprint of a cached value: NumPy arrays by their buffer size, containers and objects
+    (including pydantic models and classes with __slots__) by walking their items and attributes.
+    Objects reachable more than once are counted once.
+
+    :param value: Any value
+    :param seen: set - ids of the objects counted so far
+    :return: int - Size in bytes
+    '''
+    seen = set() if seen is None else seen
+    if(id(value) in seen):
+        return 0
+    seen.add(id(value))
+
+    if(isinstance(value, np.ndarray)):
+        return value.nbytes
+    size = sys.getsizeof(value)
+    if(isinstance(value, dict)):
+        size += sum(estimate_nbytes(key, seen) + estimate_nbytes(item, seen) for key, item in value.items())
+    elif(isinstance(value, (list, tuple, set, frozenset))):
+        size += sum(estimate_nbytes(item, seen) for item in value)
+    else:
+        if(hasattr(value, '__dict__')):
+            size += estimate_nbytes(vars(value), seen)
+        for slot in getattr(type(value), '__slots__', ()):
+            if(hasattr(value, slot)):
+                size += estimate_nbytes(getattr(value, slot), seen)
+    return size
+
+
+
+class AnalysisCache:
+    '''
+    LRU cache of checkpoint lists and metric structures bounded by their approximate size in bytes, shared by
+    all selectors of a process.
+
+    Entries are keyed by (subject, metric, heights, data version). The data version is stored in System_Settings
+    and bumped by imports and transforms. It is read once per generator or workflow run (see begin_run), so entries
+    built from older data are never returned; they are dropped as soon as a newer version is seen. Cached
+    structures are shared between callers and must not be modified.
+    '''
+
+
+    def __init__(self, maxBytes=DEFAULT_ANALYSIS_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()
+        self.entrySizes = {}
+        self.totalBytes = 0
+        self.dataVersion = None
+
+
+
+
+    def begin_run(self, dataVersion=None):
+        """
+        Sets the data version of the entries used by a generator or workflow run, dropping the entries of other versions.
+
+        :param dataVersion: int - Data version (read from System_Settings if not given)
+        :return: int - The data version of the run
+        """
+        if(dataVersion is None):
+            dataVersion = get_data_version()
+        if(dataVersion != self.dataVersion):
+            if(len(self.entries) > 0):
+                logger.info(f"Data version changed ({self.dataVersion} -> {dataVersion}), dropping {len(self.entries)} cached analysis entries")
+            self.clear()
+            self.dataVersion = dataVersion
+        return dataVersion
+
+
+
+
+    def current_data_version(self):
+        """
+        :return: int - Data version of the current run (read from System_Settings on first use outside a run)
+        """
+        if(self.dataVersion is None):
+            self.begin_run()
+        return self.dataVersion
+
+
+
+
+    def __key(self, subject, metric, heights):
+        return (subject, metric, tuple(heights), self.current_data_version())
+
+
+
+
+    def get(self, subject, metric, heights):
+        """
+        :param subject: str - e.g. 'Nodes', 'Entities', 'Countries' or 'BlockHeights'
+        :param metric: str - e.g. 'Capacity', 'ChannelCount' or the date mask of a checkpoint list
+        :param heights: iterable - Block heights (or other arguments) the value was computed for
+        :return: Cached value, or None
+        """
+        key = self.__key(subject, metric, heights)
+        if(key not in self.entries):
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+
+
+
+    def put(self, subject, metric, heights, value):
+        """
+        Caches a value, evicting the least recently used entries until the cache fits into maxBytes.
+        Values larger than maxBytes on their own are not cached.
+        """
+        key = self.__key(subject, metric, heights)
+        size = estimate_nbytes(value)
+        if(size > self.maxBytes):
+            logger.info(f"Not caching {subject} {metric} ({size} bytes exceed the cache size of {self.maxBytes} bytes)")
+            return
+
+        if(key in self.entries):
+            self.totalBytes -= self.entrySizes[key]
+        self.entries[key] = value
+        self.entrySizes[key] = size
+        self.totalBytes += size
+        self.entries.move_to_end(key)
+        while(self.totalBytes > self.maxBytes):
+            evictedKey, _ = self.entries.popitem(last=False)
+            self.totalBytes -= self.entrySizes.pop(evictedKey)
+
+
+
+
+    def clear(self):
+        self.entries.clear()
+        self.entrySizes.clear()
+        self.totalBytes = 0
+
+
+
+
+# Cache of the current process
+analysis_cache = AnalysisCache()
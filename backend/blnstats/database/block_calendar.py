@@ -0,0 +1,205 @@
+import logging
+import numpy as np
+from ..database.utils import get_db_connection, BULK_INSERT_CHUNK_SIZE
+from ..database.analysis_cache import analysis_cache
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+# Blocks below the highest known block which are re-read on every refresh (the blockchain sync overwrites tip blocks)
+CALENDAR_REFRESH_OVERLAP = 10
+
+
+
+class BlockCalendar:
+    '''
+    In-memory index of Blockchain_Blocks answering calendar queries by binary search.
+
+    Blocks are held as arrays sorted by block height (height, timestamp, date as days since 1970-01-01).
+    From them two derived indexes are built:
+        - the first (lowest) block of every date, sorted by date, for first-block-of-day and date-mask queries,
+        - the blocks sorted by timestamp with the running maximum height, for height-at-time queries.
+
+    Block timestamps are not monotonic in height, so neither index can be read off the height order directly.
+    '''
+
+
+    def __init__(self, heights, timestamps, days):
+        '''
+        :param heights: iterable - Block heights
+        :param timestamps: iterable - Block timestamps (unix time)
+        :param days: iterable - Block dates (Blockchain_Blocks.Date) as days since 1970-01-01
+        '''
+        heights = np.asarray(heights, dtype=np.int64)
+        order = np.argsort(heights, kind='stable')
+        self.heights = heights[order]
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)[order]
+        self.days = np.asarray(days, dtype=np.int64)[order]
+        self.__build_indexes()
+
+
+
+
+    def __build_indexes(self):
+        # First block of every date: sort by (date, height) and keep the first block of each date
+        order = np.lexsort((self.heights, self.days))
+        sortedDays = self.days[order]
+        first = np.ones(len(sortedDays), dtype=bool)
+        first[1:] = sortedDays[1:] != sortedDays[:-1]
+        self.day_numbers = sortedDays[first]
+        self.day_first_heights = self.heights[order][first]
+        self.day_first_timestamps = self.timestamps[order][first]
+
+        # 'YYYY-MM-DD' of every date, one character per column, for date masks
+        self.day_strings = np.datetime_as_string(self.day_numbers.astype('datetime64[D]'), unit='D').astype('U10')
+        self.day_chars = self.day_strings.view('U1').reshape(len(self.day_strings), 10)
+
+        # Highest block mined at or before every timestamp
+        order = np.argsort(self.timestamps, kind='stable')
+        self.sorted_timestamps = self.timestamps[order]
+        self.max_height_until = np.maximum.accumulate(self.heights[order]) if len(order) > 0 else self.heights[order]
+
+
+
+
+    @staticmethod
+    def __read_blocks(db_cursor, fromHeight=-1):
+        '''
+        :return: tuple - (heights, timestamps, days) of the blocks above fromHeight
+        '''
+        db_cursor.execute('''
+            SELECT BlockHeight, Timestamp, DATEDIFF(Date, '1970-01-01')
+            FROM Blockchain_Blocks
+            WHERE BlockHeight > %s
+            ORDER BY BlockHeight
+        ''', (fromHeight,))
+        heights, timestamps, days = [], [], []
+        while True:
+            rows = db_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE)
+            if(len(rows) == 0):
+                break
+            for height, timestamp, day in rows:
+                heights.append(height)
+                timestamps.append(timestamp)
+                days.append(day)
+        return heights, timestamps, days
+
+
+
+
+    @staticmethod
+    def load():
+        '''
+        Builds the calendar from all rows of Blockchain_Blocks.
+
+        :return: BlockCalendar
+        '''
+        with get_db_connection() as db_conn:
+            with db_conn.cursor(buffered=False) as db_cursor:
+                heights, timestamps, days = BlockCalendar.__read_blocks(db_cursor)
+
+        logger.info(f"Loaded block calendar of {len(heights)} blocks")
+        return BlockCalendar(heights, timestamps, days)
+
+
+
+
+    def refresh(self):
+        '''
+        Reads the blocks added since the last refresh (and re-reads the last CALENDAR_REFRESH_OVERLAP blocks).
+        Falls back to a full reload if blocks were added below the highest known block.
+        '''
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('SELECT COUNT(*), COALESCE(MAX(BlockHeight), -1) FROM Blockchain_Blocks')
+                blockCount, maxHeight = db_cursor.fetchone()
+
+            with db_conn.cursor(buffered=False) as db_cursor:
+                keep = self.heights <= (self.heights[-1] if len(self.heights) > 0 else -1) - CALENDAR_REFRESH_OVERLAP
+                fromHeight = int(self.heights[keep][-1]) if keep.any() else -1
+                heights, timestamps, days = BlockCalendar.__read_blocks(db_cursor, fromHeight)
+
+                if(int(keep.sum()) + len(heights) != blockCount):
+                    logger.info(f"Blockchain_Blocks has {blockCount} blocks up to {maxHeight}, reloading the block calendar")
+                    heights, timestamps, days = BlockCalendar.__read_blocks(db_cursor)
+                    keep = np.zeros(len(self.heights), dtype=bool)
+
+        self.heights = np.concatenate([self.heights[keep], np.array(heights, dtype=np.int64)])
+        self.timestamps = np.concatenate([self.timestamps[keep], np.array(timestamps, dtype=np.int64)])
+        self.days = np.concatenate([self.days[keep], np.array(days, dtype=np.int64)])
+        self.__build_indexes()
+
+
+
+
+    def first_blocks_of_days(self, startSince='2018-01-01', endUntil='9999-12-31', dateMask=None, weekday=None):
+        '''
+        First block of every date between startSince and endUntil (both inclusive) which has blocks.
+
+        :param startSince: str - First date (format: 'YYYY-MM-DD')
+        :param endUntil: str - Last date (format: 'YYYY-MM-DD')
+        :param dateMask: str - Only dates matching the mask, 'X' (or '_') matches any character (e.g. '20XX-XX-01')
+        :param weekday: int - Only dates of this weekday (0 = Monday ... 6 = Sunday)
+        :return: tuple - (dates as 'YYYY-MM-DD' strings, block heights, timestamps) sorted by date
+        '''
+        start = np.searchsorted(self.day_numbers, np.datetime64(startSince, 'D').astype(np.int64), side='left')
+        end = np.searchsorted(self.day_numbers, np.datetime64(endUntil, 'D').astype(np.int64), side='right')
+        selected = np.arange(start, end)
+
+        if(dateMask is not None):
+            if(len(dateMask) != 10):
+                raise ValueError(f"Invalid date mask: {dateMask} (expected format: 'YYYY-MM-DD' with 'X' wildcards)")
+            matches = np.ones(len(selected), dtype=bool)
+            for position, character in enumerate(dateMask):
+                if(character not in ('X', '_')):
+                    matches &= self.day_chars[selected, position] == character
+            selected = selected[matches]
+
+        if(weekday is not None):
+            # 1970-01-01 was a Thursday (3)
+            selected = selected[(self.day_numbers[selected] + 3) % 7 == weekday]
+
+        return self.day_strings[selected].tolist(), self.day_first_heights[selected].tolist(), self.day_first_timestamps[selected].tolist()
+
+
+
+
+    def height_at_time(self, timestamp):
+        '''
+        :param timestamp: int - Unix timestamp
+        :return: int - Highest block height mined at or before the timestamp, or None if there is none
+        '''
+        position = np.searchsorted(self.sorted_timestamps, timestamp, side='right') - 1
+        if(position < 0):
+            return None
+        return int(self.max_height_until[position])
+
+
+
+
+# Calendar of the current process and the data version it was refreshed at
+_block_calendar = None
+_block_calendar_version = None
+
+
+
+def get_block_calendar():
+    '''
+    Returns the block calendar of the current process, loading it on first use and refreshing it
+    incrementally whenever the data version of the current run (see AnalysisCache.begin_run) has changed
+    since the last refresh.
+
+    :return: BlockCalendar
+    '''
+    global _block_calendar, _block_calendar_version
+    dataVersion = analysis_cache.current_data_version()
+    if(_block_calendar is None):
+        _block_calendar = BlockCalendar.load()
+    elif(dataVersion != _block_calendar_version):
+        _block_calendar.refresh()
+    _block_calendar_version = dataVersion
+    return _block_calendar
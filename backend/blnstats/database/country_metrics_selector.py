@@ -0,0 +1,157 @@
+import logging
+from datetime import datetime
+from ..database.analysis_cache import analysis_cache
+from ..database.utils import get_db_connection, BULK_INSERT_CHUNK_SIZE
+from ..data_types import CompactVerticesAspectDataStructure, BlockchainBlockHeightsStructure
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+class CountryMetricsSelector:
+    '''
+    Class for fetching preprocessed country metrics from the database such as channel counts and capacities at specific block heights.
+    Nodes are attributed to countries through the Lightning_NodeCountries table; nodes without a geolocated clearnet address are not included.
+    '''
+
+
+    def get_channel_count_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+        """
+        Retrieves the channel count metrics of Lightning Network countries at specific block heights.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :return: CompactVerticesAspectDataStructure - A data structure containing country codes and their channel counts.
+        """
+        return self.__get_metrics(blockHeightsStructure, ['ChannelCount'])[0]
+
+
+
+
+
+    def get_capacity_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+        """
+        Retrieves the capacity metrics of Lightning Network countries at specific block heights.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :return: CompactVerticesAspectDataStructure - A data structure containing country codes and their capacities.
+        """
+        return self.__get_metrics(blockHeightsStructure, ['Capacity'])[0]
+
+
+
+
+
+    def get_capacity_and_channel_count_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+        """
+        Retrieves both the capacity and the channel count metrics of Lightning Network countries at specific block heights
+        from one scan, for callers which need both.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :return: tuple - (capacities, channel counts) CompactVerticesAspectDataStructures with the same block heights.
+        """
+        capacityResults, channelCountResults = self.__get_metrics(blockHeightsStructure, ['Capacity', 'ChannelCount'])
+
+        return capacityResults, channelCountResults
+
+
+
+
+
+    def __get_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, metricColumns: list):
+        """
+        Returns the requested metrics from the process-wide analysis cache, reading only the missing ones from the database.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param metricColumns: list - 'Capacity' and/or 'ChannelCount'
+        :return: list - CompactVerticesAspectDataStructure of every requested metric
+        """
+        blockHeights = list(blockHeightsStructure.data.keys())
+        resultsByColumn = {metricColumn: analysis_cache.get('Countries', metricColumn, blockHeights) for metricColumn in metricColumns}
+
+        missingResults = {metricColumn: self.__new_results(metricColumn) for metricColumn in metricColumns if resultsByColumn[metricColumn] is None}
+        if(len(missingResults) > 0):
+            self.__fill_metrics(blockHeightsStructure, missingResults)
+            for metricColumn, results in missingResults.items():
+                analysis_cache.put('Countries', metricColumn, blockHeights, results)
+                resultsByColumn[metricColumn] = results
+
+        return [resultsByColumn[metricColumn] for metricColumn in metricColumns]
+
+
+
+
+
+    def __new_results(self, metricColumn: str):
+        """
+        :param metricColumn: str - 'Capacity' or 'ChannelCount'
+        :return: CompactVerticesAspectDataStructure - Empty structure with the metadata of the metric
+        """
+        descriptions = {
+            'Capacity': "Countries capacities on given block heights",
+            'ChannelCount': "Countries channel counts on given block heights"
+        }
+
+        # Initialize the CompactVerticesAspectDataStructure with metadata
+        return CompactVerticesAspectDataStructure(
+            meta={
+                "type": "VerticesAspectDataStructure",
+                "description": descriptions[metricColumn],
+                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "xAxis": "BlockHeight",
+                "yAxis": f"List(CountryCode,{metricColumn})",
+                "yAxisSupplyChain": ["BlockHeight"]
+            }
+        )
+
+
+
+
+
+    def __fill_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, resultsByColumn: dict):
+        """
+        Sums node metrics per country at all block heights with a single query ordered by block height. The rows
+        are streamed with an unbuffered cursor into the value arrays of their block height. Until node countries
+        have been geolocated (Lightning_NodeCountries does not exist yet) every block height is left empty.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param resultsByColumn: dict - {_CACHED1_NodeMetrics column to sum ('Capacity' or 'ChannelCount'): CompactVerticesAspectDataStructure to add the country vertices to}
+        """
+        blockHeights = list(blockHeightsStructure.data.keys())
+        metricColumns = list(resultsByColumn.keys())
+        if(len(blockHeights) == 0):
+            return
+
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('SHOW TABLES LIKE %s', ('Lightning_NodeCountries',))
+                if(db_cursor.fetchone() is None):
+                    logger.warning('Lightning_NodeCountries does not exist, country metrics are empty')
+                    CompactVerticesAspectDataStructure.fill_from_rows(list(resultsByColumn.values()), blockHeightsStructure, [])
+                    return
+
+            with db_conn.cursor(buffered=False) as db_cursor:
+                placeholders = ', '.join(['%s'] * len(blockHeights))
+                db_cursor.execute(f'''
+                    SELECT
+                        _CACHED1_NodeMetrics.BlockHeight,
+                        Lightning_NodeCountries.CountryCode,
+                        {', '.join(f'SUM(_CACHED1_NodeMetrics.{metricColumn}) AS {metricColumn}' for metricColumn in metricColumns)}
+                    FROM
+                        _CACHED1_NodeMetrics
+                    JOIN Lightning_Nodes
+                        ON Lightning_Nodes.NodeIndex = _CACHED1_NodeMetrics.NodeIndex
+                    JOIN Lightning_NodeCountries
+                        ON Lightning_NodeCountries.NodeID = LOWER(HEX(Lightning_Nodes.NodeID))
+                    WHERE
+                        _CACHED1_NodeMetrics.BlockHeight IN ({placeholders})
+                    GROUP BY _CACHED1_NodeMetrics.BlockHeight, Lightning_NodeCountries.CountryCode
+                    ORDER BY _CACHED1_NodeMetrics.BlockHeight
+                ''', [int(blockHeight) for blockHeight in blockHeights])
+
+                CompactVerticesAspectDataStructure.fill_from_rows(
+                    list(resultsByColumn.values()), blockHeightsStructure,
+                    iter(lambda: db_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE), [])
+                )
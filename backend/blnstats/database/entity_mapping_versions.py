@@ -0,0 +1,144 @@
+import io
+import hashlib
+import logging
+import numpy as np
+from ..database.utils import get_db_connection, get_system_setting, set_system_setting
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+CURRENT_VERSION_SETTING = 'EntityMapping-CurrentVersion'
+
+# Number of most recent mapping versions kept besides the current one
+MAPPING_VERSIONS_KEPT = 5
+
+
+
+def create_entity_mapping_versions_table_if_not_exists(db_cursor):
+    db_cursor.execute('''
+        CREATE TABLE IF NOT EXISTS `Lightning_EntityMappingVersions` (
+            `VersionID` INT AUTO_INCREMENT NOT NULL,
+            `ContentHash` CHAR(64) NOT NULL,
+            `NodeCount` INT NOT NULL,
+            `EntityCount` INT NOT NULL,
+            `Mapping` LONGBLOB NOT NULL,
+            `Created` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (`VersionID`),
+            UNIQUE KEY `unique_content_hash` (`ContentHash`)
+        );
+    ''')
+
+
+
+def compute_entity_mapping_hash(entities):
+    '''
+    Content hash of a NodeID -> EntityName mapping (independent of its order).
+
+    :param entities: dict - {NodeID: EntityName}
+    :return: str - SHA-256 hex digest
+    '''
+    digest = hashlib.sha256()
+    for node_id in sorted(entities.keys()):
+        digest.update(f'{node_id}\t{entities[node_id]}\n'.encode())
+    return digest.hexdigest()
+
+
+
+def get_current_entity_mapping_version():
+    '''
+    :return: int - ID of the entity mapping version currently in Lightning_Entities (0 if none was recorded)
+    '''
+    return int(get_system_setting(CURRENT_VERSION_SETTING, 0))
+
+
+
+def set_current_entity_mapping_version(version_id, db_cursor=None):
+    '''
+    Records the entity mapping version held by Lightning_Entities. Must only be called once the table holds it.
+
+    :param version_id: int - Version ID (0 if the content of Lightning_Entities is unknown)
+    :param db_cursor: Optional cursor to write the setting with, so it is committed in the same transaction as the table
+    '''
+    if(db_cursor is None):
+        set_system_setting(CURRENT_VERSION_SETTING, version_id)
+        return
+    db_cursor.execute('''
+        INSERT INTO System_Settings (`Key`, `Value`) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE `Value` = VALUES(`Value`)
+    ''', (CURRENT_VERSION_SETTING, str(version_id)))
+
+
+
+def save_entity_mapping_version(entities):
+    '''
+    Records a NodeID -> EntityName mapping as a new version unless an identical one already exists.
+    Versions are stored as a compressed NodeID-index to entity-index array. Apart from the current version,
+    only the MAPPING_VERSIONS_KEPT most recent versions are kept; older ones are deleted in the same transaction.
+
+    The mapping does not become the current version (see set_current_entity_mapping_version).
+
+    :param entities: dict - {NodeID: EntityName}
+    :return: tuple - (version ID, True if the mapping differs from the current version)
+    '''
+    content_hash = compute_entity_mapping_hash(entities)
+    current_version_id = get_current_entity_mapping_version()
+
+    with get_db_connection() as db_conn:
+        with db_conn.cursor() as db_cursor:
+            create_entity_mapping_versions_table_if_not_exists(db_cursor)
+
+            db_cursor.execute('SELECT VersionID FROM Lightning_EntityMappingVersions WHERE ContentHash = %s', (content_hash,))
+            row = db_cursor.fetchone()
+            if(row is not None):
+                version_id = row[0]
+            else:
+                node_ids = np.array(sorted(entities.keys()), dtype=str)
+                entity_names, node_entities = np.unique(np.array([entities[node_id] for node_id in node_ids.tolist()], dtype=str), return_inverse=True)
+
+                buffer = io.BytesIO()
+                np.savez_compressed(buffer, node_ids=node_ids, entity_names=entity_names, node_entities=node_entities.astype(np.int32))
+
+                db_cursor.execute('''
+                    INSERT INTO Lightning_EntityMappingVersions (ContentHash, NodeCount, EntityCount, Mapping)
+                    VALUES (%s, %s, %s, %s)
+                ''', (content_hash, len(node_ids), len(entity_names), buffer.getvalue()))
+                version_id = db_cursor.lastrowid
+                logger.info(f'Saved entity mapping version {version_id} ({len(node_ids)} nodes, {len(entity_names)} entities)')
+
+            ##### Delete all but the current and the most recent versions
+            db_cursor.execute('SELECT VersionID FROM Lightning_EntityMappingVersions ORDER BY VersionID DESC LIMIT %s', (MAPPING_VERSIONS_KEPT,))
+            kept_version_ids = [row[0] for row in db_cursor.fetchall()] + [current_version_id, version_id]
+            db_cursor.execute(f'''
+                DELETE FROM Lightning_EntityMappingVersions
+                WHERE VersionID NOT IN ({', '.join(['%s'] * len(kept_version_ids))})
+            ''', tuple(kept_version_ids))
+            if(db_cursor.rowcount > 0):
+                logger.info(f'Deleted {db_cursor.rowcount} old entity mapping versions')
+            db_conn.commit()
+
+    return version_id, version_id != current_version_id
+
+
+
+def load_entity_mapping_version(version_id):
+    '''
+    Loads a recorded entity mapping version.
+
+    :param version_id: int - Version ID
+    :return: dict - {NodeID: EntityName}, or None if the version does not exist
+    '''
+    with get_db_connection() as db_conn:
+        with db_conn.cursor() as db_cursor:
+            create_entity_mapping_versions_table_if_not_exists(db_cursor)
+            db_cursor.execute('SELECT Mapping FROM Lightning_EntityMappingVersions WHERE VersionID = %s', (version_id,))
+            row = db_cursor.fetchone()
+
+    if(row is None):
+        return None
+    with np.load(io.BytesIO(row[0])) as mapping:
+        entity_names = mapping['entity_names']
+        return dict(zip(mapping['node_ids'].tolist(), entity_names[mapping['node_entities']].tolist()))
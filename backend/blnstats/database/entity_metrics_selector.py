@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime
-from ..database.utils import get_db_connection
-from ..data_types import VerticesAspectDataStructure, BlockchainBlockHeightsStructure
+from ..database.analysis_cache import analysis_cache
+from ..database.utils import get_db_connection, BULK_INSERT_CHUNK_SIZE
+from ..data_types import CompactVerticesAspectDataStructure, BlockchainBlockHeightsStructure
 
 
 
@@ -13,6 +14,8 @@ logger = logging.getLogger(__name__)
 class EntityMetricsSelector:
     '''
     Class for fetching preprocessed entity metrics from the database such as channel counts and capacities at specific block heights.
+    Nodes are grouped into the entities they belonged to at the time of every block (see EntityTimeline); the
+    aggregates are read from `_CACHED2_EntityMetrics`, which the transform step keeps up to date (see EntityMetrics).
     '''
 
 
@@ -21,119 +24,118 @@ class EntityMetricsSelector:
         Retrieves the channel count metrics of Lightning Network entities at specific block heights.
         
         :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
-        :return: VerticesAspectDataStructure - A data structure containing entity names and their channel counts.
+        :return: CompactVerticesAspectDataStructure - A data structure containing entity names and their channel counts.
         """
+        return self.__get_metrics(blockHeightsStructure, ['ChannelCount'])[0]
 
-        # Extract block heights
-        blockHeights = list(blockHeightsStructure.data.keys())
 
-        # Initialize the VerticesAspectDataStructure with metadata
-        results = VerticesAspectDataStructure(
-            meta={
-                "type": "VerticesAspectDataStructure",
-                "description": "Entities channel counts on given block heights",
-                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "xAxis": "BlockHeight",
-                "yAxis": "List(EntityName,ChannelCount)",
-                "yAxisSupplyChain": ["BlockHeight"]
-            },
-            data={}
-        )
 
-        with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                for blockHeight in blockHeights:
-                    
-                    db_cursor.execute('''
-                        SELECT 
-                            Lightning_Entities.EntityName,
-                            SUM(_CACHED1_NodeMetrics.ChannelCount) AS ChannelCount
-                        FROM
-                            _CACHED1_NodeMetrics
-                        LEFT JOIN Lightning_Entities 
-                            ON _CACHED1_NodeMetrics.NodeID = Lightning_Entities.NodeID
-                        WHERE 
-                            BlockHeight = %s
-                        GROUP BY Lightning_Entities.EntityName
-                    ''',
-                        (blockHeight,)
-                    )
-                    
-                    rows = db_cursor.fetchall()
-                    vertices = []
-                    for row in rows:
-                        # Create VerticeData instances
-                        vertex = VerticesAspectDataStructure.VerticeData(name=row['EntityName'], value=int(row['ChannelCount']))
-                        vertices.append(vertex)
-                    
-                    # Add the vertices data to the results
-                    results.data[str(blockHeight)] = VerticesAspectDataStructure.VerticeEntry(
-                        date=blockHeightsStructure.data[blockHeight].date,
-                        timestamp=blockHeightsStructure.data[blockHeight].timestamp,
-                        vertices=vertices
-                    )
+
+
+    def get_capacity_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+        """
+        Retrieves the capacity metrics of Lightning Network entities at specific block heights.
         
-        return results
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :return: CompactVerticesAspectDataStructure - A data structure containing entity names and their capacities.
+        """
+        return self.__get_metrics(blockHeightsStructure, ['Capacity'])[0]
 
 
 
 
 
-    def get_capacity_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+    def get_capacity_and_channel_count_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
         """
-        Retrieves the capacity metrics of Lightning Network entities at specific block heights.
-        
+        Retrieves both the capacity and the channel count metrics of Lightning Network entities at specific block heights
+        from one scan, for callers which need both.
+
         :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
-        :return: VerticesAspectDataStructure - A data structure containing entity names and their capacities.
+        :return: tuple - (capacities, channel counts) CompactVerticesAspectDataStructures with the same block heights.
+        """
+        capacityResults, channelCountResults = self.__get_metrics(blockHeightsStructure, ['Capacity', 'ChannelCount'])
+
+        return capacityResults, channelCountResults
+
+
+
+
+
+    def __get_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, metricColumns: list):
         """
+        Returns the requested metrics from the process-wide analysis cache, reading only the missing ones from the database.
 
-        # Extract block heights
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param metricColumns: list - 'Capacity' and/or 'ChannelCount'
+        :return: list - CompactVerticesAspectDataStructure of every requested metric
+        """
         blockHeights = list(blockHeightsStructure.data.keys())
+        resultsByColumn = {metricColumn: analysis_cache.get('Entities', metricColumn, blockHeights) for metricColumn in metricColumns}
+
+        missingResults = {metricColumn: self.__new_results(metricColumn) for metricColumn in metricColumns if resultsByColumn[metricColumn] is None}
+        if(len(missingResults) > 0):
+            self.__fill_metrics(blockHeightsStructure, missingResults)
+            for metricColumn, results in missingResults.items():
+                analysis_cache.put('Entities', metricColumn, blockHeights, results)
+                resultsByColumn[metricColumn] = results
+
+        return [resultsByColumn[metricColumn] for metricColumn in metricColumns]
+
+
 
-        # Initialize the VerticesAspectDataStructure with metadata
-        results = VerticesAspectDataStructure(
+
+
+    def __new_results(self, metricColumn: str):
+        """
+        :param metricColumn: str - 'Capacity' or 'ChannelCount'
+        :return: CompactVerticesAspectDataStructure - Empty structure with the metadata of the metric
+        """
+        descriptions = {
+            'Capacity': "Entities capacities on given block heights",
+            'ChannelCount': "Entities channel counts on given block heights"
+        }
+
+        # Initialize the CompactVerticesAspectDataStructure with metadata
+        return CompactVerticesAspectDataStructure(
             meta={
                 "type": "VerticesAspectDataStructure",
-                "description": "Entities capacities on given block heights",
+                "description": descriptions[metricColumn],
                 "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "xAxis": "BlockHeight",
-                "yAxis": "List(EntityName,Capacity)",
+                "yAxis": f"List(EntityName,{metricColumn})",
                 "yAxisSupplyChain": ["BlockHeight"]
-            },
-            data={}
+            }
         )
-        
+
+
+
+
+
+    def __fill_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, resultsByColumn: dict):
+        """
+        Reads entity metrics at every block height from `_CACHED2_EntityMetrics`.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param resultsByColumn: dict - {_CACHED2_EntityMetrics column ('Capacity' or 'ChannelCount'): CompactVerticesAspectDataStructure to add the entity vertices to}
+        """
+        blockHeights = list(blockHeightsStructure.data.keys())
+        metricColumns = list(resultsByColumn.keys())
+        if(len(blockHeights) == 0):
+            return
+
+        # All block heights in one query, streamed in block height order and split into entries as the rows arrive
         with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                for blockHeight in blockHeights:
-                    
-                    db_cursor.execute('''
-                        SELECT 
-                            Lightning_Entities.EntityName,
-                            SUM(_CACHED1_NodeMetrics.Capacity) AS Capacity
-                        FROM
-                            _CACHED1_NodeMetrics
-                        LEFT JOIN Lightning_Entities 
-                            ON _CACHED1_NodeMetrics.NodeID = Lightning_Entities.NodeID
-                        WHERE 
-                            BlockHeight = %s
-                        GROUP BY Lightning_Entities.EntityName
-                    ''',
-                        (blockHeight,)
-                    )
-                    
-                    rows = db_cursor.fetchall()
-                    vertices = []
-                    for row in rows:
-                        # Create VerticeData instances
-                        vertex = VerticesAspectDataStructure.VerticeData(name=row['EntityName'], value=int(row['Capacity']))
-                        vertices.append(vertex)
-                    
-                    # Add the vertices data to the results
-                    results.data[str(blockHeight)] = VerticesAspectDataStructure.VerticeEntry(
-                        date=blockHeightsStructure.data[blockHeight].date,
-                        timestamp=blockHeightsStructure.data[blockHeight].timestamp,
-                        vertices=vertices
-                    )
-        
-        return results
\ No newline at end of file
+            with db_conn.cursor(buffered=False) as db_cursor:
+                placeholders = ', '.join(['%s'] * len(blockHeights))
+                db_cursor.execute(f'''
+                    SELECT M.BlockHeight, E.EntityName, {', '.join('M.' + metricColumn for metricColumn in metricColumns)}
+                    FROM _CACHED2_EntityMetrics M
+                    JOIN Lightning_EntityNames E ON E.EntityIndex = M.EntityIndex
+                    WHERE M.BlockHeight IN ({placeholders})
+                    ORDER BY M.BlockHeight
+                ''', [int(blockHeight) for blockHeight in blockHeights])
+
+                CompactVerticesAspectDataStructure.fill_from_rows(
+                    list(resultsByColumn.values()), blockHeightsStructure,
+                    iter(lambda: db_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE), [])
+                )
@@ -0,0 +1,212 @@
+import hashlib
+import logging
+from collections import defaultdict
+import numpy as np
+from ..database.utils import get_db_connection
+
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+
+# First seen time of nodes that are never part of a multi-node entity
+NEVER_SEEN = np.iinfo(np.int64).max
+
+
+
+class EntityTimeline:
+    '''
+    Interval index answering "entity of node N at time T" for many nodes at once.
+
+    Every node gets a sequence of non-overlapping segments built from its Lightning_NodeAliases
+    firstSeen/lastSeen intervals. At any time the active alias is the most recently adopted alias
+    still being announced, or the last one seen before that time. Nodes which are clustered together
+    with other nodes in Lightning_Entities keep their entity name for the whole timeline.
+    Before its first announcement a node is its own entity, named after its NodeID.
+
+    Segments belong to the cluster of their node (its Lightning_Entities name), so unrelated clusters
+    which used the same alias at some time stay separate entities; such shared aliases are told apart
+    by the first NodeID of the cluster, like equal cluster names in entity_clustering.cluster_nodes.
+
+    Segments are stored sorted by (node, start), so resolving a whole snapshot is a single searchsorted.
+    '''
+
+
+    def __init__(self, node_aliases, entities):
+        '''
+        :param node_aliases: iterable - (NodeID, Alias, firstSeen, lastSeen) tuples with unix timestamps
+        :param entities: dict - {NodeID: EntityName} current entity mapping (Lightning_Entities)
+        '''
+        intervals_by_node = defaultdict(list)
+        for node_id, alias, first_seen, last_seen in node_aliases:
+            intervals_by_node[node_id].append((int(first_seen), int(last_seen), alias))
+
+        # Nodes sharing an entity name with other nodes are clusters: their name does not follow the alias history
+        cluster_sizes = defaultdict(int)
+        for entity_name in entities.values():
+            cluster_sizes[entity_name] += 1
+
+        self.node_ids = np.array(sorted(set(intervals_by_node.keys()) | set(entities.keys())), dtype=str)
+        segment_nodes, segment_starts, segment_labels = [], [], []
+        node_first_seen = []
+        cluster_first_nodes = {}
+        for node_idx, node_id in enumerate(self.node_ids.tolist()):
+            entity_name = entities.get(node_id)
+            clustered = entity_name is not None and cluster_sizes[entity_name] > 1
+            own_label = node_id[0:20]
+
+            # Labels are keyed per cluster; nodes missing from the mapping are clusters of their own
+            cluster = entity_name if entity_name is not None else node_id
+            cluster_first_nodes.setdefault(cluster, node_id)
+
+            if(clustered or node_id not in intervals_by_node):
+                segments = [(0, entity_name if entity_name is not None else own_label)]
+            else:
+                segments = EntityTimeline.build_segments(intervals_by_node[node_id])
+                if(segments[0][0] > 0):
+                    segments.insert(0, (0, None))
+
+            # The mapping hash covers a node from the time its entity depends on the mapping
+            if(clustered or (node_id not in intervals_by_node and segments[0][1] != own_label)):
+                node_first_seen.append(0)
+            elif(node_id in intervals_by_node):
+                node_first_seen.append(segments[1][0] if segments[0][1] is None else segments[0][0])
+            else:
+                node_first_seen.append(NEVER_SEEN)
+
+            for start, label in segments:
+                segment_nodes.append(node_idx)
+                segment_starts.append(start)
+                segment_labels.append((cluster, own_label if label is None else label))
+
+        # Entity names: the label, unless other clusters used it too (the cluster currently named so keeps it)
+        label_clusters = defaultdict(set)
+        for cluster, label in segment_labels:
+            label_clusters[label].add(cluster)
+        segment_names = [
+            label if len(label_clusters[label]) == 1 or cluster == label else f'{label} [{cluster_first_nodes[cluster][0:8]}]'
+            for cluster, label in segment_labels
+        ]
+
+        self.entity_names, segment_entities = np.unique(np.array(segment_names, dtype=str), return_inverse=True)
+        self.segment_nodes = np.array(segment_nodes, dtype=np.int64)
+        self.segment_starts = np.array(segment_starts, dtype=np.int64)
+        self.segment_entities = segment_entities.astype(np.int64)
+        self.segment_keys = EntityTimeline.__key(self.segment_nodes, self.segment_starts)
+        self.node_first_seen = np.array(node_first_seen, dtype=np.int64)
+
+        # Per node and per entity hashes, combined into mapping hashes
+        self.node_hashes = EntityTimeline.__hash_strings(self.node_ids)
+        self.entity_hashes = EntityTimeline.__hash_strings(self.entity_names)
+
+
+
+
+    @staticmethod
+    def __key(node_indexes, timestamps):
+        # Timestamps fit into 32 bits, so (node, time) pairs sort as a single integer
+        return (node_indexes.astype(np.int64) << 32) | np.clip(timestamps, 0, 0xFFFFFFFF).astype(np.int64)
+
+
+
+
+    @staticmethod
+    def __hash_strings(strings):
+        return np.array([int.from_bytes(hashlib.blake2b(string.encode(), digest_size=8).digest(), 'little') for string in strings.tolist()], dtype=np.uint64)
+
+
+
+
+    @staticmethod
+    def build_segments(intervals):
+        '''
+        Splits the alias intervals of one node into non-overlapping segments.
+
+        :param intervals: list - (firstSeen, lastSeen, alias) tuples
+        :return: list - (start, alias) tuples sorted by start; each alias is active until the next start
+        '''
+        breakpoints = sorted(set([first_seen for first_seen, _, _ in intervals] + [last_seen + 1 for _, last_seen, _ in intervals]))
+        segments = []
+        for start in breakpoints:
+            covering = [interval for interval in intervals if interval[0] <= start <= interval[1]]
+            if(len(covering) > 0):
+                alias = max(covering, key=lambda interval: (interval[0], interval[1]))[2]
+            else:
+                # Nothing announced at this time: keep the alias seen last before it
+                alias = max((interval for interval in intervals if interval[1] < start), key=lambda interval: interval[1])[2]
+            if(len(segments) == 0 or segments[-1][1] != alias):
+                segments.append((start, alias))
+        return segments
+
+
+
+
+    def resolve(self, node_ids, timestamp):
+        '''
+        Resolves the entities of the given nodes at the given time in one vectorized pass.
+
+        :param node_ids: list or np.ndarray - NodeIDs
+        :param timestamp: int - Unix timestamp
+        :return: np.ndarray(int64) - Index into self.entity_names for every node
+        '''
+        node_ids = np.asarray(node_ids, dtype=str)
+        entities = np.full(len(node_ids), -1, dtype=np.int64)
+        if(len(node_ids) == 0 or len(self.node_ids) == 0):
+            return entities
+
+        node_positions = np.searchsorted(self.node_ids, node_ids)
+        node_positions_clipped = np.minimum(node_positions, len(self.node_ids) - 1)
+        known = self.node_ids[node_positions_clipped] == node_ids
+
+        # Last segment starting at or before the timestamp (every node has a segment starting at 0)
+        query_keys = EntityTimeline.__key(node_positions_clipped, np.full(len(node_ids), timestamp, dtype=np.int64))
+        segment_positions = np.searchsorted(self.segment_keys, query_keys, side='right') - 1
+
+        entities[known] = self.segment_entities[segment_positions[known]]
+        return entities
+
+
+
+
+    def mapping_hash(self, timestamp):
+        '''
+        Hash of the entity mapping in effect at the given time: the entities of all nodes whose entity at that
+        time depends on the mapping, i.e. clustered nodes and nodes announced by then. Every other node is an
+        entity of its own named after its NodeID, which no mapping change affects.
+
+        :param timestamp: int - Unix timestamp
+        :return: str - SHA-256 hex digest
+        '''
+        seen = np.flatnonzero(self.node_first_seen <= timestamp)
+        entities = self.resolve(self.node_ids[seen], timestamp)
+        digest = hashlib.sha256()
+        digest.update(self.node_hashes[seen].tobytes())
+        digest.update(self.entity_hashes[entities].tobytes())
+        return digest.hexdigest()
+
+
+
+
+    @staticmethod
+    def load():
+        '''
+        Builds the timeline from Lightning_NodeAliases and Lightning_Entities.
+
+        :return: EntityTimeline
+        '''
+        with get_db_connection() as db_conn:
+            with db_conn.cursor() as db_cursor:
+                db_cursor.execute('''
+                    SELECT NodeID, Alias, UNIX_TIMESTAMP(firstSeen), UNIX_TIMESTAMP(lastSeen)
+                    FROM Lightning_NodeAliases
+                    WHERE firstSeen IS NOT NULL AND lastSeen IS NOT NULL
+                ''')
+                node_aliases = db_cursor.fetchall()
+
+                db_cursor.execute('SELECT NodeID, EntityName FROM Lightning_Entities')
+                entities = {node_id: entity_name for node_id, entity_name in db_cursor.fetchall()}
+
+        logger.info(f'Building entity timeline from {len(node_aliases)} aliases of {len(entities)} nodes')
+        return EntityTimeline(node_aliases, entities)
@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime
-from ..database.utils import get_db_connection
-from ..data_types import VerticesAspectDataStructure, BlockchainBlockHeightsStructure
+from ..database.analysis_cache import analysis_cache
+from ..database.utils import get_db_connection, binary_to_hex, BULK_INSERT_CHUNK_SIZE
+from ..data_types import CompactVerticesAspectDataStructure, BlockchainBlockHeightsStructure
 
 
 
@@ -21,99 +22,118 @@ class NodeMetricsSelector:
         Retrieves the channel count metrics of Lightning Network nodes at specific block heights.
         
         :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
-        :return: VerticesAspectDataStructure - A data structure containing node IDs and their channel counts.
+        :return: CompactVerticesAspectDataStructure - A data structure containing node IDs and their channel counts.
         """
+        return self.__get_metrics(blockHeightsStructure, ['ChannelCount'])[0]
 
-        # Extract block heights
-        blockHeights = list(blockHeightsStructure.data.keys())
 
-        # Initialize the VerticesAspectDataStructure with metadata
-        results = VerticesAspectDataStructure(
-            meta={
-                "type": "VerticesAspectDataStructure",
-                "description": "Nodes channel counts on given block heights",
-                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "xAxis": "BlockHeight",
-                "yAxis": "List(NodeID,ChannelCount)",
-                "yAxisSupplyChain": ["BlockHeight"]
-            },
-            data={}
-        )
 
-        with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                for blockHeight in blockHeights:
-                    
-                    db_cursor.execute(
-                        'SELECT NodeID, ChannelCount FROM _CACHED1_NodeMetrics WHERE BlockHeight = %s',
-                        (blockHeight,)
-                    )
-                    
-                    rows = db_cursor.fetchall()
-                    vertices = []
-                    for row in rows:
-                        # Create VerticeData instances
-                        vertex = VerticesAspectDataStructure.VerticeData(name=row['NodeID'], value=int(row['ChannelCount']))
-                        vertices.append(vertex)
-                    
-                    # Add the vertices data to the results
-                    results.data[str(blockHeight)] = VerticesAspectDataStructure.VerticeEntry(
-                        date=blockHeightsStructure.data[blockHeight].date,
-                        timestamp=blockHeightsStructure.data[blockHeight].timestamp,
-                        vertices=vertices
-                    )
+
+
+    def get_capacity_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+        """
+        Retrieves the capacity metrics of Lightning Network nodes at specific block heights.
         
-        return results
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :return: CompactVerticesAspectDataStructure - A data structure containing node IDs and their capacities.
+        """
+        return self.__get_metrics(blockHeightsStructure, ['Capacity'])[0]
 
 
 
 
 
-    def get_capacity_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
+    def get_capacity_and_channel_count_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure):
         """
-        Retrieves the capacity metrics of Lightning Network nodes at specific block heights.
-        
+        Retrieves both the capacity and the channel count metrics of Lightning Network nodes at specific block heights
+        from one scan, for callers which need both.
+
         :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
-        :return: VerticesAspectDataStructure - A data structure containing node IDs and their capacities.
+        :return: tuple - (capacities, channel counts) CompactVerticesAspectDataStructures with the same block heights.
+        """
+        capacityResults, channelCountResults = self.__get_metrics(blockHeightsStructure, ['Capacity', 'ChannelCount'])
+
+        return capacityResults, channelCountResults
+
+
+
+
+
+    def __get_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, metricColumns: list):
         """
+        Returns the requested metrics from the process-wide analysis cache, reading only the missing ones from the database.
 
-        # Extract block heights
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param metricColumns: list - 'Capacity' and/or 'ChannelCount'
+        :return: list - CompactVerticesAspectDataStructure of every requested metric
+        """
         blockHeights = list(blockHeightsStructure.data.keys())
+        resultsByColumn = {metricColumn: analysis_cache.get('Nodes', metricColumn, blockHeights) for metricColumn in metricColumns}
+
+        missingResults = {metricColumn: self.__new_results(metricColumn) for metricColumn in metricColumns if resultsByColumn[metricColumn] is None}
+        if(len(missingResults) > 0):
+            self.__fill_metrics(blockHeightsStructure, missingResults)
+            for metricColumn, results in missingResults.items():
+                analysis_cache.put('Nodes', metricColumn, blockHeights, results)
+                resultsByColumn[metricColumn] = results
+
+        return [resultsByColumn[metricColumn] for metricColumn in metricColumns]
+
+
 
-        # Initialize the VerticesAspectDataStructure with metadata
-        results = VerticesAspectDataStructure(
+
+
+    def __new_results(self, metricColumn: str):
+        """
+        :param metricColumn: str - 'Capacity' or 'ChannelCount'
+        :return: CompactVerticesAspectDataStructure - Empty structure with the metadata of the metric
+        """
+        descriptions = {
+            'Capacity': "Nodes capacities on given block heights",
+            'ChannelCount': "Nodes channel counts on given block heights"
+        }
+
+        # Initialize the CompactVerticesAspectDataStructure with metadata
+        return CompactVerticesAspectDataStructure(
             meta={
                 "type": "VerticesAspectDataStructure",
-                "description": "Nodes capacities on given block heights",
+                "description": descriptions[metricColumn],
                 "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "xAxis": "BlockHeight",
-                "yAxis": "List(NodeID,Capacity)",
+                "yAxis": f"List(NodeID,{metricColumn})",
                 "yAxisSupplyChain": ["BlockHeight"]
-            },
-            data={}
+            }
         )
-        
+
+
+
+
+
+    def __fill_metrics(self, blockHeightsStructure: BlockchainBlockHeightsStructure, resultsByColumn: dict):
+        """
+        Reads node metrics at all block heights with a single query ordered by block height. The rows are streamed
+        with an unbuffered cursor into the value arrays of their block height.
+
+        :param blockHeightsStructure: BlockchainBlockHeightsStructure - A data structure containing block heights.
+        :param resultsByColumn: dict - {_CACHED1_NodeMetrics column ('Capacity' or 'ChannelCount'): CompactVerticesAspectDataStructure to add the node vertices to}
+        """
+        blockHeights = list(blockHeightsStructure.data.keys())
+        metricColumns = list(resultsByColumn.keys())
+        if(len(blockHeights) == 0):
+            return
+
         with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                for blockHeight in blockHeights:
-                    
-                    db_cursor.execute(
-                        'SELECT NodeID, Capacity FROM _CACHED1_NodeMetrics WHERE BlockHeight = %s',
-                        (blockHeight,)
-                    )
-                    
-                    rows = db_cursor.fetchall()
-                    vertices = []
-                    for row in rows:
-                        # Create VerticeData instances
-                        vertex = VerticesAspectDataStructure.VerticeData(name=row['NodeID'], value=int(row['Capacity']))
-                        vertices.append(vertex)
-                    
-                    # Add the vertices data to the results
-                    results.data[str(blockHeight)] = VerticesAspectDataStructure.VerticeEntry(
-                        date=blockHeightsStructure.data[blockHeight].date,
-                        timestamp=blockHeightsStructure.data[blockHeight].timestamp,
-                        vertices=vertices
-                    )
-        
-        return results
\ No newline at end of file
+            with db_conn.cursor(buffered=False) as db_cursor:
+                placeholders = ', '.join(['%s'] * len(blockHeights))
+                db_cursor.execute(f'''
+                    SELECT M.BlockHeight, N.NodeID, {', '.join('M.' + metricColumn for metricColumn in metricColumns)}
+                    FROM _CACHED1_NodeMetrics M
+                    JOIN Lightning_Nodes N ON N.NodeIndex = M.NodeIndex
+                    WHERE M.BlockHeight IN ({placeholders})
+                    ORDER BY M.BlockHeight
+                ''', [int(blockHeight) for blockHeight in blockHeights])
+
+                CompactVerticesAspectDataStructure.fill_from_rows(
+                    list(resultsByColumn.values()), blockHeightsStructure,
+                    iter(lambda: db_cursor.fetchmany(BULK_INSERT_CHUNK_SIZE), []), nameConverter=binary_to_hex
+                )
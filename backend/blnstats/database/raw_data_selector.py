@@ -1,7 +1,9 @@
 import logging
 import json
 from datetime import datetime
-from ..database.utils import get_db_connection
+from ..database.utils import get_db_connection, binary_to_hex
+from ..database.analysis_cache import analysis_cache
+from ..database.block_calendar import get_block_calendar
 from ..data_types import MetaDataStructure, BlockchainBlockHeightsStructure, VerticesAspectDataStructure
 
 # Configure logging
@@ -31,53 +33,25 @@ class RawDataSelector:
         :return: BlockchainBlockHeights - Data structure containing metadata and block heights.
         """
 
-        # Adjust the dateMask for SQL LIKE clause
-        sql_date_mask = dateMask.replace('X', '_')
-
-        with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                # Retrieve all dates that match the given date mask
-                db_cursor.execute('''
-                    SELECT 
-                        BlockHeight, 
-                        Date,
-                        Timestamp
-                    FROM 
-                        Blockchain_Blocks
-                    WHERE 
-                        (Date, BlockHeight) IN (
-                            SELECT 
-                                Date, 
-                                MIN(BlockHeight) AS BlockHeight
-                            FROM 
-                                Blockchain_Blocks
-                            WHERE 
-                                Date >= %s
-                                AND Date <= %s
-                                AND Date LIKE %s
-                            GROUP BY Date
-                        )
-                    ORDER BY Date;
-                ''', [startSince, endUntil, sql_date_mask])
-                rows = db_cursor.fetchall()
-                
-                data = {
-                    str(row['BlockHeight']): BlockchainBlockHeightsStructure.BlockData(
-                        date=str(row['Date']),
-                        timestamp=str(row['Timestamp'])
-                    ) for row in rows
-                }
-                
-                meta = MetaDataStructure(
-                    type="BlockchainBlockHeights",
-                    description=f"First blockchain block heights which have been mined at every date matching {dateMask}",
-                    updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    xAxis="Date",
-                    yAxis="BlockHeight",
-                    yAxisSupplyChain=[]
-                )
-                
-                return BlockchainBlockHeightsStructure(meta=meta, data=data)
+        # The same checkpoint lists are requested by every chart generator of a run
+        cached = analysis_cache.get('BlockHeights', dateMask, (startSince, endUntil))
+        if(cached is not None):
+            return cached
+
+        data = self.__first_blocks_of_days(startSince, endUntil, dateMask=dateMask)
+
+        meta = MetaDataStructure(
+            type="BlockchainBlockHeights",
+            description=f"First blockchain block heights which have been mined at every date matching {dateMask}",
+            updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            xAxis="Date",
+            yAxis="BlockHeight",
+            yAxisSupplyChain=[]
+        )
+        
+        results = BlockchainBlockHeightsStructure(meta=meta, data=data)
+        analysis_cache.put('BlockHeights', dateMask, (startSince, endUntil), results)
+        return results
 
 
 
@@ -90,52 +64,72 @@ class RawDataSelector:
         :param endUntil: str - The end date to retrieve data from (format: 'YYYY-MM-DD').
         :return: BlockchainBlockHeights - Data structure containing metadata and block heights.
         """
-        
-        with get_db_connection() as db_conn:
-            with db_conn.cursor(dictionary=True) as db_cursor:
-                db_cursor.execute('''
-                    SELECT 
-                        BlockHeight, 
-                        Date,
-                        Timestamp
-                    FROM 
-                        Blockchain_Blocks
-                    WHERE 
-                        (Date, BlockHeight) IN (
-                            SELECT 
-                                Date, 
-                                MIN(BlockHeight) AS BlockHeight
-                            FROM 
-                                Blockchain_Blocks
-                            WHERE 
-                                DAY(Date) = 1
-                                AND Date >= %s
-                                AND Date <= %s
-                            GROUP BY Date
-                        )
-                    ORDER BY Date;
-                ''', [startSince, endUntil])
-                rows = db_cursor.fetchall()
-                
-                data = {
-                    str(row['BlockHeight']): BlockchainBlockHeightsStructure.BlockData(
-                        date=str(row['Date']),
-                        timestamp=str(row['Timestamp'])
-                    ) for row in rows
-                }
-                
-                if withMeta:
-                    meta = MetaDataStructure(
-                        type="BlockchainBlockHeights",
-                        description="First blockchain block heights which have been mined at every month of BLN lifetime",
-                        xAxis="Date",
-                        yAxis="BlockHeight",
-                        yAxisSupplyChain=[]
-                    )
-                    return BlockchainBlockHeightsStructure(meta=meta, data=data)
-                else:
-                    return data
-        
+        data = self.__first_blocks_of_days(startSince, endUntil, dateMask='XXXX-XX-01')
+
+        if withMeta:
+            meta = MetaDataStructure(
+                type="BlockchainBlockHeights",
+                description="First blockchain block heights which have been mined at every month of BLN lifetime",
+                xAxis="Date",
+                yAxis="BlockHeight",
+                yAxisSupplyChain=[]
+            )
+            return BlockchainBlockHeightsStructure(meta=meta, data=data)
+        else:
+            return data
+
+
+
+    def get_first_blocks_of_days(self, withMeta=False, startSince='2018-01-01', endUntil='9999-12-31', weekday=None):
+        """
+        Retrieves the block heights of the first block of every day (or of every given weekday).
+
+        :param withMeta: bool - Whether to return metadata (True) or just the block heights (False).
+        :param startSince: str - The start date to retrieve data from (format: 'YYYY-MM-DD').
+        :param endUntil: str - The end date to retrieve data from (format: 'YYYY-MM-DD').
+        :param weekday: int - Only days of this weekday (0 = Monday ... 6 = Sunday), all days if None.
+        :return: BlockchainBlockHeights - Data structure containing metadata and block heights.
+        """
+        data = self.__first_blocks_of_days(startSince, endUntil, weekday=weekday)
+
+        if withMeta:
+            meta = MetaDataStructure(
+                type="BlockchainBlockHeights",
+                description="First blockchain block heights which have been mined at every day of BLN lifetime" if weekday is None
+                    else f"First blockchain block heights which have been mined at every weekday {weekday} of BLN lifetime",
+                xAxis="Date",
+                yAxis="BlockHeight",
+                yAxisSupplyChain=[]
+            )
+            return BlockchainBlockHeightsStructure(meta=meta, data=data)
+        else:
+            return data
+
+
+
+    def get_block_height_at_time(self, timestamp):
+        """
+        Retrieves the highest block height mined at or before the given time.
+
+        :param timestamp: int - Unix timestamp
+        :return: int - Block height, or None if no block was mined before the timestamp
+        """
+        return get_block_calendar().height_at_time(timestamp)
+
+
+
+    def __first_blocks_of_days(self, startSince, endUntil, dateMask=None, weekday=None):
+        """
+        Looks up the first block of every matching date in the in-memory block calendar.
+
+        :return: dict - {BlockHeight: BlockchainBlockHeightsStructure.BlockData} sorted by date
+        """
+        dates, blockHeights, timestamps = get_block_calendar().first_blocks_of_days(startSince, endUntil, dateMask=dateMask, weekday=weekday)
+        return {
+            str(blockHeight): BlockchainBlockHeightsStructure.BlockData(date=date, timestamp=timestamp)
+            for date, blockHeight, timestamp in zip(dates, blockHeights, timestamps)
+        }
+
 
 
     def get_ln_nodes_capacities(self, blockHeight):
@@ -143,11 +137,11 @@ class RawDataSelector:
         Fetches the capacities of LN nodes at a specific block height.
         
         A channel is considered active at a given block height if:
-        - It was opened (funded) on or before the block (FundingBlockIndex <= blockHeight),
-        - It closes (is spent) after the block (SpendingBlockIndex > blockHeight).
+        - It was opened (funded) on or before the block (OpenHeight <= blockHeight),
+        - It closes (is spent) after the block (CloseHeight > blockHeight).
         
-        This method sums up the capacity (transaction value) for both positions (NodeID1 and NodeID2)
-        across all active channels at the given block height.
+        This method sums up the capacity (transaction value) of both channel endpoints across all active
+        channels at the given block height, read from Lightning_ChannelIntervals with one covering index range scan.
         
         :param blockHeight: int - The block height at which channels are active.
         :return: list of dicts - Each dict contains 'NodeID' and 'NodeValue', representing the total 
@@ -157,31 +151,20 @@ class RawDataSelector:
             # Using a dictionary-based cursor for clearer column references
             with db_conn.cursor(dictionary=True) as db_cursor:
                 query = '''
-                    SELECT NodeID, SUM(Value) AS NodeValue FROM (
-                        SELECT LC.NodeID1 AS NodeID, BT.Value AS Value
-                        FROM Lightning_Channels LC
-                        JOIN Blockchain_Transactions BT
-                          ON LC.ShortChannelID = BT.ShortChannelID
-                        WHERE BT.FundingBlockIndex <= %s
-                          AND BT.SpendingBlockIndex > %s
-                        
-                        UNION ALL
-                        
-                        SELECT LC.NodeID2 AS NodeID, BT.Value AS Value
-                        FROM Lightning_Channels LC
-                        JOIN Blockchain_Transactions BT 
-                          ON LC.ShortChannelID = BT.ShortChannelID
-                        WHERE BT.FundingBlockIndex <= %s
-                          AND BT.SpendingBlockIndex > %s
-                    ) AS combined
-                    GROUP BY NodeID;
+                    SELECT N.NodeID, Active.NodeValue FROM (
+                        SELECT NodeIndex, SUM(Value) AS NodeValue
+                        FROM Lightning_ChannelIntervals
+                        WHERE OpenHeight <= %s
+                          AND CloseHeight > %s
+                        GROUP BY NodeIndex
+                    ) AS Active
+                    JOIN Lightning_Nodes N ON N.NodeIndex = Active.NodeIndex;
                 '''
                 logger.debug("Executing LN nodes capacities query for blockHeight: %s", blockHeight)
-                # We pass the blockHeight twice for each subquery's condition (total four parameters)
-                db_cursor.execute(query, (blockHeight, blockHeight, blockHeight, blockHeight))
+                db_cursor.execute(query, (blockHeight, blockHeight))
                 result = db_cursor.fetchall()
                 logger.debug("LN nodes capacities result: %s", result)
-                return [{'NodeID': row['NodeID'], 'NodeValue': row['NodeValue']} for row in result]
+                return [{'NodeID': binary_to_hex(row['NodeID']), 'NodeValue': row['NodeValue']} for row in result]
 
 
 
@@ -190,11 +173,11 @@ class RawDataSelector:
         Fetches the channel counts of LN nodes at a specific block height.
         
         A channel is considered active at a given block height if:
-        - It was opened (funded) on or before the block (FundingBlockIndex <= blockHeight),
-        - It closes (is spent) after the block (SpendingBlockIndex > blockHeight).
+        - It was opened (funded) on or before the block (OpenHeight <= blockHeight),
+        - It closes (is spent) after the block (CloseHeight > blockHeight).
         
         This method counts the number of active channels that each node participates in, 
-        taking into account that a node might appear as either NodeID1 or NodeID2.
+        taking into account that a node might be either endpoint of a channel.
         
         :param blockHeight: int - The block height at which channels are active.
         :return: list of dicts - Each dict contains 'NodeID' and 'ChannelCount'.
@@ -202,30 +185,20 @@ class RawDataSelector:
         with get_db_connection() as db_conn:
             with db_conn.cursor(dictionary=True) as db_cursor:
                 query = '''
-                    SELECT NodeID, COUNT(*) AS ChannelCount FROM (
-                        SELECT LC.NodeID1 AS NodeID
-                        FROM Lightning_Channels LC
-                        JOIN Blockchain_Transactions BT 
-                          ON LC.ShortChannelID = BT.ShortChannelID
-                        WHERE BT.FundingBlockIndex <= %s
-                          AND BT.SpendingBlockIndex > %s
-                        
-                        UNION ALL
-                        
-                        SELECT LC.NodeID2 AS NodeID
-                        FROM Lightning_Channels LC
-                        JOIN Blockchain_Transactions BT 
-                          ON LC.ShortChannelID = BT.ShortChannelID
-                        WHERE BT.FundingBlockIndex <= %s
-                          AND BT.SpendingBlockIndex > %s
-                    ) AS combined
-                    GROUP BY NodeID;
+                    SELECT N.NodeID, Active.ChannelCount FROM (
+                        SELECT NodeIndex, COUNT(*) AS ChannelCount
+                        FROM Lightning_ChannelIntervals
+                        WHERE OpenHeight <= %s
+                          AND CloseHeight > %s
+                        GROUP BY NodeIndex
+                    ) AS Active
+                    JOIN Lightning_Nodes N ON N.NodeIndex = Active.NodeIndex;
                 '''
                 logger.debug("Executing LN nodes channel counts query for blockHeight: %s", blockHeight)
-                db_cursor.execute(query, (blockHeight, blockHeight, blockHeight, blockHeight))
+                db_cursor.execute(query, (blockHeight, blockHeight))
                 result = db_cursor.fetchall()
                 logger.debug("LN nodes channel counts result: %s", result)
-                return [{'NodeID': row['NodeID'], 'ChannelCount': row['ChannelCount']} for row in result]
+                return [{'NodeID': binary_to_hex(row['NodeID']), 'ChannelCount': row['ChannelCount']} for row in result]
 
 
 
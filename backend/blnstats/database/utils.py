@@ -1,6 +1,14 @@
 import mysql.connector
+import mysql.connector.pooling
 from mysql.connector.cursor import MySQLCursorDict
 import os
+import re
+import logging
+
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
 
 
 DEFAULT_DB_HOST = 'blnstats-mysql'
@@ -8,6 +16,13 @@ DEFAULT_DB_NAME = 'lnstats'
 DEFAULT_DB_USER = 'lnstats'
 DEFAULT_DB_PASSWORD = 'lnstats'
 
+# Number of rows sent in a single multi-row INSERT statement
+BULK_INSERT_CHUNK_SIZE = 10000
+
+# Seconds of ChangedAt history re-read by incremental readers, so rows of transactions which committed
+# after the previous read with an earlier ChangedAt are not missed (re-reading is harmless, upserts are idempotent)
+CHANGE_TRACKING_OVERLAP = 60
+
 
 
 def get_db_connection():
@@ -22,6 +37,396 @@ def get_db_connection():
 
 
 
+# Connection pool of the current process (created on first use, so every worker process gets its own)
+_db_connection_pool = None
+_db_connection_pool_pid = None
+
+
+
+def get_pooled_db_connection():
+    '''
+    Returns a connection from the connection pool of the current process; closing it returns it to the pool.
+    Meant for long running workers which would otherwise reconnect for every unit of work.
+    '''
+    global _db_connection_pool, _db_connection_pool_pid
+    if(_db_connection_pool is None or _db_connection_pool_pid != os.getpid()):
+        _db_connection_pool = mysql.connector.pooling.MySQLConnectionPool(
+            pool_name=f'blnstats-{os.getpid()}',
+            pool_size=int(os.getenv('DB_POOL_SIZE', 2)),
+            host=os.getenv('DB_HOST', DEFAULT_DB_HOST),
+            database=os.getenv('DB_NAME', DEFAULT_DB_NAME),
+            user=os.getenv('DB_USER', DEFAULT_DB_USER),
+            password=os.getenv('DB_PASSWORD', DEFAULT_DB_PASSWORD)
+        )
+        _db_connection_pool_pid = os.getpid()
+    return _db_connection_pool.get_connection()
+
+
+
+def bulk_insert(db_cursor, insert_query, rows, chunk_size=BULK_INSERT_CHUNK_SIZE):
+    '''
+    Inserts rows using large multi-row INSERT statements instead of one statement per row.
+
+    The connector rewrites `executemany` of an `INSERT ... VALUES (%s, ...)` statement into
+    a single multi-row INSERT, so every chunk costs one round-trip.
+
+    :param db_cursor: Cursor to execute the statement with
+    :param insert_query: INSERT statement with a single VALUES placeholder tuple
+    :param rows: List of tuples to insert
+    :param chunk_size: Maximum number of rows per statement (keeps packets below max_allowed_packet)
+    '''
+    for i in range(0, len(rows), chunk_size):
+        db_cursor.executemany(insert_query, rows[i:i + chunk_size])
+
+
+
+def get_system_setting(key, default=None):
+    '''
+    Returns the value of a System_Settings entry.
+
+    :param key: Setting key
+    :param default: Value returned when the setting does not exist
+    :return: str - Setting value
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT `Value` FROM System_Settings WHERE `Key` = %s', (key,))
+            row = cursor.fetchone()
+            return row[0] if row is not None else default
+
+
+
+def set_system_setting(key, value):
+    '''
+    Creates or updates a System_Settings entry.
+
+    :param key: Setting key
+    :param value: Setting value (stored as string)
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO System_Settings (`Key`, `Value`) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE `Value` = VALUES(`Value`)
+            ''', (key, str(value)))
+            conn.commit()
+
+
+
+def get_system_settings_by_prefix(prefix):
+    '''
+    Returns all System_Settings entries whose key starts with the given prefix.
+
+    :param prefix: Key prefix, e.g. 'LND-DBReader-Source-'
+    :return: dict - {Key: Value}
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT `Key`, `Value` FROM System_Settings WHERE `Key` LIKE %s', (prefix + '%',))
+            return {key: value for key, value in cursor.fetchall()}
+
+
+
+# Version of the imported and transformed data, bumped after every import and transform (see AnalysisCache)
+DATA_VERSION_SETTING = 'Analysis-DataVersion'
+
+
+
+def get_data_version():
+    '''
+    :return: int - Current data version (0 if nothing was imported or transformed yet)
+    '''
+    return int(get_system_setting(DATA_VERSION_SETTING, 0))
+
+
+
+def bump_data_version():
+    '''
+    Increments the data version, invalidating analysis results cached by every process.
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO System_Settings (`Key`, `Value`) VALUES (%s, '1')
+                ON DUPLICATE KEY UPDATE `Value` = CAST(`Value` AS UNSIGNED) + 1
+            ''', (DATA_VERSION_SETTING,))
+            conn.commit()
+
+
+
+# Lowest block height whose node metrics are stale (set by imports and the blockchain sync)
+DIRTY_BLOCK_HEIGHT_SETTING = 'NodeMetrics-DirtyFromBlockHeight'
+# Incremented with every dirty mark, so the transform can tell whether marks arrived while it was running
+DIRTY_GENERATION_SETTING = 'NodeMetrics-DirtyGeneration'
+
+
+
+def mark_dirty_block_height(block_height, db_cursor=None):
+    '''
+    Records that channel data changed at the given block height, so node metrics at or after it must be recomputed.
+    The stored value only ever decreases until it is cleared by the transform; the dirty generation is incremented
+    with every mark.
+
+    :param block_height: int - Lowest affected block height (None is ignored)
+    :param db_cursor: Cursor to execute the statements with (commit is left to the caller); a new connection is used if None
+    '''
+    if(block_height is None):
+        return
+
+    def mark(cursor):
+        cursor.execute('''
+            INSERT INTO System_Settings (`Key`, `Value`) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE `Value` = LEAST(CAST(`Value` AS UNSIGNED), CAST(VALUES(`Value`) AS UNSIGNED))
+        ''', (DIRTY_BLOCK_HEIGHT_SETTING, str(int(block_height))))
+        cursor.execute('''
+            INSERT INTO System_Settings (`Key`, `Value`) VALUES (%s, '1')
+            ON DUPLICATE KEY UPDATE `Value` = CAST(`Value` AS UNSIGNED) + 1
+        ''', (DIRTY_GENERATION_SETTING,))
+
+    if(db_cursor is not None):
+        mark(db_cursor)
+        return
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            mark(cursor)
+            conn.commit()
+
+
+
+def get_dirty_block_height():
+    '''
+    :return: tuple - (lowest block height whose node metrics are stale or None if nothing changed since the last
+                     transform, dirty generation)
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT `Key`, `Value` FROM System_Settings WHERE `Key` IN (%s, %s)',
+                (DIRTY_BLOCK_HEIGHT_SETTING, DIRTY_GENERATION_SETTING)
+            )
+            settings = dict(cursor.fetchall())
+    dirty_block_height = settings.get(DIRTY_BLOCK_HEIGHT_SETTING)
+    return (int(dirty_block_height) if dirty_block_height is not None else None), int(settings.get(DIRTY_GENERATION_SETTING, 0))
+
+
+
+def clear_dirty_block_height(generation):
+    '''
+    Clears the dirty block height after the transform, unless anything was marked dirty since it was read.
+
+    :param generation: int - Dirty generation read (with the dirty block height) before the transform started
+    :return: bool - Whether the dirty block height was cleared
+    '''
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # Marks lock the generation row, so no mark can slip in between the check and the delete
+            cursor.execute('SELECT `Value` FROM System_Settings WHERE `Key` = %s FOR UPDATE', (DIRTY_GENERATION_SETTING,))
+            row = cursor.fetchone()
+            if(int(row[0] if row is not None else 0) != int(generation)):
+                conn.rollback()
+                return False
+            cursor.execute('DELETE FROM System_Settings WHERE `Key` = %s', (DIRTY_BLOCK_HEIGHT_SETTING,))
+            conn.commit()
+            return True
+
+
+
+def column_exists(db_cursor, table_name, column_name):
+    '''
+    :return: bool - Whether the table of the current database has the given column
+    '''
+    db_cursor.execute('''
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    ''', (table_name, column_name))
+    return db_cursor.fetchone()[0] > 0
+
+
+
+
+def add_change_tracking_column(db_cursor, table_name):
+    '''
+    Adds an indexed `ChangedAt` column to the table, which MySQL sets on every insert and on every update
+    that changes the row. Incremental readers select `ChangedAt > watermark` with an index range scan instead
+    of watermarking on data columns. Does nothing if the column already exists.
+
+    :param db_cursor: Cursor to execute the statements with
+    :param table_name: str - Table name
+    '''
+    if(column_exists(db_cursor, table_name, 'ChangedAt')):
+        return
+
+    logger.info(f"Adding change tracking column to {table_name}...")
+    db_cursor.execute(f'''
+        ALTER TABLE `{table_name}`
+            ADD COLUMN `ChangedAt` TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            ADD INDEX `idx_ChangedAt` (`ChangedAt`)
+    ''')
+
+
+
+def hex_to_binary(value):
+    '''
+    Converts a hex string (block hash, txid, script hash or NodeID) to the bytes stored in BINARY columns.
+
+    :param value: str - Hex string (None and '' are kept as they are)
+    :return: bytes
+    '''
+    if(value is None or value == ''):
+        return value if value is None else b''
+    return bytes.fromhex(value)
+
+
+
+def binary_to_hex(value):
+    '''
+    Converts bytes read from a BINARY column back to the lowercase hex string used in exports.
+
+    :param value: bytes - Column value
+    :return: str
+    '''
+    if(value is None):
+        return None
+    return bytes(value).hex()
+
+
+
+def migrate_hex_column_to_binary(db_cursor, table_name, column_name, binary_type, index_definition=None):
+    '''
+    Converts a hex CHAR column to a BINARY column in place (UNHEX of every value). Does nothing if the
+    column is already binary or does not exist. Raises ValueError before altering the table if any value
+    is not a hex string fitting the new type, as UNHEX would silently turn it into NULL or truncate it.
+
+    :param db_cursor: Cursor to execute the statements with
+    :param table_name: str - Table name
+    :param column_name: str - Column name
+    :param binary_type: str - New column type, e.g. 'BINARY(32)'
+    :param index_definition: str - Index on the column to recreate, e.g. 'INDEX `idx_BlockHash` (`BlockHash`)'
+    '''
+    db_cursor.execute('''
+        SELECT DATA_TYPE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    ''', (table_name, column_name))
+    row = db_cursor.fetchone()
+    if(row is None or row[0] not in ('char', 'varchar')):
+        return
+
+    # BINARY(n) needs exactly 2n hex digits, VARBINARY(n) up to 2n (in pairs)
+    byte_length = int(re.search(r'\((\d+)\)', binary_type).group(1))
+    if(binary_type.upper().startswith('VARBINARY')):
+        hex_pattern = f'^([0-9a-fA-F]{{2}}){{0,{byte_length}}}$'
+    else:
+        hex_pattern = f'^[0-9a-fA-F]{{{2 * byte_length}}}$'
+    db_cursor.execute(f'''
+        SELECT COUNT(*), MIN(`{column_name}`) FROM `{table_name}`
+        WHERE `{column_name}` IS NOT NULL AND NOT REGEXP_LIKE(`{column_name}`, %s)
+    ''', (hex_pattern,))
+    invalid_count, invalid_example = db_cursor.fetchone()
+    if(invalid_count > 0):
+        raise ValueError(f"Cannot migrate {table_name}.{column_name} to {binary_type}: {invalid_count} values are not "
+                         f"valid hex strings of that length (e.g. '{invalid_example}'), fix or delete these rows first")
+
+    logger.info(f"Migrating {table_name}.{column_name} from hex to {binary_type}...")
+    db_cursor.execute(f'ALTER TABLE `{table_name}` ADD COLUMN `{column_name}_Binary` {binary_type} NULL AFTER `{column_name}`')
+    db_cursor.execute(f'UPDATE `{table_name}` SET `{column_name}_Binary` = UNHEX(`{column_name}`)')
+    db_cursor.execute(f'ALTER TABLE `{table_name}` DROP COLUMN `{column_name}`')
+    db_cursor.execute(f'ALTER TABLE `{table_name}` CHANGE COLUMN `{column_name}_Binary` `{column_name}` {binary_type} NOT NULL')
+    if(index_definition is not None):
+        db_cursor.execute(f'ALTER TABLE `{table_name}` ADD {index_definition}')
+
+
+
+def sync_node_indexes(db_cursor):
+    '''
+    Assigns Lightning_Nodes surrogate keys to the nodes of Lightning_Channels rows which do not have them yet.
+    Called after new channels are inserted (commit is left to the caller).
+
+    :param db_cursor: Cursor to execute the statements with
+    '''
+    db_cursor.execute('''
+        INSERT INTO Lightning_Nodes (NodeID)
+        SELECT NewNodes.NodeID
+        FROM (
+            SELECT NodeID1 AS NodeID FROM Lightning_Channels WHERE NodeIndex1 IS NULL
+            UNION
+            SELECT NodeID2 AS NodeID FROM Lightning_Channels WHERE NodeIndex2 IS NULL
+        ) NewNodes
+        LEFT JOIN Lightning_Nodes N ON N.NodeID = NewNodes.NodeID
+        WHERE N.NodeIndex IS NULL
+    ''')
+    for position in (1, 2):
+        db_cursor.execute(f'''
+            UPDATE Lightning_Channels LC
+            JOIN Lightning_Nodes N ON N.NodeID = LC.NodeID{position}
+            SET LC.NodeIndex{position} = N.NodeIndex
+            WHERE LC.NodeIndex{position} IS NULL
+        ''')
+
+
+
+def sync_channel_intervals(db_cursor, short_channel_id=None):
+    '''
+    Brings Lightning_ChannelIntervals in line with Lightning_Channels and Blockchain_Transactions (commit is left to the caller).
+
+    :param db_cursor: Cursor to execute the statement with
+    :param short_channel_id: int - Channel whose funding/spending data changed; if None, intervals are only added
+                                   for channels which do not have them yet
+    '''
+    if(short_channel_id is not None):
+        channel_filter, params = 'LC.ShortChannelID = %s', (short_channel_id, short_channel_id)
+    else:
+        channel_filter, params = 'CI.ShortChannelID IS NULL', ()
+
+    # One row per channel endpoint, so every node is found by a single index range scan
+    db_cursor.execute(f'''
+        INSERT INTO Lightning_ChannelIntervals (ShortChannelID, Endpoint, NodeIndex, Value, OpenHeight, CloseHeight)
+        SELECT ShortChannelID, Endpoint, NodeIndex, Value, OpenHeight, CloseHeight FROM (
+            SELECT LC.ShortChannelID, 1 AS Endpoint, LC.NodeIndex1 AS NodeIndex, BT.Value, BT.FundingBlockIndex AS OpenHeight, BT.SpendingBlockIndex AS CloseHeight
+            FROM Lightning_Channels LC
+            JOIN Blockchain_Transactions BT ON BT.ShortChannelID = LC.ShortChannelID
+            LEFT JOIN Lightning_ChannelIntervals CI ON CI.ShortChannelID = LC.ShortChannelID AND CI.Endpoint = 1
+            WHERE LC.NodeIndex1 IS NOT NULL AND {channel_filter}
+
+            UNION ALL
+
+            SELECT LC.ShortChannelID, 2 AS Endpoint, LC.NodeIndex2 AS NodeIndex, BT.Value, BT.FundingBlockIndex AS OpenHeight, BT.SpendingBlockIndex AS CloseHeight
+            FROM Lightning_Channels LC
+            JOIN Blockchain_Transactions BT ON BT.ShortChannelID = LC.ShortChannelID
+            LEFT JOIN Lightning_ChannelIntervals CI ON CI.ShortChannelID = LC.ShortChannelID AND CI.Endpoint = 2
+            WHERE LC.NodeIndex2 IS NOT NULL AND {channel_filter}
+        ) AS Endpoints
+        ON DUPLICATE KEY UPDATE
+            NodeIndex = VALUES(NodeIndex),
+            Value = VALUES(Value),
+            OpenHeight = VALUES(OpenHeight),
+            CloseHeight = VALUES(CloseHeight)
+    ''', params)
+
+
+
+def get_entity_indexes(db_cursor, entity_names):
+    '''
+    Returns the Lightning_EntityNames surrogate keys of the given entity names, adding names not seen before.
+
+    :param db_cursor: Cursor to execute the statements with (commit is left to the caller)
+    :param entity_names: list - Entity names
+    :return: dict - {EntityName: EntityIndex}
+    '''
+    entity_indexes = {}
+    for i in range(0, len(entity_names), BULK_INSERT_CHUNK_SIZE):
+        chunk = entity_names[i:i + BULK_INSERT_CHUNK_SIZE]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        db_cursor.execute(f'SELECT EntityName, EntityIndex FROM Lightning_EntityNames WHERE EntityName IN ({placeholders})', chunk)
+        entity_indexes.update({entity_name: entity_index for entity_name, entity_index in db_cursor.fetchall()})
+
+    new_entity_names = [entity_name for entity_name in entity_names if entity_name not in entity_indexes]
+    if(len(new_entity_names) > 0):
+        bulk_insert(db_cursor, 'INSERT IGNORE INTO Lightning_EntityNames (EntityName) VALUES (%s)', [(entity_name,) for entity_name in new_entity_names])
+        entity_indexes.update(get_entity_indexes(db_cursor, new_entity_names))
+    return entity_indexes
+
+
+
 def create_database_if_not_exists(db_name):
     try:
         # Establish a connection to MySQL (connect to server, not to a specific database yet)
@@ -57,7 +462,7 @@ def create_tables_if_not_exists():
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS `Blockchain_Blocks` ( 
                     `BlockHeight` INT UNSIGNED NOT NULL,
-                    `BlockHash` CHAR(64) NOT NULL,
+                    `BlockHash` BINARY(32) NOT NULL,
                     `Timestamp` INT UNSIGNED NOT NULL,
                     `Time` DATETIME NOT NULL,
                     `Date` DATE NOT NULL,
@@ -75,11 +480,11 @@ def create_tables_if_not_exists():
                     `FundingBlockIndex` INT UNSIGNED NOT NULL,
                     `FundingTxIndex` INT UNSIGNED NOT NULL,
                     `FundingOutputIndex` SMALLINT UNSIGNED NOT NULL,
-                    `FundingTxID` CHAR(64) NOT NULL,
-                    `FundingScriptHash` CHAR(64) NOT NULL,
+                    `FundingTxID` BINARY(32) NOT NULL,
+                    `FundingScriptHash` BINARY(32) NOT NULL,
                     `Value` BIGINT UNSIGNED NOT NULL,
                     `SpendingBlockIndex` INT UNSIGNED NOT NULL,
-                    `SpendingTxID` CHAR(64) NOT NULL,
+                    `SpendingTxID` VARBINARY(32) NOT NULL,
                     `UpdatedDate` DATE NOT NULL,
                     PRIMARY KEY (`ShortChannelID`),
                     INDEX `idx_Funding_SpendingBlockIndex` (`FundingBlockIndex`, `SpendingBlockIndex`),
@@ -94,15 +499,64 @@ def create_tables_if_not_exists():
                     `BlockIndex` INT NOT NULL,
                     `TxIndex` INT NOT NULL,
                     `OutputIndex` INT NOT NULL,
-                    `NodeID1` CHAR(66) NOT NULL,
-                    `NodeID2` CHAR(66) NOT NULL,
+                    `NodeID1` BINARY(33) NOT NULL,
+                    `NodeID2` BINARY(33) NOT NULL,
+                    `NodeIndex1` INT UNSIGNED NULL,
+                    `NodeIndex2` INT UNSIGNED NULL,
                     PRIMARY KEY (`ShortChannelID`),
-                    INDEX idx_node_id_1 (`NodeID1`),
-                    INDEX idx_node_id_2 (`NodeID2`),
+                    INDEX idx_node_index_1 (`NodeIndex1`),
+                    INDEX idx_node_index_2 (`NodeIndex2`),
                     INDEX idx_blockindex_txindex (`BlockIndex`, `TxIndex`)
                 );
             ''')
 
+            # Integer surrogate keys of nodes, used by the channel and metrics tables instead of the 66 character NodeIDs
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS `Lightning_Nodes` (
+                    `NodeIndex` INT UNSIGNED AUTO_INCREMENT NOT NULL,
+                    `NodeID` BINARY(33) NOT NULL,
+                    PRIMARY KEY (`NodeIndex`),
+                    CONSTRAINT `unique_nodeid` UNIQUE (`NodeID`)
+                );
+            ''')
+
+            # Hashes and public keys are stored as raw bytes instead of hex strings
+            migrate_hex_column_to_binary(cursor, 'Blockchain_Blocks', 'BlockHash', 'BINARY(32)', 'INDEX `idx_BlockHash` (`BlockHash`)')
+            migrate_hex_column_to_binary(cursor, 'Blockchain_Transactions', 'FundingTxID', 'BINARY(32)')
+            migrate_hex_column_to_binary(cursor, 'Blockchain_Transactions', 'FundingScriptHash', 'BINARY(32)')
+            migrate_hex_column_to_binary(cursor, 'Blockchain_Transactions', 'SpendingTxID', 'VARBINARY(32)')
+            migrate_hex_column_to_binary(cursor, 'Lightning_Nodes', 'NodeID', 'BINARY(33)', 'CONSTRAINT `unique_nodeid` UNIQUE (`NodeID`)')
+
+            # Channels are looked up by NodeIndex, so the public keys lose their indexes
+            migrate_hex_column_to_binary(cursor, 'Lightning_Channels', 'NodeID1', 'BINARY(33)')
+            migrate_hex_column_to_binary(cursor, 'Lightning_Channels', 'NodeID2', 'BINARY(33)')
+
+            # Lightning_Channels tables created before the surrogate keys were introduced
+            for position in (1, 2):
+                if(not column_exists(cursor, 'Lightning_Channels', f'NodeIndex{position}')):
+                    cursor.execute(f'''
+                        ALTER TABLE `Lightning_Channels`
+                            ADD COLUMN `NodeIndex{position}` INT UNSIGNED NULL,
+                            ADD INDEX idx_node_index_{position} (`NodeIndex{position}`)
+                    ''')
+            sync_node_indexes(cursor)
+
+            # Denormalized channel endpoints with their open/close heights, for "active at height" queries
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS `Lightning_ChannelIntervals` (
+                    `ShortChannelID` BIGINT NOT NULL,
+                    `Endpoint` TINYINT UNSIGNED NOT NULL,
+                    `NodeIndex` INT UNSIGNED NOT NULL,
+                    `Value` BIGINT UNSIGNED NOT NULL,
+                    `OpenHeight` INT UNSIGNED NOT NULL,
+                    `CloseHeight` INT UNSIGNED NOT NULL,
+                    PRIMARY KEY (`ShortChannelID`, `Endpoint`),
+                    INDEX idx_open_close_node_value_covering (`OpenHeight`, `CloseHeight`, `NodeIndex`, `Value`),
+                    INDEX idx_node_index (`NodeIndex`)
+                );
+            ''')
+            sync_channel_intervals(cursor)
+
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS `Lightning_Entities` ( 
                     `NodeID` CHAR(66) NOT NULL,
@@ -111,6 +565,16 @@ def create_tables_if_not_exists():
                 );
             ''')
 
+            # Integer surrogate keys of entity names (binary collation, so every distinct name gets its own key)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS `Lightning_EntityNames` (
+                    `EntityIndex` INT UNSIGNED AUTO_INCREMENT NOT NULL,
+                    `EntityName` VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
+                    PRIMARY KEY (`EntityIndex`),
+                    CONSTRAINT `unique_entityname` UNIQUE (`EntityName`)
+                );
+            ''')
+
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS `Lightning_NodeAliases` ( 
                     `ID` INT AUTO_INCREMENT NOT NULL,
@@ -125,6 +589,17 @@ def create_tables_if_not_exists():
                 );
             ''')
 
+            # Country of the most recently seen clearnet address of every node (filled by NodeCountries)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS `Lightning_NodeCountries` (
+                    `NodeID` CHAR(66) NOT NULL,
+                    `CountryCode` CHAR(2) NOT NULL,
+                    `LastSeen` INT NOT NULL,
+                    PRIMARY KEY (`NodeID`),
+                    INDEX `idx_CountryCode` (`CountryCode`)
+                );
+            ''')
+
 
 
 
@@ -14,8 +14,9 @@ if __name__ == "__main__":
         print("")
         print("Commands:")
         print("  --import-ln-research-data      Import LN Research data")
-        print("  --import-lnd-dbreader-data     Import LND DBReader data")
+        print("  --import-lnd-dbreader-data     Import LND DBReader data (all configured sources if no path given)")
         print("  --sync-blockchain              Synchronize the blockchain")
+        print("  --transform-node-metrics       Transform node and entity metrics (optionally: monthly, weekly or daily)")
         print("  --calculate-ln-stats           Calculate Lightning Network statistics")
         print("")
         print("  --serve-api                    Serve the backend API")
@@ -33,17 +34,14 @@ if __name__ == "__main__":
 
 
     elif(sys.argv[1] == "--import-lnd-dbreader-data"):
-        if(len(sys.argv) == 3):
-            blnstats.importLNDDBReader(sys.argv[2])
+        # Without arguments all configured LND-DBReader-Source-N sources are imported, e.g.:
+        #     python3 main.py --import-lnd-dbreader-data
+        #     python3 main.py --import-lnd-dbreader-data http://192.168.1.2/rawdata/lnd-dbreader.json.gz
+        #     python3 main.py --import-lnd-dbreader-data /DATA/INPUT/lnd-dbreader-1.json.gz /DATA/INPUT/lnd-dbreader-2.json.gz
+        if(len(sys.argv) == 2):
+            blnstats.importLNDDBReader()
         else:
-            print("Error: Invalid number of arguments")
-            print()
-            print("Usage: python3 main.py --import-lnd-dbreader-data <file_path>")
-            print()
-            print("Examples:")
-            print("    python3 main.py --import-lnd-dbreader-data http://192.168.1.2/rawdata/lnd-dbreader.json.gz")
-            print("    python3 main.py --import-lnd-dbreader-data /DATA/INPUT/lnd-dbreader-20250101-123456.json.gz")
-            print("")
+            blnstats.importLNDDBReader(sys.argv[2:])
 
 
 
@@ -52,6 +50,13 @@ if __name__ == "__main__":
 
 
 
+    elif(sys.argv[1] == "--transform-node-metrics"):
+        # Without arguments the BLNSTATS_NODE_METRICS_RESOLUTION grid is used, e.g.:
+        #     python3 main.py --transform-node-metrics daily
+        blnstats.transformNodeMetrics(sys.argv[2] if len(sys.argv) > 2 else None)
+
+
+
     elif(sys.argv[1] == "--calculate-ln-stats"):
 
         # CalculateNode Metrics
@@ -64,6 +69,7 @@ if __name__ == "__main__":
         # Coefficients
         blnstats.generateCoefficientCharts(subjectsOfAnalysis=["Nodes"])
         blnstats.generateCoefficientCharts(subjectsOfAnalysis=["Entities"])
+        blnstats.generateCoefficientCharts(subjectsOfAnalysis=["Countries"])
         blnstats.generateCoefficientsOnSingleChart()
         blnstats.generateOverlappingCoefficientCharts()
 
@@ -4,5 +4,4 @@
 set -e
 
 # Run the tests using Python's unittest module
-# python3 -m unittest discover -s tests -p "test_*.py"
-python3 -m unittest discover -s tests -p "test_coefficients.py"
\ No newline at end of file
+python3 -m unittest discover -s tests -p "test_*.py"
\ No newline at end of file
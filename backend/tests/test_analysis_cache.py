@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from blnstats.database.analysis_cache import AnalysisCache, estimate_nbytes
+from blnstats.data_types import BlockchainBlockHeightsStructure, CompactVerticesAspectDataStructure
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def test_estimate_nbytes(self):
+        values = np.zeros(1000, dtype=np.int64)
+        self.assertEqual(estimate_nbytes(values), 8000)
+
+        # Arrays shared by several containers are counted once
+        self.assertLess(estimate_nbytes([values, values, {"a": values}]), 9000)
+
+
+
+    def test_evicts_by_size(self):
+        cache = AnalysisCache(maxBytes=20000)
+        cache.begin_run(1)
+        cache.put('Nodes', 'Capacity', [100], np.zeros(1000, dtype=np.int64))
+        cache.put('Nodes', 'ChannelCount', [100], np.zeros(1000, dtype=np.int64))
+        self.assertIsNotNone(cache.get('Nodes', 'Capacity', [100]))
+
+        # The least recently used entry makes room for the new one
+        cache.put('Entities', 'Capacity', [100], np.zeros(1000, dtype=np.int64))
+        self.assertIsNone(cache.get('Nodes', 'ChannelCount', [100]))
+        self.assertIsNotNone(cache.get('Nodes', 'Capacity', [100]))
+        self.assertLessEqual(cache.totalBytes, 20000)
+
+        # Values larger than the whole cache are not cached
+        cache.put('Nodes', 'Capacity', [200], np.zeros(10000, dtype=np.int64))
+        self.assertIsNone(cache.get('Nodes', 'Capacity', [200]))
+
+        # A new data version drops everything
+        cache.begin_run(2)
+        self.assertIsNone(cache.get('Nodes', 'Capacity', [100]))
+        self.assertEqual(cache.totalBytes, 0)
+
+
+
+    def test_saved_structure_stays_within_budget(self):
+        meta = {"type": "VerticesAspectDataStructure", "description": "", "updated": "", "xAxis": "BlockHeight", "yAxisSupplyChain": ["BlockHeight"]}
+        blockHeights = BlockchainBlockHeightsStructure(
+            meta={**meta, "type": "BlockchainBlockHeights", "yAxis": "BlockHeight"},
+            data={"100": {"date": "2020-01-01", "timestamp": 1577836800}}
+        )
+        capacities = CompactVerticesAspectDataStructure(meta={**meta, "yAxis": "List(NodeID,Capacity)"})
+        CompactVerticesAspectDataStructure.fill_from_rows([capacities], blockHeights, [[(100, f"N{i}", i) for i in range(10000)]])
+
+        # The value arrays of the entries are counted
+        size = estimate_nbytes(capacities)
+        self.assertGreater(size, 10000 * (8 + 4))
+
+        cache = AnalysisCache(maxBytes=size + 1000)
+        cache.begin_run(1)
+        cache.put('Nodes', 'Capacity', [100], capacities)
+        self.assertEqual(cache.totalBytes, size)
+
+        # Writing a cached structure out does not grow it
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache.get('Nodes', 'Capacity', [100]).save_to_file(os.path.join(tmpdir, "capacities.json"))
+            cache.get('Nodes', 'Capacity', [100]).save_to_csv(os.path.join(tmpdir, "capacities.csv"))
+        self.assertEqual(estimate_nbytes(cache.get('Nodes', 'Capacity', [100])), size)
+        self.assertLessEqual(sum(estimate_nbytes(value) for value in cache.entries.values()), cache.maxBytes)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
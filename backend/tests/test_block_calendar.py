@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from blnstats.database.block_calendar import BlockCalendar
+
+class TestBlockCalendar(unittest.TestCase):
+
+    def day(self, date):
+        return int(np.datetime64(date, 'D').astype(np.int64))
+
+    def setUp(self):
+        blocks = [
+            # Height, timestamp, date
+            (100, 1000, '2020-03-01'),
+            (101, 900, '2020-02-29'),   # Timestamp earlier than its predecessor
+            (102, 1100, '2020-03-01'),
+            (103, 1200, '2020-03-02'),
+            (104, 1300, '2021-03-01'),
+            (105, 1400, '2021-03-01'),
+        ]
+        heights, timestamps, dates = zip(*blocks)
+        self.calendar = BlockCalendar(heights, timestamps, [self.day(date) for date in dates])
+
+
+
+    def test_first_blocks_of_days(self):
+        dates, heights, timestamps = self.calendar.first_blocks_of_days()
+        self.assertEqual(dates, ['2020-02-29', '2020-03-01', '2020-03-02', '2021-03-01'])
+        self.assertEqual(heights, [101, 100, 103, 104])
+        self.assertEqual(timestamps, [900, 1000, 1200, 1300])
+
+        # Date range is inclusive
+        dates, heights, _ = self.calendar.first_blocks_of_days('2020-03-01', '2020-03-02')
+        self.assertEqual(heights, [100, 103])
+
+        # 2020-03-02 and 2021-03-01 were Mondays
+        _, heights, _ = self.calendar.first_blocks_of_days(weekday=0)
+        self.assertEqual(heights, [103, 104])
+
+
+
+    def test_date_mask(self):
+        dates, heights, _ = self.calendar.first_blocks_of_days(dateMask='20XX-03-01')
+        self.assertEqual(dates, ['2020-03-01', '2021-03-01'])
+        self.assertEqual(heights, [100, 104])
+
+        _, heights, _ = self.calendar.first_blocks_of_days('2021-01-01', '2050-01-01', dateMask='XXXX-XX-01')
+        self.assertEqual(heights, [104])
+
+        with self.assertRaises(ValueError):
+            self.calendar.first_blocks_of_days(dateMask='XX-03-01')
+
+
+
+    def test_height_at_time(self):
+        self.assertIsNone(self.calendar.height_at_time(899))
+        self.assertEqual(self.calendar.height_at_time(900), 101)
+        # Block 100 is newer in time than block 101 but lower in height
+        self.assertEqual(self.calendar.height_at_time(1050), 101)
+        self.assertEqual(self.calendar.height_at_time(1250), 103)
+        self.assertEqual(self.calendar.height_at_time(10**9), 105)
+
+
+
+    def test_empty(self):
+        calendar = BlockCalendar([], [], [])
+        self.assertEqual(calendar.first_blocks_of_days(dateMask='20XX-03-01'), ([], [], []))
+        self.assertIsNone(calendar.height_at_time(1000))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
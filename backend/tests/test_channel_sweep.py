@@ -0,0 +1,103 @@
+import unittest
+import numpy as np
+from blnstats.data_transform.channel_sweep import ChannelSweepEngine
+
+class TestChannelSweepEngine(unittest.TestCase):
+
+    def brute_force(self, channels, blockHeight):
+        capacities, channelCounts = {}, {}
+        for node1, node2, value, funding, spending in channels:
+            if(funding <= blockHeight and spending > blockHeight):
+                for node in (node1, node2):
+                    capacities[node] = capacities.get(node, 0) + value
+                    channelCounts[node] = channelCounts.get(node, 0) + 1
+        return capacities, channelCounts
+
+    def sweep_to_dicts(self, engine, blockHeights):
+        results = {}
+        for blockHeight, nodeIndexes, capacities, channelCounts in engine.sweep(blockHeights):
+            nodeIDs = engine.nodeIDs[nodeIndexes].tolist()
+            results[blockHeight] = (dict(zip(nodeIDs, capacities.tolist())), dict(zip(nodeIDs, channelCounts.tolist())))
+        return results
+
+
+
+    def test_sweep(self):
+        nodeIDs = np.array(["A", "B", "C"])
+        channels = [
+            (0, 1, 100, 10, 20),
+            (1, 2, 50, 15, 10**9),
+            (0, 2, 70, 20, 30),
+            (0, 0, 5, 12, 13),
+            # Never active
+            (1, 2, 999, 25, 25),
+        ]
+        columns = list(zip(*channels))
+        engine = ChannelSweepEngine(nodeIDs, *columns)
+
+        blockHeights = [30, 5, 10, 12, 13, 15, 20, 25, 29]
+        results = self.sweep_to_dicts(engine, blockHeights)
+        self.assertEqual(list(results.keys()), sorted(blockHeights))
+
+        namedChannels = [(nodeIDs[a], nodeIDs[b], value, funding, spending) for a, b, value, funding, spending in channels]
+        for blockHeight in blockHeights:
+            self.assertEqual(results[blockHeight], self.brute_force(namedChannels, blockHeight), f"BlockHeight {blockHeight}")
+
+        # Nodes without active channels are not emitted
+        self.assertEqual(results[5], ({}, {}))
+        self.assertEqual(results[20], ({"A": 70, "B": 50, "C": 120}, {"A": 1, "B": 1, "C": 2}))
+
+
+
+    def test_sweep_random(self):
+        rng = np.random.default_rng(42)
+        channelCount = 500
+        node1 = rng.integers(0, 40, channelCount)
+        node2 = rng.integers(0, 40, channelCount)
+        values = rng.integers(1, 10**7, channelCount)
+        funding = rng.integers(0, 1000, channelCount)
+        spending = funding + rng.integers(-10, 500, channelCount)
+        nodeIDs = np.array([f"N{i:02d}" for i in range(40)])
+        engine = ChannelSweepEngine(nodeIDs, node1, node2, values, funding, spending)
+
+        blockHeights = list(range(0, 1600, 37))
+        results = self.sweep_to_dicts(engine, blockHeights)
+        namedChannels = [(nodeIDs[a], nodeIDs[b], int(v), int(f), int(s)) for a, b, v, f, s in zip(node1, node2, values, funding, spending)]
+        for blockHeight in blockHeights:
+            self.assertEqual(results[blockHeight], self.brute_force(namedChannels, blockHeight))
+
+
+
+    def test_sweep_continues_from_state(self):
+        rng = np.random.default_rng(3)
+        channelCount = 300
+        node1 = rng.integers(0, 25, channelCount)
+        node2 = rng.integers(0, 25, channelCount)
+        values = rng.integers(1, 10**6, channelCount)
+        funding = rng.integers(0, 1000, channelCount)
+        spending = funding + rng.integers(1, 400, channelCount)
+        engine = ChannelSweepEngine(np.arange(25), node1, node2, values, funding, spending)
+
+        blockHeights = list(range(0, 1500, 50))
+        expected = self.sweep_to_dicts(engine, blockHeights)
+
+        # Partition-wise sweeps carrying one state
+        state = engine.new_state()
+        results = {}
+        for start in range(0, 1500, 500):
+            for blockHeight, nodeIndexes, capacities, channelCounts in engine.sweep([h for h in blockHeights if start <= h < start + 500], state):
+                results[blockHeight] = (dict(zip(nodeIndexes.tolist(), capacities.tolist())), dict(zip(nodeIndexes.tolist(), channelCounts.tolist())))
+        self.assertEqual(results, expected)
+
+        # A prefix state handed to a later range gives the same checkpoints
+        prefix = engine.advance(engine.new_state(), 999).copy()
+        for blockHeight, nodeIndexes, capacities, _ in engine.sweep([1000, 1250], prefix):
+            self.assertEqual(dict(zip(nodeIndexes.tolist(), capacities.tolist())), expected[blockHeight][0])
+
+        with self.assertRaises(ValueError):
+            engine.advance(state, 10)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
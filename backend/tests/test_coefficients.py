@@ -1,5 +1,6 @@
 import unittest
 import math
+import numpy as np
 from blnstats.calculations.coefficients import Coefficients
 
 class TestCoefficients(unittest.TestCase):
@@ -225,5 +226,61 @@ class TestCoefficients(unittest.TestCase):
 
 
 
+    def test_calculate_all_coefficients(self):
+        rng = np.random.default_rng(7)
+        datasets = [
+            [10, 10, 10, 10],
+            [0, 0, 0, 100],
+            [5, 15, 25, 55],
+            [42],
+            [0, 0, 0, 0],
+            rng.integers(0, 10**9, 1000).tolist(),
+            rng.integers(1, 50, 37).tolist(),
+        ]
+        for data in datasets:
+            results = self.coefficients.calculate_all_coefficients(data)
+            self.assertEqual(list(results.keys()), Coefficients.COEFFICIENT_TYPES)
+            for coefficient_type in Coefficients.COEFFICIENT_TYPES:
+                expected = self.coefficients.calculate_coefficient(data, coefficient_type)
+                if math.isnan(expected):
+                    # Top 10% share of all-zero data
+                    self.assertTrue(math.isnan(results[coefficient_type]))
+                    continue
+                self.assertAlmostEqual(results[coefficient_type], expected, places=9, msg=f"{coefficient_type} of {data[:5]}")
+
+        # Empty data
+        results = self.coefficients.calculate_all_coefficients([])
+        self.assertEqual(results["Gini"], 0.0)
+        self.assertEqual(results["Nakamoto"], 0)
+
+        # Negative values (should raise ValueError)
+        with self.assertRaises(ValueError):
+            self.coefficients.calculate_all_coefficients([10, -5, 15])
+
+
+
+    def test_calculate_all_coefficients_segmented(self):
+        rng = np.random.default_rng(11)
+        snapshots = [rng.integers(0, 10**9, rng.integers(1, 60)) for _ in range(50)]
+        # Empty, all-zero, single-value and heavily tied snapshots
+        snapshots += [np.array([], dtype=np.int64), np.zeros(5, dtype=np.int64), np.array([42]), rng.integers(0, 3, 40)]
+        snapshots.insert(0, np.array([], dtype=np.int64))
+
+        results = self.coefficients.calculate_all_coefficients_segmented(np.concatenate(snapshots), [len(values) for values in snapshots])
+        for i, values in enumerate(snapshots):
+            expected = self.coefficients.calculate_all_coefficients(values)
+            for coefficient_type in Coefficients.COEFFICIENT_TYPES:
+                if math.isnan(expected[coefficient_type]):
+                    self.assertTrue(math.isnan(results[coefficient_type][i]))
+                    continue
+                self.assertAlmostEqual(results[coefficient_type][i], expected[coefficient_type], places=9, msg=f"{coefficient_type} of snapshot {i}")
+            self.assertEqual(results["InputArraySum"][i], int(np.sum(values)))
+
+        # Negative values (should raise ValueError)
+        with self.assertRaises(ValueError):
+            self.coefficients.calculate_all_coefficients_segmented([10, -5, 15], [3])
+
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+from blnstats.data_types import BlockchainBlockHeightsStructure, CompactVerticesAspectDataStructure
+from blnstats.calculations.coefficients import Coefficients
+
+class TestCompactVerticesAspectDataStructure(unittest.TestCase):
+
+    def setUp(self):
+        meta = {"type": "VerticesAspectDataStructure", "description": "", "updated": "", "xAxis": "BlockHeight", "yAxisSupplyChain": ["BlockHeight"]}
+        self.blockHeights = BlockchainBlockHeightsStructure(
+            meta={**meta, "type": "BlockchainBlockHeights", "yAxis": "BlockHeight"},
+            data={
+                "100": {"date": "2020-01-01", "timestamp": 1577836800},
+                "200": {"date": "2020-02-01", "timestamp": 1580515200},
+                "300": {"date": "2020-03-01", "timestamp": 1583020800},
+            }
+        )
+        self.capacities = CompactVerticesAspectDataStructure(meta={**meta, "yAxis": "List(NodeID,Capacity)"})
+        self.channelCounts = CompactVerticesAspectDataStructure(meta={**meta, "yAxis": "List(NodeID,ChannelCount)"})
+
+        # Rows sorted by block height, split into chunks like cursor.fetchmany(); block height 200 has no rows
+        rowChunks = [
+            [(100, "A", 10, 1), (100, "B", 30, 2)],
+            [(300, "B", 5, 1), (300, "C", 60, 3), (300, "A", 20, 2)],
+        ]
+        CompactVerticesAspectDataStructure.fill_from_rows([self.capacities, self.channelCounts], self.blockHeights, rowChunks)
+
+
+
+    def test_fill_from_rows(self):
+        self.assertEqual(self.capacities.names, ["A", "B", "C"])
+        self.assertIs(self.capacities.names, self.channelCounts.names)
+        self.assertEqual(list(self.capacities.entries.keys()), ["100", "200", "300"])
+
+        entry = self.capacities.entries["300"]
+        self.assertEqual(entry.values.dtype, np.int64)
+        self.assertEqual(entry.name_indexes.tolist(), [1, 2, 0])
+        self.assertEqual(entry.values.tolist(), [5, 60, 20])
+        self.assertEqual(self.channelCounts.entries["300"].values.tolist(), [1, 3, 2])
+        self.assertEqual(len(self.capacities.entries["200"].values), 0)
+
+
+
+    def test_to_structure(self):
+        data = self.capacities.to_json_obj()["data"]
+        self.assertEqual(data["100"]["date"], "2020-01-01")
+        self.assertEqual(data["100"]["vertices"], [{"name": "A", "value": 10}, {"name": "B", "value": 30}])
+        self.assertEqual(data["200"]["vertices"], [])
+        self.assertEqual(data["300"]["vertices"], [{"name": "B", "value": 5}, {"name": "C", "value": 60}, {"name": "A", "value": 20}])
+        self.assertIsNot(self.capacities.to_structure(), self.capacities.to_structure())
+
+
+
+    def test_coefficients_match_structure(self):
+        structure = self.capacities.to_structure()
+        allResults = Coefficients().calculate_all(self.capacities)
+        loopResults = Coefficients().calculate_all(self.capacities, segmented=False)
+        for coefficientType in ["Gini", "HHI", "Nakamoto", "NormalizedShannonEntropy"]:
+            compactResult = Coefficients().calculate_on_vertices_data(self.capacities, coefficientType)
+            self.assertEqual(allResults[coefficientType].meta.type, compactResult.meta.type)
+            for blockHeight in ["100", "300"]:
+                self.assertAlmostEqual(allResults[coefficientType].data[blockHeight].value, compactResult.data[blockHeight].value)
+                self.assertAlmostEqual(loopResults[coefficientType].data[blockHeight].value, compactResult.data[blockHeight].value)
+                self.assertEqual(allResults[coefficientType].data[blockHeight].input_array_sum, compactResult.data[blockHeight].input_array_sum)
+            structureResult = Coefficients().calculate_on_vertices_data(structure, coefficientType)
+            for blockHeight in ["100", "300"]:
+                self.assertAlmostEqual(compactResult.data[blockHeight].value, structureResult.data[blockHeight].value)
+                self.assertEqual(compactResult.data[blockHeight].input_array_sum, structureResult.data[blockHeight].input_array_sum)
+                self.assertEqual(compactResult.data[blockHeight].input_array_length, structureResult.data[blockHeight].input_array_length)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+from blnstats.database.utils import hex_to_binary, binary_to_hex, migrate_hex_column_to_binary
+
+
+class RecordingCursor:
+    '''Returns the queued rows from fetchone() and records the executed statements.'''
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((' '.join(statement.split()), params))
+
+    def fetchone(self):
+        return self.rows.pop(0)
+
+
+class TestDatabaseUtils(unittest.TestCase):
+
+    def test_hex_binary_round_trip(self):
+        node_id = "02" + "ab" * 32
+        self.assertEqual(len(hex_to_binary(node_id)), 33)
+        self.assertEqual(binary_to_hex(hex_to_binary(node_id)), node_id)
+        self.assertEqual(binary_to_hex(bytearray(hex_to_binary("00ff"))), "00ff")
+
+        # Unspent outputs have no spending txid
+        self.assertEqual(hex_to_binary(''), b'')
+        self.assertIsNone(hex_to_binary(None))
+        self.assertIsNone(binary_to_hex(None))
+
+
+    def test_migration_rejects_invalid_hex(self):
+        cursor = RecordingCursor([('char',), (1, 'not-a-node-id')])
+        with self.assertRaises(ValueError):
+            migrate_hex_column_to_binary(cursor, 'Lightning_Channels', 'NodeID1', 'BINARY(33)')
+        self.assertEqual(cursor.statements[1][1], ('^[0-9a-fA-F]{66}$',))
+        self.assertFalse(any(statement.startswith('ALTER') for statement, _ in cursor.statements))
+
+        cursor = RecordingCursor([('char',), (0, None)])
+        migrate_hex_column_to_binary(cursor, 'Blockchain_Transactions', 'SpendingTxID', 'VARBINARY(32)')
+        self.assertEqual(cursor.statements[1][1], ('^([0-9a-fA-F]{2}){0,32}$',))
+        self.assertTrue(cursor.statements[2][0].startswith('ALTER TABLE `Blockchain_Transactions` ADD COLUMN'))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
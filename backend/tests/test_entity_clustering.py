@@ -0,0 +1,106 @@
+import unittest
+from blnstats.data_transform.entity_clustering import UnionFind, normalize_alias_stem, is_linkable_address, cluster_nodes
+
+class TestEntityClustering(unittest.TestCase):
+
+    def test_union_find(self):
+        union_find = UnionFind(6)
+        union_find.union(0, 1)
+        union_find.union(2, 3)
+        union_find.union_all([1, 3, 4])
+        self.assertEqual(union_find.find(0), union_find.find(4))
+        self.assertEqual(union_find.find(2), union_find.find(1))
+        self.assertNotEqual(union_find.find(5), union_find.find(0))
+
+
+
+    def test_normalize_alias_stem(self):
+        self.assertEqual(normalize_alias_stem("LNBIG [Hub-3]"), "lnbighub")
+        self.assertEqual(normalize_alias_stem("lnbig [hub-12]"), "lnbighub")
+        self.assertEqual(normalize_alias_stem("ACINQ"), "acinq")
+
+        # Only the trailing counter is dropped, other digits keep operators apart
+        self.assertEqual(normalize_alias_stem("21bitcoins"), "21bitcoins")
+        self.assertNotEqual(normalize_alias_stem("21bitcoins"), normalize_alias_stem("42bitcoins"))
+        self.assertEqual(normalize_alias_stem("bitrefill 3"), normalize_alias_stem("Bitrefill #12"))
+
+        # Letters and symbols outside a-z are part of the stem
+        self.assertEqual(normalize_alias_stem("闪电网络节点 2"), "闪电网络节点")
+        self.assertEqual(normalize_alias_stem("⚡⚡⚡⚡"), "⚡⚡⚡⚡")
+        self.assertEqual(normalize_alias_stem("ＣＡＦÉ-Node"), "cafénode")
+
+        # Hex, too short and generic aliases are not used for linking
+        self.assertIsNone(normalize_alias_stem("02abcdef0123"))
+        self.assertIsNone(normalize_alias_stem(""))
+        self.assertIsNone(normalize_alias_stem("ab-1"))
+        self.assertIsNone(normalize_alias_stem("umbrel"))
+        self.assertIsNone(normalize_alias_stem("Node 42"))
+
+
+
+    def test_is_linkable_address(self):
+        self.assertTrue(is_linkable_address("88.119.5.5"))
+        self.assertTrue(is_linkable_address("abcdefghijklmnop.onion"))
+        self.assertFalse(is_linkable_address("127.0.0.1"))
+        self.assertFalse(is_linkable_address("192.168.1.10"))
+        self.assertFalse(is_linkable_address("::1"))
+        self.assertFalse(is_linkable_address(""))
+
+
+
+    def test_cluster_nodes(self):
+        node_aliases = {
+            "02a1": ("LNBIG [Hub-1]", 100),
+            "02a2": ("LNBIG [Hub-2]", 200),
+            "02b1": ("ACINQ", 150),
+            "02b2": ("Other", 300),
+            "02c1": ("umbrel", 100),
+            "02c2": ("umbrel", 120),
+            "02d1": ("Solo", 50),
+        }
+        node_addresses = [
+            ("02b1", "3.33.236.230", 9735),
+            ("02b2", "3.33.236.230", 9735),
+            ("02c1", "127.0.0.1", 9735),
+            ("02c2", "127.0.0.1", 9735),
+        ]
+        entities = cluster_nodes(node_aliases, node_addresses)
+
+        # Numbered aliases are clustered under the latest alias
+        self.assertEqual(entities["02a1"], "LNBIG [Hub-2]")
+        self.assertEqual(entities["02a2"], "LNBIG [Hub-2]")
+
+        # Shared public address
+        self.assertEqual(entities["02b1"], "Other")
+        self.assertEqual(entities["02b2"], "Other")
+
+        # Generic aliases and loopback addresses do not link, equal names are told apart
+        self.assertNotEqual(entities["02c1"], entities["02c2"])
+        self.assertTrue(entities["02c1"].startswith("umbrel ["))
+
+        self.assertEqual(entities["02d1"], "Solo")
+
+
+
+    def test_cluster_nodes_overrides(self):
+        node_aliases = {
+            "02a1": ("Alpha", 100),
+            "02a2": ("Beta", 200),
+            "02a3": ("LNBIG 1", 100),
+            "02a4": ("LNBIG 2", 100),
+        }
+        overrides = {
+            "groups": [{"name": "Alpha Beta Inc", "nodes": ["02a1", "02a2", "02ff"]}],
+            "exclude": ["02a4"]
+        }
+        entities = cluster_nodes(node_aliases, [], overrides)
+
+        self.assertEqual(entities["02a1"], "Alpha Beta Inc")
+        self.assertEqual(entities["02a2"], "Alpha Beta Inc")
+        self.assertEqual(entities["02a3"], "LNBIG 1")
+        self.assertEqual(entities["02a4"], "LNBIG 2")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from blnstats.database.entity_timeline import EntityTimeline
+
+class TestEntityTimeline(unittest.TestCase):
+
+    def setUp(self):
+        node_aliases = [
+            # Renamed from "Old" to "New", then back to "Old"
+            ("02a1", "Old", 100, 400),
+            ("02a1", "New", 200, 300),
+            # Single alias
+            ("02b1", "Bob", 150, 500),
+            # Clustered nodes keep their entity name
+            ("02c1", "Hub-1", 100, 500),
+            ("02c2", "Hub-2", 100, 500),
+        ]
+        entities = {
+            "02a1": "Old",
+            "02b1": "Bob",
+            "02c1": "Hub-2",
+            "02c2": "Hub-2",
+            "02d1": "02d1",
+        }
+        self.timeline = EntityTimeline(node_aliases, entities)
+
+    def names(self, node_ids, timestamp):
+        return [str(self.timeline.entity_names[i]) if i >= 0 else None for i in self.timeline.resolve(node_ids, timestamp)]
+
+
+
+    def test_build_segments(self):
+        segments = EntityTimeline.build_segments([(100, 400, "Old"), (200, 300, "New")])
+        self.assertEqual(segments, [(100, "Old"), (200, "New"), (301, "Old")])
+
+        segments = EntityTimeline.build_segments([(100, 200, "A"), (300, 400, "B")])
+        self.assertEqual(segments, [(100, "A"), (300, "B")])
+
+
+
+    def test_resolve(self):
+        node_ids = ["02a1", "02b1", "02c1", "02c2", "02d1", "02ff"]
+        self.assertEqual(self.names(node_ids, 150), ["Old", "Bob", "Hub-2", "Hub-2", "02d1", None])
+        self.assertEqual(self.names(node_ids, 250), ["New", "Bob", "Hub-2", "Hub-2", "02d1", None])
+        self.assertEqual(self.names(node_ids, 350), ["Old", "Bob", "Hub-2", "Hub-2", "02d1", None])
+
+        # Before the first announcement nodes are their own entities, after the last one they keep their last alias
+        self.assertEqual(self.names(["02a1", "02b1"], 10), ["02a1", "02b1"])
+        self.assertEqual(self.names(["02a1", "02b1"], 10**9), ["Old", "Bob"])
+
+        self.assertEqual(self.names([], 150), [])
+
+
+
+    def test_clusters_stay_apart(self):
+        node_aliases = [
+            # 02e1 was called "Bob" before it was renamed, 02e2 is "Bob" now
+            ("02e1", "Bob", 100, 200),
+            ("02e1", "Carol", 201, 500),
+            ("02e2", "Bob", 300, 500),
+            # Equal aliases disambiguated by the clustering
+            ("02f1", "umbrel", 100, 500),
+            ("02f2", "umbrel", 100, 500),
+        ]
+        entities = {"02e1": "Carol", "02e2": "Bob", "02f1": "umbrel [02f1]", "02f2": "umbrel [02f2]"}
+        timeline = EntityTimeline(node_aliases, entities)
+        names = lambda node_ids, timestamp: [str(timeline.entity_names[i]) for i in timeline.resolve(node_ids, timestamp)]
+
+        self.assertEqual(names(["02e1", "02e2"], 150), ["Bob [02e1]", "02e2"])
+        self.assertEqual(names(["02e1", "02e2"], 400), ["Carol", "Bob"])
+        self.assertEqual(names(["02f1", "02f2"], 150), ["umbrel [02f1]", "umbrel [02f2]"])
+
+
+
+    def test_mapping_hash(self):
+        # The mapping only changes when a node is renamed or announced
+        self.assertEqual(self.timeline.mapping_hash(210), self.timeline.mapping_hash(290))
+        self.assertNotEqual(self.timeline.mapping_hash(190), self.timeline.mapping_hash(210))
+        self.assertNotEqual(self.timeline.mapping_hash(140), self.timeline.mapping_hash(160))
+
+        # Nodes not announced yet are their own entities whatever the mapping
+        renamed = EntityTimeline([("02a1", "Old", 100, 400), ("02b1", "Other", 150, 500)], {"02a1": "Old", "02b1": "Other"})
+        self.assertEqual(renamed.mapping_hash(120), EntityTimeline([("02a1", "Old", 100, 400)], {"02a1": "Old"}).mapping_hash(120))
+
+        # Nodes without announcements are not part of the mapping
+        timeline = EntityTimeline([("02a1", "Old", 100, 400)], {"02a1": "Old", "02d1": "02d1"})
+        self.assertEqual(timeline.mapping_hash(150), EntityTimeline([("02a1", "Old", 100, 400)], {"02a1": "Old"}).mapping_hash(150))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
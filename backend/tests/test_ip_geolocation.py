@@ -0,0 +1,87 @@
+import unittest
+import os
+import tempfile
+from blnstats.data_import.ip_geolocation import IPGeolocation
+
+class TestIPGeolocation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        files = {
+            "LT.cidr": "# Lithuania\n78.56.0.0/13\n88.119.0.0/16\n",
+            "DE.cidr": "5.1.48.0/21\n\n85.0.0.0/8\n",
+            "LT.ipv6": "2001:778::/32\n",
+            "DE.ipv6": "2a00:1398::/32\n",
+        }
+        for filename, content in files.items():
+            with open(os.path.join(self.tmpdir.name, filename), "w") as f:
+                f.write(content)
+        IPGeolocation.loadGeoNetworks(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+
+    def test_get_ip_country(self):
+        self.assertEqual(IPGeolocation.getIPCountry("78.56.1.1"), "LT")
+        self.assertEqual(IPGeolocation.getIPCountry("78.63.255.255"), "LT")
+        self.assertEqual(IPGeolocation.getIPCountry("78.64.0.0"), "")
+        self.assertEqual(IPGeolocation.getIPCountry("85.12.34.56"), "DE")
+        self.assertEqual(IPGeolocation.getIPCountry("5.1.55.255"), "DE")
+        self.assertEqual(IPGeolocation.getIPCountry("1.1.1.1"), "")
+
+        # IPv6
+        self.assertEqual(IPGeolocation.getIPCountry("2001:778:0:1::1"), "LT")
+        self.assertEqual(IPGeolocation.getIPCountry("2a00:1398:4:2a03::1"), "DE")
+        self.assertEqual(IPGeolocation.getIPCountry("2001:779::1"), "")
+
+        # Tor and invalid addresses
+        self.assertEqual(IPGeolocation.getIPCountry("abcdefghijklmnop.onion"), "")
+        self.assertEqual(IPGeolocation.getIPCountry(""), "")
+
+
+
+    def test_get_ip_countries_bulk(self):
+        addresses = ["88.119.5.5", "2001:778::5", "x.onion", "85.0.0.1", "9.9.9.9"]
+        self.assertEqual(IPGeolocation.getIPCountries(addresses), ["LT", "LT", "", "DE", ""])
+        self.assertEqual(IPGeolocation.getIPCountries([]), [])
+
+
+
+    def test_nested_ranges(self):
+        # A /24 of another country inside a /8, and a /16 of the same country inside it
+        with open(os.path.join(self.tmpdir.name, "CH.cidr"), "w") as f:
+            f.write("85.1.2.0/24\n")
+        with open(os.path.join(self.tmpdir.name, "DE.cidr"), "a") as f:
+            f.write("85.7.0.0/16\n")
+        IPGeolocation.loadGeoNetworks(self.tmpdir.name)
+
+        self.assertEqual(IPGeolocation.getIPCountries(
+            ["85.0.0.1", "85.1.1.255", "85.1.2.0", "85.1.2.255", "85.1.3.0", "85.7.1.1", "85.255.255.255"]
+        ), ["DE", "DE", "CH", "CH", "DE", "DE", "DE"])
+
+        starts, ends, _ = IPGeolocation.allRanges['IPv4']
+        self.assertTrue((starts[1:] > ends[:-1]).all())
+
+
+
+    def test_compiled_ranges_are_cached(self):
+        cachePath = os.path.join(self.tmpdir.name, IPGeolocation.cacheFileName)
+        self.assertTrue(os.path.exists(cachePath))
+
+        # Reloading from the cache gives the same answers
+        IPGeolocation.allRanges = None
+        IPGeolocation.loadGeoNetworks(self.tmpdir.name)
+        self.assertEqual(IPGeolocation.getIPCountry("78.56.1.1"), "LT")
+
+        # Changing a source file invalidates the cache
+        with open(os.path.join(self.tmpdir.name, "US.cidr"), "w") as f:
+            f.write("9.0.0.0/8\n")
+        IPGeolocation.loadGeoNetworks(self.tmpdir.name)
+        self.assertEqual(IPGeolocation.getIPCountry("9.9.9.9"), "US")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from blnstats.data_import.lnd_dbreader import LNDDBReader, LAST_SEEN_RESOLUTION
+
+class TestLNDDBReaderDelta(unittest.TestCase):
+
+    def snapshot(self, lastSeen, alias="Alpha"):
+        return {
+            'channel_announcements': [{'ShortChannelID': 1, 'NodeID1': "02a1", 'NodeID2': "02b1"}],
+            'node_announcements': [
+                {'NodeID': "02a1", 'Alias': alias, 'FirstSeen': 100, 'LastSeen': lastSeen},
+                {'NodeID': "02b1", 'Alias': "Beta", 'FirstSeen': 100, 'LastSeen': 200},
+            ],
+            'node_addresses': [{'NodeID': "02a1", 'Address': "3.33.236.230", 'Port': 9735, 'FirstSeen': 100, 'LastSeen': lastSeen}]
+        }
+
+
+
+    def test_last_seen_is_tracked_coarsely(self):
+        previous = LNDDBReader.compute_fingerprint(self.snapshot(200))
+
+        # Seen again within the same period: nothing to write
+        data = self.snapshot(300)
+        delta, touched = LNDDBReader.compute_delta(data, LNDDBReader.compute_fingerprint(data), previous)
+        self.assertEqual(len(delta['node_announcements']) + len(delta['node_addresses']), 0)
+        self.assertEqual(touched, set())
+
+        # Seen again in a later period: the records are written, but the node is not touched
+        data = self.snapshot(200 + LAST_SEEN_RESOLUTION)
+        delta, touched = LNDDBReader.compute_delta(data, LNDDBReader.compute_fingerprint(data), previous)
+        self.assertEqual([item['NodeID'] for item in delta['node_announcements']], ["02a1"])
+        self.assertEqual(len(delta['node_addresses']), 1)
+        self.assertEqual(touched, set())
+
+        # A new alias touches the node
+        data = self.snapshot(300, alias="Alpha 2")
+        delta, touched = LNDDBReader.compute_delta(data, LNDDBReader.compute_fingerprint(data), previous)
+        self.assertEqual(touched, {"02a1"})
+        self.assertEqual(len(delta['channel_announcements']), 0)
+
+
+
+    def test_switching_back_to_an_earlier_alias(self):
+        def snapshot(announcements):
+            return {
+                'channel_announcements': [],
+                'node_announcements': [{'NodeID': "02a1", 'Alias': alias, 'FirstSeen': firstSeen, 'LastSeen': lastSeen} for alias, firstSeen, lastSeen in announcements],
+                'node_addresses': []
+            }
+
+        # Alpha -> Beta -> Alpha, all within the same LastSeen period
+        snapshots = [
+            snapshot([("Alpha", 100, 200)]),
+            snapshot([("Alpha", 100, 200), ("Beta", 300, 400)]),
+            snapshot([("Alpha", 100, 500), ("Beta", 300, 400)]),
+        ]
+        fingerprints = [LNDDBReader.compute_fingerprint(data) for data in snapshots]
+        self.assertEqual(fingerprints[1]['node_hashes'].tolist(), fingerprints[2]['node_hashes'].tolist())
+
+        for previous in [0, 1]:
+            delta, touched = LNDDBReader.compute_delta(snapshots[previous + 1], fingerprints[previous + 1], fingerprints[previous])
+            self.assertEqual(touched, {"02a1"})
+            self.assertEqual(len(delta['node_announcements']), 2)
+
+
+
+    def test_fingerprint_per_source(self):
+        path = LNDDBReader.get_fingerprint_path(["/DATA/INPUT/a.json.gz", "https://example.com/b.json.gz"])
+        self.assertEqual(path, LNDDBReader.get_fingerprint_path(["https://example.com/b.json.gz", "/DATA/INPUT/./a.json.gz"]))
+        self.assertNotEqual(path, LNDDBReader.get_fingerprint_path(["/DATA/INPUT/a.json.gz"]))
+        self.assertNotEqual(LNDDBReader.get_fingerprint_path(["/DATA/INPUT/a.json.gz"]), LNDDBReader.get_fingerprint_path(["/DATA/INPUT/b.json.gz"]))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
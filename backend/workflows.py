@@ -96,12 +96,13 @@ def synchronize_blockchain():
 
 # Data Import Tasks
 @task
-def import_lnd_dbreader_data(file_path):
-    """Import LND DBReader data."""
-    print(f"Importing LND DBReader data from: {file_path}")
+def import_lnd_dbreader_data(file_path=None):
+    """Import LND DBReader data (all configured LND-DBReader-Source-N settings if no path given)."""
+    source = file_path if file_path is not None else "configured sources"
+    print(f"Importing LND DBReader data from: {source}")
     blnstats.importLNDDBReader(file_path)
     print("LND DBReader data import completed.")
-    return f"LND DBReader data imported from {file_path}"
+    return f"LND DBReader data imported from {source}"
 
 
 @task
@@ -127,7 +128,7 @@ def import_ln_research_data():
 
 ########################## DATA IMPORT WORKFLOWS ###########################
 @flow
-def lnd_dbreader_import_flow(file_path: str):
+def lnd_dbreader_import_flow(file_path: str = None):
     """Flow to import LND DBReader data."""
     return import_lnd_dbreader_data(file_path)
 
@@ -158,6 +159,7 @@ def lightning_network_statistics_flow():
     # Generate coefficient charts
     nodes_coefficients = generate_coefficient_charts(["Nodes"])
     entities_coefficients = generate_coefficient_charts(["Entities"])
+    countries_coefficients = generate_coefficient_charts(["Countries"])
     single_chart_coefficients = generate_coefficients_on_single_chart()
     overlapping_coefficients = generate_overlapping_coefficient_charts()
     
@@ -175,6 +177,7 @@ def lightning_network_statistics_flow():
         "data_sources": data_sources_result,
         "nodes_coefficients": nodes_coefficients,
         "entities_coefficients": entities_coefficients,
+        "countries_coefficients": countries_coefficients,
         "single_chart_coefficients": single_chart_coefficients,
         "overlapping_coefficients": overlapping_coefficients,
         "csv_export": csv_result,
@@ -190,9 +193,8 @@ def lightning_network_statistics_flow():
 def lnd_dbreader_full_update_flow(file_path=None):
     """Flow to fully update from LND DBReader including import and analysis"""
 
-    # Import LND DBReader data from Vilnius university Kaunas faculty or from provided file path
-    if(file_path == None):
-        file_path = "https://blnstats.knf.vu.lt/rawdata/INPUT/lnd-dbreader-A336EEAB--latest.json.gz"
+    # Import LND DBReader data from provided file path or from all configured sources
+    # (LND-DBReader-Source-N system settings, Vilnius university Kaunas faculty node by default)
     lnd_dbreader_import_result = import_lnd_dbreader_data(file_path)
 
     # Run BLN analysis calculations
@@ -216,8 +218,8 @@ def full_initialization_flow():
     # Import LNResearch data
     ln_research_import_result = import_ln_research_data()
 
-    # Import LND DBReader data from Vilnius university Kaunas faculty
-    lnd_dbreader_import_result = import_lnd_dbreader_data("https://blnstats.knf.vu.lt/rawdata/INPUT/lnd-dbreader-A336EEAB--latest.json.gz")
+    # Import LND DBReader data from all configured sources (Vilnius university Kaunas faculty node by default)
+    lnd_dbreader_import_result = import_lnd_dbreader_data()
 
     # Run BLN analysis calculations
     analysis_results = lightning_network_statistics_flow()